@@ -0,0 +1,97 @@
+import os
+import time
+import random
+import logging
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from hyo2.soundspeed.db.db import ProjectDb
+from hyo2.soundspeed.profile.profilelist import ProfileList
+from hyo2.soundspeed.profile.dicts import Dicts
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+nr_casts = 2000
+nr_samples = 500
+nr_retrieved = 100
+
+projects_folder = os.path.abspath(os.path.curdir)
+project_name = 'benchmark_indexes'
+db_path = os.path.join(projects_folder, '%s.db' % project_name)
+if os.path.exists(db_path):
+    os.remove(db_path)
+
+
+def fresh_casts(idx):
+    ssp = ProfileList()
+    ssp.append()
+    ssp.cur.meta.sensor_type = Dicts.sensor_types['CTD']
+    ssp.cur.meta.probe_type = Dicts.probe_types['SBE']
+    ssp.cur.meta.latitude = 43.0 + 0.001 * idx
+    ssp.cur.meta.longitude = -70.0
+    ssp.cur.meta.utc_time = datetime(2019, 1, 1) + timedelta(minutes=idx)
+    ssp.cur.init_data(nr_samples)
+    ssp.cur.data.depth[:] = np.arange(nr_samples) * 0.5
+    ssp.cur.data.speed[:] = 1500.0 + 0.01 * ssp.cur.data.depth
+    ssp.cur.clone_data_to_proc()
+    ssp.cur.clone_proc_to_sis()
+    return ssp
+
+
+def timing(db):
+    """Time the raw sample queries, so that the comparison only reflects the indexes"""
+    valid = Dicts.flags['valid']
+    extensions = ", ".join(["%d" % Dicts.sources[ext] for ext in ['woa09_ext', 'woa13_ext', 'woa18_ext',
+                                                                   'rtofs_ext', 'gomofs_ext', 'ref_ext']])
+
+    # per-cast surface sound speed, min/max depth and max raw depth (as listed by the v.3 library)
+    start = time.time()
+    for row in db.conn.execute("SELECT pk FROM ssp").fetchall():
+        db.conn.execute("SELECT * FROM proc WHERE ssp_pk=? AND flag=?", (row['pk'], valid)).fetchall()
+        db.conn.execute("SELECT * FROM proc WHERE ssp_pk=? AND flag=? AND source NOT IN (%s)" % extensions,
+                        (row['pk'], valid)).fetchall()
+    list_time = time.time() - start
+
+    start = time.time()
+    for pk in random.Random(0).sample(range(1, nr_casts + 1), nr_retrieved):
+        for table in ["data", "proc", "sis"]:
+            db.conn.execute("SELECT * FROM %s WHERE ssp_pk=?" % table, (pk,)).fetchall()
+    retrieve_time = time.time() - start
+
+    return list_time, retrieve_time
+
+
+# populate the project db, then revert it to version 3 (i.e., without indexes and the later tables)
+db = ProjectDb(projects_folder=projects_folder, project_name=project_name)
+db.add_casts_many([fresh_casts(i) for i in range(nr_casts)])
+with db.conn:
+    for row in db.conn.execute("SELECT name FROM sqlite_master WHERE type='index' AND sql IS NOT NULL").fetchall():
+        db.conn.execute("DROP INDEX %s" % row['name'])
+    for table in ["ssp_summary", "settings", "ssp_samples", "ssp_rtree"]:
+        db.conn.execute("DROP TABLE IF EXISTS %s" % table)
+    db.conn.execute("UPDATE library SET version=3")
+
+v3_list, v3_retrieve = timing(db)
+logger.info("v.3 -> list queries: %.3f s, retrieve %d profiles: %.3f s" % (v3_list, nr_retrieved, v3_retrieve))
+db.disconnect()
+
+# re-opening the project db automatically upgrades it to the current version
+start = time.time()
+db = ProjectDb(projects_folder=projects_folder, project_name=project_name)
+logger.info("upgrade to v.%s: %.3f s" % (db.get_db_version(), time.time() - start))
+
+cur_list, cur_retrieve = timing(db)
+logger.info("v.%s -> list queries: %.3f s, retrieve %d profiles: %.3f s"
+            % (db.get_db_version(), cur_list, nr_retrieved, cur_retrieve))
+logger.info("speed-up -> list queries: %.1fx, retrieve profiles: %.1fx"
+            % (v3_list / cur_list, v3_retrieve / cur_retrieve))
+
+# with the summary table, the list of profiles does not query the samples at all
+start = time.time()
+db.list_profiles()
+logger.info("v.%s -> list profiles: %.3f s" % (db.get_db_version(), time.time() - start))
+db.disconnect()
+
+os.remove(db_path)
@@ -1,8 +1,14 @@
 from abc import ABCMeta, abstractmethod
+from collections import OrderedDict
+import copy
 from datetime import datetime as dt, date
 import logging
+import os
+import time
 from typing import Optional, Union
 
+import numpy as np
+
 from hyo2.soundspeed.base.geodesy import Geodesy
 from hyo2.soundspeed.profile.profilelist import ProfileList
 
@@ -12,6 +18,8 @@ logger = logging.getLogger(__name__)
 class AbstractAtlas(metaclass=ABCMeta):
     """Common abstract atlas"""
 
+    compiled_version = 1  # to be increased when the layout of the compiled grids changes
+
     def __init__(self, data_folder: str, prj: 'hyo2.soundspeed.soundspeed import SoundSpeedLibrary') -> None:
         self.name = self.__class__.__name__
         self.desc = "Abstract atlas"  # a human-readable description
@@ -19,6 +27,13 @@ class AbstractAtlas(metaclass=ABCMeta):
         self.prj = prj
         self.g = Geodesy()
 
+        # LRU cache of the query results, keyed by grid node and time slot
+        self.cache_max_size = 256  # max number of cached results
+        self.cache_max_age = 3600.0  # seconds after which a cached result is discarded
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._cache = OrderedDict()
+
     @abstractmethod
     def is_present(self) -> bool:
         pass
@@ -28,11 +43,191 @@ class AbstractAtlas(metaclass=ABCMeta):
               server_mode: bool = False) -> Optional[ProfileList]:
         pass
 
+    def query_many(self, lats: list, lons: list, datestamps: Optional[list] = None,
+                   server_mode: bool = False) -> list:
+        """Query the atlas for the passed locations and timestamps, returning a list with a ProfileList (or None) each
+
+        The queries are made sorted by date, so that the data of each day are loaded once. When a query fails,
+        None is returned for all the queries with the same date.
+        """
+        if datestamps is None:
+            datestamps = [None] * len(lats)
+        dates = [self.query_date(datestamp) for datestamp in datestamps]
+        results = [None] * len(lats)
+        failed_dates = set()
+        for i in sorted(range(len(lats)), key=lambda j: dates[j]):
+            if dates[i] in failed_dates:
+                continue
+
+            # noinspection PyBroadException
+            try:
+                results[i] = self.query(lat=lats[i], lon=lons[i], datestamp=dates[i], server_mode=server_mode)
+            except Exception as e:
+                failed_dates.add(dates[i])
+                logger.warning("unable to retrieve %s data for %s, %s: %s" % (self.name, dates[i], type(e), e))
+        return results
+
     @abstractmethod
     def download_db(self) -> bool:
         pass
 
+    @staticmethod
+    def query_date(datestamp: Union[date, dt, None]) -> date:
+        """Return the date of the passed query timestamp (today, if None)"""
+        if datestamp is None:
+            datestamp = dt.utcnow()
+        if isinstance(datestamp, dt):
+            datestamp = datestamp.date()
+        if not isinstance(datestamp, date):
+            raise RuntimeError("invalid date passed: %s" % type(datestamp))
+        return datestamp
+
+    @staticmethod
+    def window_indices(lat_idx: int, lon_idx: int, radius: int, nr_lats: int, nr_lons: int) -> tuple:
+        """Return the latitude (within the grid) and longitude (wrapped around the grid) indices around a node"""
+        lat_indices = np.arange(lat_idx - radius, lat_idx + radius + 1)
+        lat_indices = lat_indices[(lat_indices >= 0) & (lat_indices < nr_lats)]
+        lon_indices = np.arange(lon_idx - radius, lon_idx + radius + 1) % nr_lons
+        return lat_indices, lon_indices
+
+    @staticmethod
+    def union_window(windows: list) -> tuple:
+        """Return the contiguous latitude indices and the sorted longitude indices covering all the passed windows"""
+        lat_indices = np.arange(min(window[0][0] for window in windows), max(window[0][-1] for window in windows) + 1)
+        lon_indices = np.unique(np.concatenate([window[1] for window in windows]))
+        return lat_indices, lon_indices
+
+    @staticmethod
+    def sub_window(block: np.ndarray, union: tuple, window: tuple) -> np.ndarray:
+        """Extract the (levels, lats, lons) values of a window from a block read on the union of the windows"""
+        return block[:, window[0] - union[0][0]][:, :, np.searchsorted(union[1], window[1])]
+
+    @staticmethod
+    def read_window(var, time_idx: int, lat_indices: np.ndarray, lon_indices: np.ndarray) -> np.ma.MaskedArray:
+        """Read a (levels, lats, lons) block of a netCDF variable (or of a compiled grid) with a single call
+
+        The latitude indices must be contiguous, the longitude ones (that can wrap around the grid) are read sorted
+        and then re-ordered as passed.
+        """
+        order = np.argsort(lon_indices)
+        if isinstance(var, np.ndarray):  # compiled grid, with NaN as fill value
+            block = np.ma.masked_invalid(var[time_idx][:, lat_indices[0]:lat_indices[-1] + 1, lon_indices[order]])
+        else:
+            block = var[time_idx, :, lat_indices[0]:lat_indices[-1] + 1, lon_indices[order]]
+        return np.ma.asarray(block)[:, :, np.argsort(order)]
+
+    @staticmethod
+    def closest_valid(valid: np.ndarray, dists: np.ndarray) -> tuple:
+        """For each level (row) of the valid mask, return the index of the closest valid node and if it was found
+
+        Among equidistant nodes, the first one is selected.
+        """
+        level_dists = np.where(valid, dists, np.inf)
+        idx = np.argmin(level_dists, axis=1)
+        found = np.isfinite(level_dists[np.arange(idx.size), idx])
+        return idx, found
+
+    # ### compiled grids ###
+
+    @property
+    def compiled_folder(self) -> str:
+        """Folder with the grids compiled as .npy files"""
+        return os.path.join(self.data_folder, "compiled")
+
+    def has_compiled_grids(self) -> bool:
+        """Check that the grids were compiled, with the current layout"""
+        version_path = os.path.join(self.compiled_folder, "version.npy")
+        if not os.path.exists(version_path):
+            return False
+        try:
+            return int(np.load(version_path)) == self.compiled_version
+        except (ValueError, OSError) as e:
+            logger.warning("unable to read the compiled version, %s: %s" % (type(e), e))
+            return False
+
+    def compile_array(self, name: str, values) -> None:
+        """Write the passed (1D or 2D) values as a compiled array"""
+        np.save(os.path.join(self.compiled_folder, "%s.npy" % name), np.asarray(values))
+
+    def compile_variable(self, name: str, var, dtype=np.float32) -> None:
+        """Write a (time, levels, lats, lons) netCDF variable as a compiled grid, one time step after the other
+
+        The masked values are stored as NaN.
+        """
+        grid = np.lib.format.open_memmap(os.path.join(self.compiled_folder, "%s.npy" % name), mode='w+',
+                                         dtype=dtype, shape=var.shape)
+        for i in range(var.shape[0]):
+            grid[i] = np.ma.filled(np.ma.asarray(var[i]).astype(dtype), np.nan)
+        grid.flush()
+        del grid
+
+    def load_compiled(self, name: str) -> np.ndarray:
+        """Memory-map a compiled grid (or array) in read-only mode"""
+        return np.load(os.path.join(self.compiled_folder, "%s.npy" % name), mmap_mode='r')
+
+    def start_compiling(self) -> None:
+        """Remove the version marker of the compiled grids (if any), and create the folder"""
+        version_path = os.path.join(self.compiled_folder, "version.npy")
+        if os.path.exists(version_path):
+            os.remove(version_path)
+        os.makedirs(self.compiled_folder, exist_ok=True)
+
+    def end_compiling(self) -> None:
+        """Write the version marker, as last, so that partially compiled grids are never loaded"""
+        np.save(os.path.join(self.compiled_folder, "version.npy"), np.array(self.compiled_version))
+
+    # ### query cache ###
+
+    def cache_key(self, lat_idx: int, lon_idx: int, time_slot) -> tuple:
+        """Return the key of a query result: the grid node of the position and the time slot (e.g., the month)"""
+        return self.name, int(lat_idx), int(lon_idx), time_slot
+
+    def cache_lookup(self, key: tuple, lat: float, lon: float, datestamp: date) -> tuple:
+        """Look for a cached query result, returning if it was found and a copy of it
+
+        The copy has the metadata of the passed query (position and date), while the samples are the ones of the
+        first query on the same grid node and time slot.
+        """
+        entry = self._cache.get(key)
+        if (entry is None) or (time.time() - entry[0] > self.cache_max_age):
+            self._cache.pop(key, None)
+            self.cache_misses += 1
+            return False, None
+
+        self._cache.move_to_end(key)
+        self.cache_hits += 1
+        if entry[1] is None:
+            return True, None
+
+        if lon > 180.0:  # Go back to negative longitude
+            lon -= 360.0
+        profiles = copy.deepcopy(entry[1])
+        for profile in profiles.l:
+            profile.meta.latitude = lat
+            profile.meta.longitude = lon
+            profile.meta.utc_time = dt(year=datestamp.year, month=datestamp.month, day=datestamp.day)
+            if profile.meta.original_path:
+                profile.meta.original_path = "%s_%s" % (profile.meta.original_path.rsplit("_", 1)[0],
+                                                        datestamp.strftime("%Y%m%d"))
+        return True, profiles
+
+    def cache_store(self, key: tuple, profiles: Optional[ProfileList]) -> Optional[ProfileList]:
+        """Store a copy of the query result (None, for a position without data), and return the passed result"""
+        if self.cache_max_size <= 0:
+            return profiles
+        self._cache[key] = (time.time(), copy.deepcopy(profiles))
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_max_size:
+            self._cache.popitem(last=False)
+        return profiles
+
+    def clear_cache(self) -> None:
+        """Discard all the cached query results"""
+        self._cache.clear()
+
     def __repr__(self) -> str:
         msg = "  <%s>\n" % self.__class__.__name__
         msg += "      <desc: %s>\n" % self.desc
+        msg += "      <cache: %d results, %d hits, %d misses>\n" \
+               % (len(self._cache), self.cache_hits, self.cache_misses)
         return msg
@@ -115,6 +115,10 @@ class Gomofs(AbstractAtlas):
         except TypeError as e:
             logger.critical("while converting location to grid coords, %s" % e)
             return None
+        key = self.cache_key(lat_idx=lat_idx, lon_idx=lon_idx, time_slot=self._last_loaded_day)
+        found, profiles = self.cache_lookup(key, lat=lat, lon=lon, datestamp=datestamp)
+        if found:
+            return profiles
 
         logger.debug("idx > lat: %s, lon: %s" % (lat_idx, lon_idx))
         lat_s_idx = lat_idx - self._search_half_window
@@ -172,6 +176,7 @@ class Gomofs(AbstractAtlas):
         temp_in_situ = np.zeros(self._d.size)
         d = np.zeros(self._d.size)
         sal = np.zeros(self._d.size)
+        filled = np.zeros(self._d.size, dtype=bool)
         num_values = 0
         for i in range(self._d.size):
 
@@ -198,18 +203,19 @@ class Gomofs(AbstractAtlas):
             temp_pot[i] = t_closest
             sal[i] = s_closest
             d[i] = self._d[i]
-
-            # Calculate in-situ temperature
-            p = Oc.d2p(d[i], lat)
-            temp_in_situ[i] = Oc.in_situ_temp(s=sal[i], t=t_closest, p=p, pr=self._ref_p)
-            # logger.info("%02d: %6.1f %6.1f > T/S/Dist: %3.1f %3.1f %3.1f [pot.temp. %3.1f]"
-            #             % (i, d[i], p, temp_in_situ[i], s_closest, d_closest, t_closest))
+            filled[i] = True
+            # logger.info("%02d: %6.1f > T/S/Dist: %3.1f %3.1f %3.1f"
+            #             % (i, d[i], s_closest, d_closest, t_closest))
 
             num_values += 1
 
         if num_values == 0:
             logger.info("no data from lookup!")
-            return None
+            return self.cache_store(key, None)
+
+        # Calculate in-situ temperature for all the levels at once
+        p = Oc.d2p(d[filled], lat)
+        temp_in_situ[filled] = Oc.in_situ_temp(s=sal[filled], t=temp_pot[filled], p=p, pr=self._ref_p)
 
         # ind = np.nanargmin(distances[0])
         # ind2 = np.unravel_index(ind, distances[0].shape)
@@ -240,7 +246,7 @@ class Gomofs(AbstractAtlas):
         profiles = ProfileList()
         profiles.append_profile(ssp)
 
-        return profiles
+        return self.cache_store(key, profiles)
 
     def clear_data(self) -> None:
         """Delete the data and reset the last loaded day"""
@@ -260,6 +266,7 @@ class Gomofs(AbstractAtlas):
         self._has_data_loaded = False  # grids are "loaded" ? (netCDF files are opened)
         self._last_loaded_day = date(1900, 1, 1)  # some silly day in the past
         self._day_idx = None
+        self.clear_cache()
 
     def __repr__(self):
         msg = "%s" % super(Gomofs, self).__repr__()
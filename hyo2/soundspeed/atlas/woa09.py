@@ -19,12 +19,27 @@ logger = logging.getLogger(__name__)
 class Woa09(AbstractAtlas):
     """WOA09 atlas"""
 
+    # name of the grid -> (netCDF file, variable)
+    grid_sources = {
+        't_an_annual': ("temperature_annual_1deg.nc", 't_an'),
+        't_an_monthly': ("temperature_monthly_1deg.nc", 't_an'),
+        't_sd_monthly': ("temperature_monthly_1deg.nc", 't_sd'),
+        't_an_seasonal': ("temperature_seasonal_1deg.nc", 't_an'),
+        't_sd_seasonal': ("temperature_seasonal_1deg.nc", 't_sd'),
+        's_an_monthly': ("salinity_monthly_1deg.nc", 's_an'),
+        's_sd_monthly': ("salinity_monthly_1deg.nc", 's_sd'),
+        's_an_seasonal': ("salinity_seasonal_1deg.nc", 's_an'),
+        's_sd_seasonal': ("salinity_seasonal_1deg.nc", 's_sd'),
+    }
+    axis_names = ['lat', 'lon', 'annual_depth', 'depth', 'monthly_time', 'seasonal_time']
+
     def __init__(self, data_folder: str, prj: 'hyo2.soundspeed.soundspeed import SoundSpeedLibrary') -> None:
         super(Woa09, self).__init__(data_folder=data_folder, prj=prj)
         self.name = self.__class__.__name__
         self.desc = "World Ocean Atlas 2009"
         self.has_data_loaded = False
         self.search_radius = 2  # How far are we willing to look for solutions?
+        self.tile_size = 8  # Size (in grid nodes) of the tiles of positions with a single read in batch queries
 
         self.t_annual = None
         self.t_monthly = None
@@ -33,7 +48,14 @@ class Woa09(AbstractAtlas):
         self.s_seasonal = None
         self.landsea = None
         # self.basin = None
-
+        self.grids = dict()  # netCDF variables or compiled grids, by grid name
+
+        self.lat = None
+        self.lon = None
+        self.annual_depth = None
+        self.depth = None  # seasonal depths
+        self.monthly_time = None
+        self.seasonal_time = None
         self.lat_step = None
         self.lon_step = None
         self.lat_0 = None
@@ -81,56 +103,119 @@ class Woa09(AbstractAtlas):
             data_zip_dst = os.path.abspath(os.path.join(self.data_folder, os.pardir, "woa09.red.zip"))
             ftp.get_file(data_zip_src, data_zip_dst, unzip_it=True)
             ftp.disconnect()
-            return self.is_present()
+            self.clear_cache()
+            if not self.is_present():
+                return False
 
         except Exception as e:
             logger.error('during WOA09 download and unzip: %s' % e)
             return False
 
-    def load_grids(self) -> bool:
-        """Load atlas grids"""
+        if not self.compile_grids():
+            logger.warning("unable to compile the WOA09 grids, the netCDF files will be used")
+        return True
+
+    def compile_grids(self) -> bool:
+        """Write the grids and the land/sea mask used by the queries as .npy files, to be memory-mapped
+
+        The means are stored as float32, the standard deviations as float16, with NaN as fill value.
+        """
+        self.clear_data()
+        self.start_compiling()  # so that the netCDF files are loaded
+        if not self.load_grids():
+            return False
+
         try:
-            self.t_annual = Dataset(os.path.join(self.data_folder, "temperature_annual_1deg.nc"))
-            self.t_monthly = Dataset(os.path.join(self.data_folder, "temperature_monthly_1deg.nc"))
-            self.t_seasonal = Dataset(os.path.join(self.data_folder, "temperature_seasonal_1deg.nc"))
-            self.s_monthly = Dataset(os.path.join(self.data_folder, "salinity_monthly_1deg.nc"))
-            self.s_seasonal = Dataset(os.path.join(self.data_folder, "salinity_seasonal_1deg.nc"))
-            landsea = np.genfromtxt((os.path.join(self.data_folder, "landsea.msk")))
-            self.landsea = landsea.reshape((180, 360))
-            # basin = np.genfromtxt((os.path.join(self.folder, "basin.msk")))
-            # self.basin = basin.reshape((33, 180, 360))
+            for name, var in self.grids.items():
+                self.compile_variable(name, var, dtype=np.float16 if '_sd_' in name else np.float32)
+            for name in self.axis_names:
+                self.compile_array(name, np.ma.getdata(getattr(self, name)))
+            self.compile_array("landsea", self.landsea.astype(np.int16))
+            self.end_compiling()
 
         except Exception as e:
-            logger.error("issue in reading the netCDF data: %s" % e)
+            logger.error("during WOA09 grids compilation, %s: %s" % (type(e), e))
             return False
 
+        finally:
+            self.clear_data()
+
+        logger.info("compiled WOA09 grids in %s" % self.compiled_folder)
+        return True
+
+    def load_grids(self) -> bool:
+        """Load atlas grids, memory-mapping the compiled grids when present (otherwise, using the netCDF files)"""
+        loaded = False
+        if self.has_compiled_grids():
+            try:
+                self.grids = {name: self.load_compiled(name) for name in self.grid_sources}
+                for name in self.axis_names:
+                    setattr(self, name, self.load_compiled(name))
+                self.landsea = self.load_compiled("landsea")
+                loaded = True
+
+            except Exception as e:
+                logger.warning("issue in loading the compiled grids, %s: %s" % (type(e), e))
+
+        if not loaded:
+            try:
+                self.t_annual = Dataset(os.path.join(self.data_folder, "temperature_annual_1deg.nc"))
+                self.t_monthly = Dataset(os.path.join(self.data_folder, "temperature_monthly_1deg.nc"))
+                self.t_seasonal = Dataset(os.path.join(self.data_folder, "temperature_seasonal_1deg.nc"))
+                self.s_monthly = Dataset(os.path.join(self.data_folder, "salinity_monthly_1deg.nc"))
+                self.s_seasonal = Dataset(os.path.join(self.data_folder, "salinity_seasonal_1deg.nc"))
+                landsea = np.genfromtxt((os.path.join(self.data_folder, "landsea.msk")))
+                self.landsea = landsea.reshape((180, 360))
+                # basin = np.genfromtxt((os.path.join(self.folder, "basin.msk")))
+                # self.basin = basin.reshape((33, 180, 360))
+
+            except Exception as e:
+                logger.error("issue in reading the netCDF data: %s" % e)
+                return False
+
+            datasets = {
+                "temperature_annual_1deg.nc": self.t_annual,
+                "temperature_monthly_1deg.nc": self.t_monthly,
+                "temperature_seasonal_1deg.nc": self.t_seasonal,
+                "salinity_monthly_1deg.nc": self.s_monthly,
+                "salinity_seasonal_1deg.nc": self.s_seasonal,
+            }
+            self.grids = {name: datasets[file_name].variables[var_name]
+                          for name, (file_name, var_name) in self.grid_sources.items()}
+            self.lat = self.t_monthly.variables['lat'][:]
+            self.lon = self.t_monthly.variables['lon'][:]
+            self.annual_depth = self.t_annual.variables['depth'][:]
+            self.depth = self.t_seasonal.variables['depth'][:]
+            self.monthly_time = self.t_monthly.variables['time'][:]
+            self.seasonal_time = self.t_seasonal.variables['time'][:]
+
         # What's our grid interval in lat/long
-        self.lat_step = self.t_monthly.variables['lat'][1] - self.t_monthly.variables['lat'][0]
-        self.lat_0 = self.t_monthly.variables['lat'][0]
-        self.lon_step = self.t_monthly.variables['lon'][1] - self.t_monthly.variables['lon'][0]
-        self.lon_0 = self.t_monthly.variables['lon'][0]
+        self.lat_step = self.lat[1] - self.lat[0]
+        self.lat_0 = self.lat[0]
+        self.lon_step = self.lon[1] - self.lon[0]
+        self.lon_0 = self.lon[0]
         # How many depth levels do we have?
-        self.num_levels = self.t_seasonal.variables['depth'].size
+        self.num_levels = self.depth.size
         logger.debug("0(%.3f, %.3f); step(%.3f, %.3f); depths: %s"
                      % (self.lat_0, self.lon_0, self.lat_step, self.lon_step, self.num_levels))
 
+        self.has_data_loaded = True
         return True
 
     def get_depth(self, lat: float, lon: float) -> float:
         """This helper method retrieve the max valid depth based on location"""
         lat_idx, lon_idx = self.grid_coords(lat, lon)
-        t_profile = self.t_annual.variables['t_an'][0, :, lat_idx, lon_idx]
-        index = 0
-        for sample in range(t_profile.size):
-            if t_profile[sample] != 9.96921E36:  # null value
-                index = sample
-        return self.t_annual.variables['depth'][index]
+        t_profile = self.read_window(self.grids['t_an_annual'], 0, np.array([lat_idx]),
+                                     np.array([lon_idx]) % self.lon.size)[:, 0, 0]
+        valid = np.flatnonzero(~np.ma.getmaskarray(t_profile) & np.ma.filled(t_profile != 9.96921E36, False))
+        index = valid[-1] if valid.size else 0
+        return self.annual_depth[index]
 
     def calc_month_idx(self, jday: int) -> None:
         """Calculate the month index based on the julian day"""
         min_value = 367
         i = 0
-        for d in self.t_monthly.variables['time'][:]:
+        for d in self.monthly_time:
             if math.fabs(d - jday) < min_value:
                 min_value = math.fabs(d - jday)
                 self.month_idx = int(i)
@@ -140,7 +225,7 @@ class Woa09(AbstractAtlas):
         """Calculate the season index based on the julian day"""
         min_value = 367
         i = 0
-        for d in self.t_seasonal.variables['time'][:]:
+        for d in self.seasonal_time:
             if math.fabs(d - jday) < min_value:
                 min_value = math.fabs(d - jday)
                 self.season_idx = int(i)
@@ -159,35 +244,88 @@ class Woa09(AbstractAtlas):
 
     def query(self, lat: float, lon: float, datestamp: Union[date, dt, None] = None, server_mode: bool = False):
         """Query WOA09 for passed location and timestamp"""
-        if datestamp is None:
-            datestamp = dt.utcnow()
-        if isinstance(datestamp, dt):
-            datestamp = datestamp.date()
-        if not isinstance(datestamp, date):
-            raise RuntimeError("invalid date passed: %s" % type(datestamp))
-        logger.debug("query: %s @ (%.6f, %.6f)" % (datestamp, lon, lat))
-
-        # check the inputs
-        if (lat is None) or (lon is None) or (datestamp is None):
-            logger.error("invalid query: %s @ (%s, %s)" % (datestamp.strftime("%Y%m%d"), lon, lat))
-            return None
-        if lon < 0:  # Make all longitudes positive
-            lon += 360.0
+        return self.query_many(lats=[lat], lons=[lon], datestamps=[datestamp], server_mode=server_mode)[0]
+
+    def query_many(self, lats: list, lons: list, datestamps: Optional[list] = None,
+                   server_mode: bool = False) -> list:
+        """Query WOA09 for the passed locations and timestamps, returning a list with a ProfileList (or None) each
+
+        The queries are grouped by time slot (month and season) and by tile of grid nodes, so that the window
+        around the positions of each group is read once.
+        """
+        if datestamps is None:
+            datestamps = [None] * len(lats)
+        results = [None] * len(lats)
+        groups = dict()  # (time slot, tile) -> queries to do
+        pending = set()  # cache keys of the queries to do
+        repeated = list()  # queries with the same key of a query to do, to be retrieved from the cache
+
+        for i, (lat, lon, datestamp) in enumerate(zip(lats, lons, datestamps)):
+            datestamp = self.query_date(datestamp)
+
+            # check the inputs
+            if (lat is None) or (lon is None):
+                logger.error("invalid query: %s @ (%s, %s)" % (datestamp.strftime("%Y%m%d"), lon, lat))
+                continue
+            logger.debug("query: %s @ (%.6f, %.6f)" % (datestamp, lon, lat))
+            if lon < 0:  # Make all longitudes positive
+                lon += 360.0
+
+            if not self.has_data_loaded:
+                if not self.load_grids():
+                    return results
+
+            # calculate month and season indices (based on julian day)
+            jd = int(datestamp.strftime("%j"))
+            self.calc_month_idx(jday=jd)
+            self.calc_season_idx(jday=jd)
+            time_slot = (self.month_idx, self.season_idx)
+
+            # Find the nearest grid node
+            lat_base_idx, lon_base_idx = self.grid_coords(lat, lon)
+            key = self.cache_key(lat_idx=lat_base_idx, lon_idx=lon_base_idx, time_slot=time_slot)
+            if key in pending:
+                repeated.append((i, lat, lon, datestamp, key))
+                continue
+            found, profiles = self.cache_lookup(key, lat=lat, lon=lon, datestamp=datestamp)
+            if found:
+                results[i] = profiles
+                continue
+
+            pending.add(key)
+            window = self.window_indices(lat_idx=lat_base_idx, lon_idx=lon_base_idx, radius=self.search_radius,
+                                         nr_lats=self.lat.size, nr_lons=self.lon.size)
+            tile = (time_slot, lat_base_idx // self.tile_size, lon_base_idx // self.tile_size)
+            groups.setdefault(tile, list()).append((i, lat, lon, datestamp, key, window))
+
+        for (time_slot, _, _), queries in groups.items():
+            self.month_idx, self.season_idx = time_slot
+            union = self.union_window([window for *_, window in queries])
+
+            # Read the monthly and seasonal profiles of the union of the windows, once for each variable
+            blocks = dict()
+            for name in ['t_an', 's_an', 't_sd', 's_sd']:
+                monthly = self.read_window(self.grids['%s_monthly' % name], self.month_idx, union[0], union[1])
+                seasonal = self.read_window(self.grids['%s_seasonal' % name], self.season_idx, union[0], union[1])
+                # Overwrite the top of the seasonal profiles with the monthly profiles
+                seasonal[0:monthly.shape[0]] = monthly
+                blocks[name] = np.ma.filled(seasonal, np.nan)  # cheaper to process than a masked array
 
-        if not self.has_data_loaded:
-            if not self.load_grids():
-                return None
+            for i, lat, lon, datestamp, key, window in queries:
+                profiles = self._window_profiles(lat=lat, lon=lon, datestamp=datestamp, window=window,
+                                                 union=union, blocks=blocks)
+                results[i] = self.cache_store(key, profiles)
 
-        # calculate month and season indices (based on julian day)
-        jd = int(datestamp.strftime("%j"))
-        self.calc_month_idx(jday=jd)
-        self.calc_season_idx(jday=jd)
+        for i, lat, lon, datestamp, key in repeated:
+            found, results[i] = self.cache_lookup(key, lat=lat, lon=lon, datestamp=datestamp)
+            if not found:  # e.g., caching disabled
+                results[i] = self.query(lat=lat, lon=lon, datestamp=datestamp, server_mode=server_mode)
 
-        # Find the nearest grid node
-        lat_base_idx, lon_base_idx = self.grid_coords(lat, lon)
-        lat_offsets = range(lat_base_idx - self.search_radius, lat_base_idx + self.search_radius + 1)
-        lon_offsets = range(lon_base_idx - self.search_radius, lon_base_idx + self.search_radius + 1)
+        return results
 
+    def _window_profiles(self, lat: float, lon: float, datestamp: date, window: tuple, union: tuple,
+                         blocks: dict) -> Optional[ProfileList]:
+        """Build the profiles of a position from the values read on the union of the windows"""
         # Search nodes surrounding the requested position to find the closest non-land
         t = np.zeros(self.num_levels)
         s = np.zeros(self.num_levels)
@@ -201,86 +339,49 @@ class Woa09(AbstractAtlas):
         dist_arr[:] = 99999999
         dist_t_sd[:] = 99999999
         dist_s_sd[:] = 99999999
-        min_dist = 999999999
-        num_visited = 0
-        # These keep track of the closest node found, this will also
-        # be used to populate lat/lon of the cast to be delivered
-        lat_idx = -1
-        lon_idx = -1
-        for this_lat_index in lat_offsets:
-            for this_lon_index in lon_offsets:
-
-                if this_lon_index >= self.t_monthly.variables['lon'].size:
-                    this_lon_index -= self.t_monthly.variables['lon'].size
-
-                # Check to see if we're at sea or on land
-                if self.landsea[this_lat_index][this_lon_index] == 1:
-                    # logger.debug("at land: %s, %s" % (this_lat_index, this_lon_index))
-                    continue
-
-                # calculate the distance to the grid node
-                dist = self.g.distance(lon, lat, self.t_monthly.variables['lon'][this_lon_index],
-                                       self.t_monthly.variables['lat'][this_lat_index])
-
-                # Keep track of the closest valid grid node to report the pseudo-cast position
-                if dist < min_dist:
-                    min_dist = dist
-                    lat_idx = this_lat_index
-                    lon_idx = this_lon_index
-
-                # Extract monthly temperature and salinity profile for this location
-                t_profile = self.t_monthly.variables['t_an'][self.month_idx, :, this_lat_index, this_lon_index]
-                s_profile = self.s_monthly.variables['s_an'][self.month_idx, :, this_lat_index, this_lon_index]
-                # Extract seasonal temperature and salinity profile for this location
-                t_profile2 = self.t_seasonal.variables['t_an'][self.season_idx, :, this_lat_index, this_lon_index]
-                s_profile2 = self.s_seasonal.variables['s_an'][self.season_idx, :, this_lat_index, this_lon_index]
-
-                # Now do the same for the standard deviation profiles
-                t_sd_profile = self.t_monthly.variables['t_sd'][self.month_idx, :, this_lat_index, this_lon_index]
-                s_sd_profile = self.s_monthly.variables['s_sd'][self.month_idx, :, this_lat_index, this_lon_index]
-                t_sd_profile2 = self.t_seasonal.variables['t_sd'][self.season_idx, :, this_lat_index, this_lon_index]
-                s_sd_profile2 = self.s_seasonal.variables['s_sd'][self.season_idx, :, this_lat_index, this_lon_index]
 
-                # Overwrite the top of the seasonal profiles with the monthly profiles
-                t_profile2[0:t_profile.size] = t_profile
-                s_profile2[0:s_profile.size] = s_profile
-                t_sd_profile2[0:t_sd_profile.size] = t_sd_profile
-                s_sd_profile2[0:s_sd_profile.size] = s_sd_profile
-
-                # For each element in the profile, only keep those whose distance is closer than values
-                # found from previous iterations (maintain the closest value at each depth level)
-                for i in range(t_profile2.size):
-                    if (dist < dist_arr[i]) and (t_profile2[i] < 50.0) and \
-                            (s_profile2[i] < 500.0) and (s_profile2[i] >= 0):
-                        t[i] = t_profile2[i]
-                        s[i] = s_profile2[i]
-                        dist_arr[i] = dist
-
-                # Now do the same thing for the temperature standard deviations
-                for i in range(t_sd_profile2.size):
-                    if (dist < dist_t_sd[i]) and (t_sd_profile2[i] < 50.0) and (t_sd_profile2[i] > -2):
-                        t_min[i] = t_profile2[i] - t_sd_profile2[i]
-                        if t_min[i] < -2.0:  # can't have overly cold water
-                            t_min[i] = -2.0
-                        t_max[i] = t_profile2[i] + t_sd_profile2[i]
-                        dist_t_sd[i] = dist
-
-                # Now do the same thing for the salinity standard deviations
-                for i in range(s_sd_profile2.size):
-                    if (dist < dist_s_sd[i]) and (s_sd_profile2[i] < 500.0) and (s_sd_profile2[i] >= 0):
-                        s_min[i] = s_profile2[i] - s_sd_profile2[i]
-                        if s_min[i] < 0:  # Can't have a negative salinity
-                            s_min[i] = 0
-                        s_max[i] = s_profile2[i] + s_sd_profile2[i]
-                        dist_s_sd[i] = dist
-
-                num_visited += 1
-
-        # logger.debug("visited: %s" % num_visited)
-
-        if (lat_idx == -1) and (lon_idx == -1):
+        # The window nodes (row by row), with the distance to the sea ones
+        lat_indices, lon_indices = window
+        lat_nodes, lon_nodes = np.meshgrid(lat_indices, lon_indices, indexing='ij')
+        lat_nodes = lat_nodes.ravel()
+        lon_nodes = lon_nodes.ravel()
+        at_sea = self.landsea[lat_nodes, lon_nodes] != 1
+        if not at_sea.any():
             logger.info("possible request on land")
             return None
+        dists = np.full(at_sea.size, np.inf)
+        dists[at_sea] = self.g.distance(np.full(at_sea.sum(), lon), np.full(at_sea.sum(), lat),
+                                        self.lon[lon_nodes[at_sea]], self.lat[lat_nodes[at_sea]])
+
+        # Only keep the values of the window, as (levels, nodes)
+        values = dict()
+        for name, block in blocks.items():
+            values[name] = self.sub_window(block, union=union, window=window).reshape(block.shape[0], -1)
+        t_an, s_an, t_sd, s_sd = values['t_an'], values['s_an'], values['t_sd'], values['s_sd']
+        levels = np.arange(t_an.shape[0])
+
+        # For each level, only keep the values of the closest node with valid values
+        valid = np.ma.filled((t_an < 50.0) & (s_an < 500.0) & (s_an >= 0), False)
+        idx, found = self.closest_valid(valid=valid, dists=dists)
+        t[levels[found]] = t_an[levels, idx][found]
+        s[levels[found]] = s_an[levels, idx][found]
+        dist_arr[levels[found]] = dists[idx][found]
+
+        # Now do the same thing for the temperature standard deviations
+        valid = np.ma.filled((t_sd < 50.0) & (t_sd > -2), False)
+        idx, found = self.closest_valid(valid=valid, dists=dists)
+        t_min_found = np.ma.filled(t_an[levels, idx] - t_sd[levels, idx], np.nan)[found]
+        t_min[levels[found]] = np.where(t_min_found < -2.0, -2.0, t_min_found)  # can't have overly cold water
+        t_max[levels[found]] = np.ma.filled(t_an[levels, idx] + t_sd[levels, idx], np.nan)[found]
+        dist_t_sd[levels[found]] = dists[idx][found]
+
+        # Now do the same thing for the salinity standard deviations
+        valid = np.ma.filled((s_sd < 500.0) & (s_sd >= 0), False)
+        idx, found = self.closest_valid(valid=valid, dists=dists)
+        s_min_found = np.ma.filled(s_an[levels, idx] - s_sd[levels, idx], np.nan)[found]
+        s_min[levels[found]] = np.where(s_min_found < 0, 0, s_min_found)  # Can't have a negative salinity
+        s_max[levels[found]] = np.ma.filled(s_an[levels, idx] + s_sd[levels, idx], np.nan)[found]
+        dist_s_sd[levels[found]] = dists[idx][found]
 
         valid = dist_arr != 99999999
         num_values = t[valid].size
@@ -297,7 +398,7 @@ class Woa09(AbstractAtlas):
         ssp.meta.utc_time = dt(year=datestamp.year, month=datestamp.month, day=datestamp.day)
         ssp.meta.original_path = "WOA09_%s" % datestamp.strftime("%Y%m%d")
         ssp.init_data(num_values)
-        ssp.data.depth = self.t_seasonal.variables['depth'][0:num_values]
+        ssp.data.depth = self.depth[0:num_values]
         ssp.data.temp = t[valid]
         ssp.data.sal = s[valid]
         ssp.calc_data_speed()
@@ -321,7 +422,7 @@ class Woa09(AbstractAtlas):
         ssp_min.meta.utc_time = dt(year=datestamp.year, month=datestamp.month, day=datestamp.day)
         if num_values > 0:
             ssp_min.init_data(num_values)
-            ssp_min.data.depth = self.t_seasonal.variables['depth'][0:num_values]
+            ssp_min.data.depth = self.depth[0:num_values]
             ssp_min.data.temp = t_min[valid][0:num_values]
             ssp_min.data.sal = s_min[valid][0:num_values]
             ssp_min.calc_data_speed()
@@ -339,7 +440,7 @@ class Woa09(AbstractAtlas):
         ssp_max.meta.utc_time = dt(year=datestamp.year, month=datestamp.month, day=datestamp.day)
         if num_values > 0:
             ssp_max.init_data(num_values)
-            ssp_max.data.depth = self.t_seasonal.variables['depth'][0:num_values].astype(np.float64)
+            ssp_max.data.depth = self.depth[0:num_values].astype(np.float64)
             ssp_max.data.temp = t_max[valid][0:num_values]
             ssp_max.data.sal = s_max[valid][0:num_values]
             ssp_max.calc_data_speed()
@@ -379,6 +480,13 @@ class Woa09(AbstractAtlas):
             self.s_seasonal = None
             self.landsea = None
             # self.basin = None
+            self.grids = dict()
+            self.lat = None
+            self.lon = None
+            self.annual_depth = None
+            self.depth = None
+            self.monthly_time = None
+            self.seasonal_time = None
             self.lat_step = None
             self.lon_step = None
             self.lat_0 = None
@@ -387,6 +495,7 @@ class Woa09(AbstractAtlas):
             self.month_idx = 0
             self.season_idx = 0
         self.has_data_loaded = False
+        self.clear_cache()
 
     # --- repr
 
@@ -1,5 +1,4 @@
 import os
-import csv
 import numpy as np
 from netCDF4 import Dataset
 import logging
@@ -25,9 +24,12 @@ class Woa13(AbstractAtlas):
         self.desc = "World Ocean Atlas 2013 v2"
         self.has_data_loaded = False
         self.search_radius = 2  # How far are we willing to look for solutions?
+        self.tile_size = 8  # Size (in grid nodes) of the tiles of positions with a single read in batch queries
 
         self.t = list()
         self.s = list()
+        self.t_grids = list()  # netCDF variables or compiled grids, one dict by temperature file
+        self.s_grids = list()  # netCDF variables or compiled grids, one dict by salinity file
         self.landsea = None
 
         self.lat = None
@@ -85,56 +87,111 @@ class Woa13(AbstractAtlas):
             data_zip_dst = os.path.abspath(os.path.join(self.data_folder, os.pardir, "woa13_sal.red.zip"))
             ftp.get_file(data_zip_src, data_zip_dst, unzip_it=True)
             ftp.disconnect()
-
-            return self.is_present()
+            self.clear_cache()
+            if not self.is_present():
+                return False
 
         except Exception as e:
             logger.error('during WOA13 download and unzip: %s' % e)
             return False
 
-    def load_grids(self) -> bool:
-        """Load atlas grids"""
+        if not self.compile_grids():
+            logger.warning("unable to compile the WOA13 grids, the netCDF files will be used")
+        return True
+
+    def compile_grids(self) -> bool:
+        """Write the grids and the land/sea mask used by the queries as .npy files, to be memory-mapped
+
+        The means are stored as float32, the standard deviations as float16, with NaN as fill value.
+        """
+        self.clear_data()
+        self.start_compiling()  # so that the netCDF files are loaded
+        if not self.load_grids():
+            return False
+
         try:
-            for i in range(17):
-                t_path = os.path.join(self.data_folder, "temp", "woa13_decav_t%02d_04v2.nc" % i)
-                self.t.append(Dataset(t_path))
-            for i in range(1, 17):
-                s_path = os.path.join(self.data_folder, "sal", "woa13_decav_s%02d_04v2.nc" % i)
-                self.s.append(Dataset(s_path))
-
-            self.lat = self.t[0].variables['lat'][:]
-            self.lon = self.t[0].variables['lon'][:]
-            # self.lon = np.hstack((lon[lon.size // 2:], lon[:lon.size // 2]))
-            csv_iter = csv.reader(open((os.path.join(self.data_folder, "landsea_04.msk"))))
-            next(csv_iter)  # skip firs header row
-            next(csv_iter)  # skip another header row
-            landsea = np.asarray([float(data[2]) for data in csv_iter])
-            # print(landsea.shape, lons.size, lats.size)
-            landsea = landsea.reshape((self.lat.size, self.lon.size))
-            splitted = np.hsplit(landsea, 2)
-            self.landsea = np.hstack((splitted[1], splitted[0]))
-            # from matplotlib import pyplot
-            # pyplot.imshow(self.landsea, origin='lower')
-            # pyplot.show()
-
-            # How many depth levels do we have?
-            self.num_levels = self.t[0].variables['depth'].size
+            for prefix, first, grids in [('t', 0, self.t_grids), ('s', 1, self.s_grids)]:
+                for i, variables in enumerate(grids):
+                    for name in ['%s_an' % prefix, '%s_sd' % prefix]:
+                        self.compile_variable("%s%02d_%s" % (prefix, i + first, name), variables[name],
+                                              dtype=np.float16 if name.endswith('_sd') else np.float32)
+                    self.compile_array("%s%02d_depth" % (prefix, i + first), np.ma.getdata(variables['depth'][:]))
+            self.compile_array("lat", np.ma.getdata(self.lat))
+            self.compile_array("lon", np.ma.getdata(self.lon))
+            self.compile_array("landsea", self.landsea.astype(np.int16))
+            self.end_compiling()
 
         except Exception as e:
-            logger.error("issue in reading the netCDF data: %s" % e)
+            logger.error("during WOA13 grids compilation, %s: %s" % (type(e), e))
             return False
 
+        finally:
+            self.clear_data()
+
+        logger.info("compiled WOA13 grids in %s" % self.compiled_folder)
+        return True
+
+    def load_grids(self) -> bool:
+        """Load atlas grids, memory-mapping the compiled grids when present (otherwise, using the netCDF files)"""
+        loaded = False
+        if self.has_compiled_grids():
+            try:
+                for prefix, files, grids in [('t', range(17), self.t_grids), ('s', range(1, 17), self.s_grids)]:
+                    for i in files:
+                        grids.append({name: self.load_compiled("%s%02d_%s" % (prefix, i, name))
+                                      for name in ['%s_an' % prefix, '%s_sd' % prefix, 'depth']})
+                self.lat = self.load_compiled("lat")
+                self.lon = self.load_compiled("lon")
+                self.landsea = self.load_compiled("landsea")
+                loaded = True
+
+            except Exception as e:
+                logger.warning("issue in loading the compiled grids, %s: %s" % (type(e), e))
+                self.t_grids = list()
+                self.s_grids = list()
+
+        if not loaded:
+            try:
+                for i in range(17):
+                    t_path = os.path.join(self.data_folder, "temp", "woa13_decav_t%02d_04v2.nc" % i)
+                    self.t.append(Dataset(t_path))
+                for i in range(1, 17):
+                    s_path = os.path.join(self.data_folder, "sal", "woa13_decav_s%02d_04v2.nc" % i)
+                    self.s.append(Dataset(s_path))
+                self.t_grids = [ds.variables for ds in self.t]
+                self.s_grids = [ds.variables for ds in self.s]
+
+                self.lat = self.t[0].variables['lat'][:]
+                self.lon = self.t[0].variables['lon'][:]
+                # self.lon = np.hstack((lon[lon.size // 2:], lon[:lon.size // 2]))
+                with open(os.path.join(self.data_folder, "landsea_04.msk")) as fid:
+                    # skip the two header rows, then only read the third column (the land/sea flag)
+                    landsea = np.loadtxt(fid, delimiter=',', skiprows=2, usecols=(2,))
+                # print(landsea.shape, lons.size, lats.size)
+                landsea = landsea.reshape((self.lat.size, self.lon.size))
+                splitted = np.hsplit(landsea, 2)
+                self.landsea = np.hstack((splitted[1], splitted[0]))
+                # from matplotlib import pyplot
+                # pyplot.imshow(self.landsea, origin='lower')
+                # pyplot.show()
+
+            except Exception as e:
+                logger.error("issue in reading the netCDF data: %s" % e)
+                return False
+
+        # How many depth levels do we have?
+        self.num_levels = self.t_grids[0]['depth'].size
+
+        self.has_data_loaded = True
         return True
 
     def get_depth(self, lat: float, lon: float) -> float:
         """This helper method retrieve the max valid depth based on location"""
         lat_idx, lon_idx = self.grid_coords(lat, lon)
-        t_profile = self.t[0].variables['t_an'][0, :, lat_idx, lon_idx]
-        index = 0
-        for sample in range(t_profile.size):
-            if t_profile[sample] != 9.96921E36:  # null value
-                index = sample
-        return self.t[0].variables['depth'][index]
+        t_profile = self.read_window(self.t_grids[0]['t_an'], 0, np.array([lat_idx]), np.array([lon_idx]))[:, 0, 0]
+        valid = np.flatnonzero(~np.ma.getmaskarray(t_profile) & np.ma.filled(t_profile != 9.96921E36, False))
+        index = valid[-1] if valid.size else 0
+        return self.t_grids[0]['depth'][index]
 
     def calc_indices(self, month: int) -> None:
         """Calculate the month index based on the julian day"""
@@ -164,31 +221,85 @@ class Woa13(AbstractAtlas):
 
     def query(self, lat: float, lon: float, datestamp: Union[date, dt, None] = None, server_mode: bool = False):
         """Query WOA13 for passed location and timestamp"""
-        if datestamp is None:
-            datestamp = dt.utcnow()
-        if isinstance(datestamp, dt):
-            datestamp = datestamp.date()
-        if not isinstance(datestamp, date):
-            raise RuntimeError("invalid date passed: %s" % type(datestamp))
-        logger.debug("query: %s @ (%.6f, %.6f)" % (datestamp, lon, lat))
-
-        # check the inputs
-        if (lat is None) or (lon is None) or (datestamp is None):
-            logger.error("invalid query: %s @ (%s, %s)" % (datestamp.strftime("%Y%m%d"), lon, lat))
-            return None
+        return self.query_many(lats=[lat], lons=[lon], datestamps=[datestamp], server_mode=server_mode)[0]
+
+    def query_many(self, lats: list, lons: list, datestamps: Optional[list] = None,
+                   server_mode: bool = False) -> list:
+        """Query WOA13 for the passed locations and timestamps, returning a list with a ProfileList (or None) each
+
+        The queries are grouped by time slot (month and season) and by tile of grid nodes, so that the window
+        around the positions of each group is read once.
+        """
+        if datestamps is None:
+            datestamps = [None] * len(lats)
+        results = [None] * len(lats)
+        groups = dict()  # (time slot, tile) -> queries to do
+        pending = set()  # cache keys of the queries to do
+        repeated = list()  # queries with the same key of a query to do, to be retrieved from the cache
+
+        for i, (lat, lon, datestamp) in enumerate(zip(lats, lons, datestamps)):
+            datestamp = self.query_date(datestamp)
+
+            # check the inputs
+            if (lat is None) or (lon is None):
+                logger.error("invalid query: %s @ (%s, %s)" % (datestamp.strftime("%Y%m%d"), lon, lat))
+                continue
+            logger.debug("query: %s @ (%.6f, %.6f)" % (datestamp, lon, lat))
+
+            if not self.has_data_loaded:
+                if not self.load_grids():
+                    logger.error("No data")
+                    return results
+
+            self.calc_indices(month=datestamp.month)
+            time_slot = (self.month_idx, self.season_idx)
+
+            # Find the nearest grid node
+            lat_base_idx, lon_base_idx = self.grid_coords(lat=lat, lon=lon)
+            key = self.cache_key(lat_idx=lat_base_idx, lon_idx=lon_base_idx, time_slot=time_slot)
+            if key in pending:
+                repeated.append((i, lat, lon, datestamp, key))
+                continue
+            found, profiles = self.cache_lookup(key, lat=lat, lon=lon, datestamp=datestamp)
+            if found:
+                results[i] = profiles
+                continue
+
+            pending.add(key)
+            window = self.window_indices(lat_idx=lat_base_idx, lon_idx=lon_base_idx, radius=self.search_radius,
+                                         nr_lats=self.lat.size, nr_lons=self.lon.size)
+            tile = (time_slot, lat_base_idx // self.tile_size, lon_base_idx // self.tile_size)
+            groups.setdefault(tile, list()).append((i, lat, lon, datestamp, key, window))
+
+        for (time_slot, _, _), queries in groups.items():
+            self.month_idx, self.season_idx = time_slot
+            union = self.union_window([window for *_, window in queries])
+
+            # Read the monthly and seasonal profiles of the union of the windows, once for each variable
+            blocks = dict()
+            for name, grids in [('t_an', self.t_grids), ('s_an', self.s_grids),
+                                ('t_sd', self.t_grids), ('s_sd', self.s_grids)]:
+                monthly = self.read_window(grids[self.month_idx][name], 0, union[0], union[1])
+                seasonal = self.read_window(grids[self.season_idx][name], 0, union[0], union[1])
+                # Overwrite the top of the seasonal profiles with the monthly profiles
+                seasonal[0:monthly.shape[0]] = monthly
+                blocks[name] = np.ma.filled(seasonal, np.nan)  # cheaper to process than a masked array
 
-        if not self.has_data_loaded:
-            if not self.load_grids():
-                logger.error("No data")
-                return None
+            for i, lat, lon, datestamp, key, window in queries:
+                profiles = self._window_profiles(lat=lat, lon=lon, datestamp=datestamp, window=window,
+                                                 union=union, blocks=blocks)
+                results[i] = self.cache_store(key, profiles)
 
-        self.calc_indices(month=datestamp.month)
+        for i, lat, lon, datestamp, key in repeated:
+            found, results[i] = self.cache_lookup(key, lat=lat, lon=lon, datestamp=datestamp)
+            if not found:  # e.g., caching disabled
+                results[i] = self.query(lat=lat, lon=lon, datestamp=datestamp, server_mode=server_mode)
 
-        # Find the nearest grid node
-        lat_base_idx, lon_base_idx = self.grid_coords(lat=lat, lon=lon)
-        lat_offsets = range(lat_base_idx - self.search_radius, lat_base_idx + self.search_radius + 1)
-        lon_offsets = range(lon_base_idx - self.search_radius, lon_base_idx + self.search_radius + 1)
+        return results
 
+    def _window_profiles(self, lat: float, lon: float, datestamp: date, window: tuple, union: tuple,
+                         blocks: dict) -> Optional[ProfileList]:
+        """Build the profiles of a position from the values read on the union of the windows"""
         # Search nodes surrounding the requested position to find the closest non-land
         t = np.zeros(self.num_levels)
         s = np.zeros(self.num_levels)
@@ -202,97 +313,49 @@ class Woa13(AbstractAtlas):
         dist_arr[:] = 99999999
         dist_t_sd[:] = 99999999
         dist_s_sd[:] = 99999999
-        min_dist = 999999999
-        num_visited = 0
-        # These keep track of the closest node found, this will also
-        # be used to populate lat/lon of the cast to be delivered
-        lat_idx = -1
-        lon_idx = -1
-        for this_lat_index in lat_offsets:
-            for this_lon_index in lon_offsets:
-
-                if this_lon_index >= self.lon.size:
-                    # logger.debug("[%s] >= [%s]" % (this_lon_index, self.t[self.month_idx].variables['lon'].size))
-                    this_lon_index -= self.lat.size
-
-                # Check to see if we're at sea or on land
-                if self.landsea[this_lat_index][this_lon_index] == 1:
-                    # logger.debug("at land: %s, %s" % (this_lat_index, this_lon_index))
-                    # from matplotlib import pyplot
-                    # pyplot.imshow(self.landsea, origin='lower')
-                    # pyplot.scatter([this_lon_index], [this_lat_index], c='r', s=40)
-                    # pyplot.show()
-
-                    continue
-
-                # calculate the distance to the grid node
-                dist = self.g.distance(lon, lat, self.lon[this_lon_index], self.lat[this_lat_index])
-                # logger.debug("[%s %s] [%s %s]" % (self.lon.shape, self.lat.shape, this_lon_index, this_lat_index))
-                # logger.debug("dist: %s" % dist)
-
-                # Keep track of the closest valid grid node to report the pseudo-cast position
-                if dist < min_dist:
-                    min_dist = dist
-                    lat_idx = this_lat_index
-                    lon_idx = this_lon_index
-
-                # Extract monthly temperature and salinity profile for this location
-                t_profile = self.t[self.month_idx].variables['t_an'][0, :, this_lat_index, this_lon_index]
-                s_profile = self.s[self.month_idx].variables['s_an'][0, :, this_lat_index, this_lon_index]
-                # Extract seasonal temperature and salinity profile for this location
-                t_profile2 = self.t[self.season_idx].variables['t_an'][0, :, this_lat_index, this_lon_index]
-                s_profile2 = self.s[self.season_idx].variables['s_an'][0, :, this_lat_index, this_lon_index]
-
-                # Now do the same for the standard deviation profiles
-                t_sd_profile = self.t[self.month_idx].variables['t_sd'][0, :, this_lat_index, this_lon_index]
-                s_sd_profile = self.s[self.month_idx].variables['s_sd'][0, :, this_lat_index, this_lon_index]
-                t_sd_profile2 = self.t[self.season_idx].variables['t_sd'][0, :, this_lat_index, this_lon_index]
-                s_sd_profile2 = self.s[self.season_idx].variables['s_sd'][0, :, this_lat_index, this_lon_index]
 
-                # Overwrite the top of the seasonal profiles with the monthly profiles
-                t_profile2[0:t_profile.size] = t_profile
-                s_profile2[0:s_profile.size] = s_profile
-                t_sd_profile2[0:t_sd_profile.size] = t_sd_profile
-                s_sd_profile2[0:s_sd_profile.size] = s_sd_profile
-
-                # For each element in the profile, only keep those whose distance is closer than values
-                # found from previous iterations (maintain the closest value at each depth level)
-                # logger.debug("profile sz: %d\n%s" % (t_profile2.size, t_profile2))
-                for i in range(t_profile2.size):
-                    if dist >= dist_arr[i]:
-                        continue
-                    if (t_profile2[i] < 50.0) and (s_profile2[i] < 500.0) and (s_profile2[i] >= 0):
-                        t[i] = t_profile2[i]
-                        s[i] = s_profile2[i]
-                        dist_arr[i] = dist
-
-                # Now do the same thing for the temperature standard deviations
-                for i in range(t_sd_profile2.size):
-                    if dist >= dist_t_sd[i]:
-                        continue
-                    if (t_sd_profile2[i] < 50.0) and (t_sd_profile2[i] > -2):
-                        t_min[i] = t_profile2[i] - t_sd_profile2[i]
-                        if t_min[i] < -2.0:  # can't have overly cold water
-                            t_min[i] = -2.0
-                        t_max[i] = t_profile2[i] + t_sd_profile2[i]
-                        dist_t_sd[i] = dist
-
-                # Now do the same thing for the salinity standard deviations
-                for i in range(s_sd_profile2.size):
-                    if dist >= dist_s_sd[i]:
-                        continue
-                    if (s_sd_profile2[i] < 500.0) and (s_sd_profile2[i] >= 0):
-                        s_min[i] = s_profile2[i] - s_sd_profile2[i]
-                        if s_min[i] < 0:  # Can't have a negative salinity
-                            s_min[i] = 0
-                        s_max[i] = s_profile2[i] + s_sd_profile2[i]
-                        dist_s_sd[i] = dist
-
-                num_visited += 1
-
-        if (lat_idx == -1) and (lon_idx == -1):
+        # The window nodes (row by row), with the distance to the sea ones
+        lat_indices, lon_indices = window
+        lat_nodes, lon_nodes = np.meshgrid(lat_indices, lon_indices, indexing='ij')
+        lat_nodes = lat_nodes.ravel()
+        lon_nodes = lon_nodes.ravel()
+        at_sea = self.landsea[lat_nodes, lon_nodes] != 1
+        if not at_sea.any():
             logger.info("possible request on land")
             return None
+        dists = np.full(at_sea.size, np.inf)
+        dists[at_sea] = self.g.distance(np.full(at_sea.sum(), lon), np.full(at_sea.sum(), lat),
+                                        self.lon[lon_nodes[at_sea]], self.lat[lat_nodes[at_sea]])
+
+        # Only keep the values of the window, as (levels, nodes)
+        values = dict()
+        for name, block in blocks.items():
+            values[name] = self.sub_window(block, union=union, window=window).reshape(block.shape[0], -1)
+        t_an, s_an, t_sd, s_sd = values['t_an'], values['s_an'], values['t_sd'], values['s_sd']
+        levels = np.arange(t_an.shape[0])
+
+        # For each level, only keep the values of the closest node with valid values
+        valid = np.ma.filled((t_an < 50.0) & (s_an < 500.0) & (s_an >= 0), False)
+        idx, found = self.closest_valid(valid=valid, dists=dists)
+        t[levels[found]] = t_an[levels, idx][found]
+        s[levels[found]] = s_an[levels, idx][found]
+        dist_arr[levels[found]] = dists[idx][found]
+
+        # Now do the same thing for the temperature standard deviations
+        valid = np.ma.filled((t_sd < 50.0) & (t_sd > -2), False)
+        idx, found = self.closest_valid(valid=valid, dists=dists)
+        t_min_found = np.ma.filled(t_an[levels, idx] - t_sd[levels, idx], np.nan)[found]
+        t_min[levels[found]] = np.where(t_min_found < -2.0, -2.0, t_min_found)  # can't have overly cold water
+        t_max[levels[found]] = np.ma.filled(t_an[levels, idx] + t_sd[levels, idx], np.nan)[found]
+        dist_t_sd[levels[found]] = dists[idx][found]
+
+        # Now do the same thing for the salinity standard deviations
+        valid = np.ma.filled((s_sd < 500.0) & (s_sd >= 0), False)
+        idx, found = self.closest_valid(valid=valid, dists=dists)
+        s_min_found = np.ma.filled(s_an[levels, idx] - s_sd[levels, idx], np.nan)[found]
+        s_min[levels[found]] = np.where(s_min_found < 0, 0, s_min_found)  # Can't have a negative salinity
+        s_max[levels[found]] = np.ma.filled(s_an[levels, idx] + s_sd[levels, idx], np.nan)[found]
+        dist_s_sd[levels[found]] = dists[idx][found]
 
         valid = dist_arr != 99999999
         num_values = t[valid].size
@@ -309,7 +372,7 @@ class Woa13(AbstractAtlas):
         ssp.meta.longitude = lon
         ssp.meta.utc_time = dt(year=datestamp.year, month=datestamp.month, day=datestamp.day)
         ssp.init_data(num_values)
-        ssp.data.depth = self.t[self.season_idx].variables['depth'][0:num_values]
+        ssp.data.depth = self.t_grids[self.season_idx]['depth'][0:num_values]
         ssp.data.temp = t[valid]
         ssp.data.sal = s[valid]
         ssp.calc_data_speed()
@@ -333,7 +396,7 @@ class Woa13(AbstractAtlas):
         ssp_min.meta.utc_time = dt(year=datestamp.year, month=datestamp.month, day=datestamp.day)
         if num_values > 0:
             ssp_min.init_data(num_values)
-            ssp_min.data.depth = self.t[self.season_idx].variables['depth'][0:num_values]
+            ssp_min.data.depth = self.t_grids[self.season_idx]['depth'][0:num_values]
             ssp_min.data.temp = t_min[valid][0:num_values]
             ssp_min.data.sal = s_min[valid][0:num_values]
             ssp_min.calc_data_speed()
@@ -351,7 +414,7 @@ class Woa13(AbstractAtlas):
         ssp.meta.original_path = "WOA13_%s" % datestamp.strftime("%Y%m%d")
         if num_values > 0:
             ssp_max.init_data(num_values)
-            ssp_max.data.depth = self.t[self.season_idx].variables['depth'][0:num_values].astype(np.float64)
+            ssp_max.data.depth = self.t_grids[self.season_idx]['depth'][0:num_values].astype(np.float64)
             ssp_max.data.temp = t_max[valid][0:num_values]
             ssp_max.data.sal = s_max[valid][0:num_values]
             ssp_max.calc_data_speed()
@@ -385,6 +448,8 @@ class Woa13(AbstractAtlas):
                 if self.s[i]:
                     self.s[i].close()
             self.s = list()
+            self.t_grids = list()
+            self.s_grids = list()
             self.landsea = None
             self.lat = None
             self.lon = None
@@ -394,6 +459,7 @@ class Woa13(AbstractAtlas):
             self.month_idx = 0
             self.season_idx = 0
         self.has_data_loaded = False
+        self.clear_cache()
 
     # --- repr
 
@@ -190,20 +190,22 @@ class Geodesy:
 
     @classmethod
     def haversine(cls, long_1, lat_1, long_2, lat_2):
-        """ Calculate the great circle distance between two points on a spherical Earth"""
+        """ Calculate the great circle distance between two points (or arrays of points) on a spherical Earth"""
         # convert decimal degrees to radians
-        long_1, lat_1, long_2, lat_2 = map(math.radians, [long_1, lat_1, long_2, lat_2])
+        long_1, lat_1, long_2, lat_2 = map(np.radians, [long_1, lat_1, long_2, lat_2])
 
         dlon = long_2 - long_1
         dlat = lat_2 - lat_1
-        a = math.sin(dlat / 2) ** 2 + math.cos(lat_1) * math.cos(lat_2) * math.sin(dlon / 2) ** 2
-        c = 2 * math.asin(math.sqrt(a))
+        a = np.sin(dlat / 2) ** 2 + np.cos(lat_1) * np.cos(lat_2) * np.sin(dlon / 2) ** 2
+        c = 2 * np.arcsin(np.sqrt(a))
         r = 6371000  # Radius of earth in meters. Use 3956 for miles
         return c * r
 
     def distance(self, long_1, lat_1, long_2, lat_2, units="m"):
         """ Returns distance in 'units' (default m) between two Lat Lon point sets
 
+        The points can also be passed as arrays (of the same size), to get an array of distances.
+
         Args:
             long_1:             Longitude of point 1
             lat_1:              Latitude of point 1
@@ -12,6 +12,7 @@ logger = logging.getLogger(__name__)
 
 class Client:
     UDP_DATA_LIMIT = (2 ** 16) - 28
+    UDP_SAMPLES_LIMIT = UDP_DATA_LIMIT // 12  # at least 12 bytes per sample: more samples never fit
 
     def __init__(self, client):
         # print(client)
@@ -22,8 +23,8 @@ class Client:
         self.alive = True
         # logger.info("client: %s(%s:%s) %s" % (self.name, self.ip, self.port, self.protocol))
 
-    def send_cast(self, prj, server_mode=False):
-        """Send a cast to the """
+    def send_cast(self, prj, server_mode=False, thin_levels=None):
+        """Send a cast to the client (optionally, reusing the passed thinning levels)"""
         if not self.alive:
             logger.debug("%s[%s:%s:%s] is NOT alive" % (self.name, self.ip, self.port, self.protocol))
             return False
@@ -34,11 +35,11 @@ class Client:
         if self.protocol == "HYPACK":
             success = self.send_hyp_format(prj=prj)
         else:
-            success = self.send_kng_format(prj=prj, server_mode=server_mode)
+            success = self.send_kng_format(prj=prj, server_mode=server_mode, thin_levels=thin_levels)
 
         return success
 
-    def send_kng_format(self, prj, server_mode=False):
+    def send_kng_format(self, prj, server_mode=False, thin_levels=None):
         logger.info("using kng format")
         kng_fmt = None
         if self.protocol in ["SIS", "KCTRL"]:
@@ -57,10 +58,17 @@ class Client:
             apply_12k = False
             tolerances = [0.001, 0.005, 0.01, 0.05, 0.1, 0.5]
 
+        if thin_levels is None:
+            thin_levels = prj.cur.thin_levels()
+
+        # skip the tolerances that keep too many samples to fit, then check the actual size of the data
+        tolerance = prj.cur.thin_tolerance(tolerances=tolerances, max_samples=self.UDP_SAMPLES_LIMIT,
+                                           levels=thin_levels)
         tx_data = None
-        for tolerance in tolerances:
+        for tolerance in tolerances[tolerances.index(tolerance):]:
 
-            if not prj.prepare_sis(apply_thin=apply_thin, apply_12k=apply_12k, thin_tolerance=tolerance):
+            if not prj.prepare_sis(apply_thin=apply_thin, apply_12k=apply_12k, thin_tolerance=tolerance,
+                                   thin_levels=thin_levels):
                 logger.info("issue in preparing the data")
                 return False
 
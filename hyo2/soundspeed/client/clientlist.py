@@ -25,6 +25,7 @@ class ClientList:
         # loop through the client list
         success = True  # false if one tx has troubles
         prog_quantum = 100 / (len(self.clients) + 1)
+        thin_levels = prj.cur.thin_levels()  # the thinning is run once for all the clients
         for client in self.clients:
 
             # clean previously received profile from SIS
@@ -34,7 +35,7 @@ class ClientList:
 
             prj.progress.add(prog_quantum)
 
-            if not client.send_cast(prj=prj, server_mode=server_mode):
+            if not client.send_cast(prj=prj, server_mode=server_mode, thin_levels=thin_levels):
                 logger.warning('unable to send profile to %s' % client.name)
                 success = False
                 continue
@@ -0,0 +1,60 @@
+import struct
+import zlib
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# the stored fields with their little-endian dtype
+blob_fields = [
+    ('pressure', '<f8'),
+    ('depth', '<f8'),
+    ('speed', '<f8'),
+    ('temp', '<f8'),
+    ('conductivity', '<f8'),
+    ('sal', '<f8'),
+    ('source', '<i4'),
+    ('flag', '<i4'),
+]
+
+blob_magic = b'SSB1'
+_header_fmt = '<4sH'
+_column_fmt = '<8sI'
+
+
+def pack_samples(columns):
+    """Pack the sample columns (ordered as blob_fields) as a single blob of compressed column blocks
+
+    The uncompressed header has the magic, the number of columns, and the dtype and length of each column.
+    """
+    header = struct.pack(_header_fmt, blob_magic, len(blob_fields))
+    blocks = list()
+    for (name, dtype), values in zip(blob_fields, columns):
+        header += struct.pack(_column_fmt, dtype.encode(), len(values))
+        blocks.append(np.asarray(values).astype(dtype).tobytes())
+
+    return header + zlib.compress(b''.join(blocks))
+
+
+def unpack_samples(blob):
+    """Unpack a blob created by pack_samples as a list of columns (read-only views of the decompressed block)"""
+    magic, nr_columns = struct.unpack_from(_header_fmt, blob)
+    if magic != blob_magic:
+        raise RuntimeError("invalid samples blob: %s" % magic)
+
+    offset = struct.calcsize(_header_fmt)
+    layout = list()
+    for _ in range(nr_columns):
+        dtype, length = struct.unpack_from(_column_fmt, blob, offset)
+        layout.append((np.dtype(dtype.rstrip(b'\0').decode()), length))
+        offset += struct.calcsize(_column_fmt)
+
+    block = zlib.decompress(blob[offset:])
+    columns = list()
+    start = 0
+    for dtype, length in layout:
+        columns.append(np.frombuffer(block, dtype=dtype, count=length, offset=start))
+        start += dtype.itemsize * length
+
+    return columns
@@ -2,14 +2,19 @@ import sqlite3
 import os
 import datetime
 # import traceback
+import math
 import numpy as np
 import logging
 
 from hyo2.soundspeed import lib_info
+from hyo2.soundspeed.base.geodesy import Geodesy
 from hyo2.soundspeed.db.point import Point, convert_point, adapt_point
+from hyo2.soundspeed.db.blob import pack_samples, unpack_samples
 from hyo2.soundspeed.db.plot import PlotDb
 from hyo2.soundspeed.db.export import ExportDb
+from hyo2.soundspeed.profile.aggregate import ProfileAggregate
 from hyo2.soundspeed.profile.profilelist import ProfileList
+from hyo2.soundspeed.profile.samples import Samples
 from hyo2.soundspeed.profile.dicts import Dicts
 
 logger = logging.getLogger(__name__)
@@ -18,21 +23,25 @@ logger = logging.getLogger(__name__)
 class ProjectDb:
     """Class that provides an interface to a SQLite db with Sound Speed data"""
 
-    def __init__(self, projects_folder=None, project_name=None):
+    def __init__(self, projects_folder=None, project_name=None, check_schema=True, pooled=False):
+        """With 'check_schema' set to False, the tables are assumed to be already built and up-to-date
+
+        A 'pooled' connection (see ProjectDbPool) is set in WAL journal mode with normal synchronous writes,
+        and it can be closed from a thread different from the one that opened it.
+        """
 
         # in case that no data folder is passed
         if projects_folder is None:
             projects_folder = os.path.abspath(os.path.curdir)
         self.data_folder = projects_folder
 
-        # in case that none is passed as project name
-        if project_name is None:
-            project_name = "default"
-
         # the passed project name is used to identify the project database to open
-        self.db_path = os.path.join(projects_folder, self.clean_project_name(project_name) + ".db")
+        self.db_path = self.make_db_path(projects_folder=projects_folder, project_name=project_name)
         # logger.debug('current project db: %s' % self.db_path)
 
+        self.check_schema = check_schema
+        self.pooled = pooled
+
         # add plotting and exporting capabilities
         self.plot = PlotDb(db=self)
         self.export = ExportDb(db=self)
@@ -43,10 +52,27 @@ class ProjectDb:
         self.tmp_data = None
         self.tmp_ssp_pk = None
 
-        self.cur_version = 3
+        self.cur_version = 7
+
+        # when True, the samples of each cast are stored as compressed blobs (see migrate_to_blob_storage)
+        self.blob_storage = False
+        # when True, the casts are spatio-temporally indexed with an R*Tree (see query_casts)
+        self.has_rtree = False
 
         self.reconnect_or_create()
 
+    @classmethod
+    def make_db_path(cls, projects_folder=None, project_name=None):
+        # in case that no data folder is passed
+        if projects_folder is None:
+            projects_folder = os.path.abspath(os.path.curdir)
+
+        # in case that none is passed as project name
+        if project_name is None:
+            project_name = "default"
+
+        return os.path.join(projects_folder, cls.clean_project_name(project_name) + ".db")
+
     @staticmethod
     def clean_name(some_var):
         return ''.join(char for char in some_var if char.isalnum())
@@ -65,7 +91,8 @@ class ProjectDb:
 
         try:
             self.conn = sqlite3.connect(self.db_path,
-                                        detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES)
+                                        detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES,
+                                        check_same_thread=not self.pooled)
             # logger.info("Connected")
 
         except sqlite3.Error as e:
@@ -79,6 +106,14 @@ class ProjectDb:
         except sqlite3.Error as e:
             raise RuntimeError("Unable to activate foreign keys: %s" % e)
 
+        if self.pooled:
+            try:
+                self.conn.execute('PRAGMA journal_mode=WAL')
+                self.conn.execute('PRAGMA synchronous=NORMAL')
+
+            except sqlite3.Error as e:
+                raise RuntimeError("Unable to activate WAL journal mode: %s" % e)
+
         try:
             # Set the row factory
             self.conn.row_factory = sqlite3.Row
@@ -97,11 +132,14 @@ class ProjectDb:
         except sqlite3.Error as e:
             raise RuntimeError("Unable to register numpy float adapter: %s - %s" % (type(e), e))
 
-        built = self.build_tables()
-        if not isinstance(built, bool):
-            raise RuntimeError("invalid return from 'build_tables' method, must be boolean")
-        if not built:
-            raise RuntimeError("Unable to build tables: the DB is encrypted or is not a database")
+        if self.check_schema:
+            built = self.build_tables()
+            if not isinstance(built, bool):
+                raise RuntimeError("invalid return from 'build_tables' method, must be boolean")
+            if not built:
+                raise RuntimeError("Unable to build tables: the DB is encrypted or is not a database")
+
+        self._read_storage_layout()
 
     def disconnect(self):
         """ Disconnect from the current database """
@@ -111,6 +149,7 @@ class ProjectDb:
 
         try:
             self.conn.close()
+            self.conn = None
             # logger.info("Disconnected")
             return True
 
@@ -155,8 +194,20 @@ class ProjectDb:
                 # noinspection SqlResolve
                 ret = self.conn.execute("""SELECT version FROM library""").fetchone()
                 if ret[0] < 3:
-                    logger.debug("updated old library version from %s to %s" % (ret[0], self.cur_version))
+                    logger.debug("updated old library version from %s to %s" % (ret[0], 3))
                     self._updates_to_version_3(old_version=ret[0])
+                if ret[0] < 4:
+                    logger.debug("updated old library version from %s to %s" % (max(ret[0], 3), 4))
+                    self._updates_to_version_4(old_version=max(ret[0], 3))
+                if ret[0] < 5:
+                    logger.debug("updated old library version from %s to %s" % (max(ret[0], 4), 5))
+                    self._updates_to_version_5(old_version=max(ret[0], 4))
+                if ret[0] < 6:
+                    logger.debug("updated old library version from %s to %s" % (max(ret[0], 5), 6))
+                    self._updates_to_version_6(old_version=max(ret[0], 5))
+                if ret[0] < 7:
+                    logger.debug("updated old library version from %s to %s" % (max(ret[0], 6), 7))
+                    self._updates_to_version_7(old_version=max(ret[0], 6))
 
                 self.conn.execute("""
                                   CREATE TABLE IF NOT EXISTS ssp_pk(
@@ -261,6 +312,11 @@ class ProjectDb:
                                         FROM ssp a LEFT OUTER JOIN ssp_pk b ON a.pk=b.id
                                   """)
 
+                self._create_indexes()
+                self._create_summary_table()
+                self._create_blob_tables()
+                self._create_rtree()
+
             return True
 
         except sqlite3.Error as e:
@@ -277,6 +333,7 @@ class ProjectDb:
 
         try:
             with self.conn:
+                self._begin_write()
 
                 for i, self.tmp_data in enumerate(ssp.l):
 
@@ -304,36 +361,72 @@ class ProjectDb:
 
         try:
             with self.conn:
+                self._begin_write()
 
                 for i, self.tmp_data in enumerate(ssp.l):
 
                     # logger.info("got a new SSP to store:\n%s" % self.tmp_data)
+                    self._add_cast()
 
-                    if not self._get_ssp_pk():
-                        raise sqlite3.Error("unable to get ssp pk: %s" % self.tmp_ssp_pk)
+            return True
 
-                    if not self._delete_old_ssp():
-                        raise sqlite3.Error("unable to clean ssp")
+        except sqlite3.Error as e:
+            logger.error("during adding casts, %s: %s" % (type(e), e))
+            return False
 
-                    if not self._add_ssp():
-                        raise sqlite3.Error("unable to add ssp")
+    def add_casts_many(self, profile_lists):
+        """Store the casts of all the passed profile lists in a single transaction (e.g., for archive ingestion)"""
+        for ssp in profile_lists:
+            if not isinstance(ssp, ProfileList):
+                raise RuntimeError("not passed a ProfileList, but %s" % type(ssp))
 
-                    if not self._add_data():
-                        raise sqlite3.Error("unable to add ssp raw data samples")
+        if not self.conn:
+            logger.error("missing db connection")
+            return False
 
-                    if not self._add_proc():
-                        raise sqlite3.Error("unable to add ssp processed data samples")
+        try:
+            with self.conn:
+                self._begin_write()
 
-                    if self.tmp_data.sis is not None:
-                        if not self._add_sis():
-                            raise sqlite3.Error("unable to add ssp sis data samples")
+                for ssp in profile_lists:
+                    for self.tmp_data in ssp.l:
+                        self._add_cast()
 
             return True
 
         except sqlite3.Error as e:
-            logger.error("during adding casts, %s: %s" % (type(e), e))
+            logger.error("during adding many casts, %s: %s" % (type(e), e))
             return False
 
+    def _add_cast(self):
+        """Store the current cast, raising sqlite3.Error on failure (to roll back the transaction)"""
+
+        if not self._get_ssp_pk():
+            raise sqlite3.Error("unable to get ssp pk: %s" % self.tmp_ssp_pk)
+
+        if not self._delete_old_ssp():
+            raise sqlite3.Error("unable to clean ssp")
+
+        if not self._add_ssp():
+            raise sqlite3.Error("unable to add ssp")
+
+        if not self._add_data():
+            raise sqlite3.Error("unable to add ssp raw data samples")
+
+        if not self._add_proc():
+            raise sqlite3.Error("unable to add ssp processed data samples")
+
+        if self.tmp_data.sis is not None:
+            if not self._add_sis():
+                raise sqlite3.Error("unable to add ssp sis data samples")
+
+        if self.blob_storage:
+            if not self._add_summary():
+                raise sqlite3.Error("unable to add ssp summary")
+
+        elif not self._update_summary(pk=self.tmp_ssp_pk):
+            raise sqlite3.Error("unable to update ssp summary")
+
     def get_db_version(self):
         """Get the project db version"""
         if not self.conn:
@@ -388,6 +481,17 @@ class ProjectDb:
             logger.error("during ssp pk retrieve, %s: %s" % (type(e), e))
             return False
 
+        if self.has_rtree:
+            try:
+                # noinspection SqlResolve
+                self.conn.execute("""
+                                  INSERT OR REPLACE INTO ssp_rtree VALUES (?, ?, ?, ?, ?, ?, ?)
+                                  """, self._rtree_entry(pk=self.tmp_ssp_pk, utc_time=utc_time, point=point))
+
+            except sqlite3.Error as e:
+                logger.error("during ssp rtree update, %s: %s" % (type(e), e))
+                return False
+
         return True
 
     def _delete_old_ssp(self, full=False):
@@ -420,6 +524,24 @@ class ProjectDb:
             logger.error("during deletion from sis, %s: %s" % (type(e), e))
             return False
 
+        try:
+            # noinspection SqlResolve
+            self.conn.execute("""DELETE FROM ssp_samples WHERE ssp_pk=?""", (self.tmp_ssp_pk,))
+            # logger.info("deleted %s pk entries from ssp_samples" % self.tmp_ssp_pk)
+
+        except sqlite3.Error as e:
+            logger.error("during deletion from ssp_samples, %s: %s" % (type(e), e))
+            return False
+
+        try:
+            # noinspection SqlResolve
+            self.conn.execute("""DELETE FROM ssp_summary WHERE pk=?""", (self.tmp_ssp_pk,))
+            # logger.info("deleted %s pk entry from ssp_summary" % self.tmp_ssp_pk)
+
+        except sqlite3.Error as e:
+            logger.error("during deletion from ssp_summary, %s: %s" % (type(e), e))
+            return False
+
         try:
             # noinspection SqlResolve
             self.conn.execute("""DELETE FROM ssp WHERE pk=?""", (self.tmp_ssp_pk,))
@@ -429,6 +551,16 @@ class ProjectDb:
             logger.error("during deletion from ssp, %s: %s" % (type(e), e))
             return False
 
+        if full and self.has_rtree:
+            try:
+                # noinspection SqlResolve
+                self.conn.execute("""DELETE FROM ssp_rtree WHERE id=?""", (self.tmp_ssp_pk,))
+                # logger.info("deleted %s id entry from ssp_rtree" % self.tmp_ssp_pk)
+
+            except sqlite3.Error as e:
+                logger.error("during deletion from ssp_rtree, %s: %s" % (type(e), e))
+                return False
+
         if full:
             try:
                 # noinspection SqlResolve
@@ -479,111 +611,518 @@ class ProjectDb:
         return True
 
     def _add_data(self):
+        return self._add_samples(table="data", samples=self.tmp_data.data, label="raw")
+
+    def _add_proc(self):
+        return self._add_samples(table="proc", samples=self.tmp_data.proc, label="processed")
+
+    def _add_sis(self):
+        return self._add_samples(table="sis", samples=self.tmp_data.sis, label="sis")
+
+    def _add_samples(self, table, samples, label):
+        """Insert all the samples with a single executemany, falling back to row-by-row on integrity errors"""
+
+        sz = samples.num_samples
+        # logger.info("num %s samples to add: %s" % (label, sz))
+        if sz == 0:
+            return True
+
+        if self.blob_storage:
+            columns = [samples.pressure, samples.depth, samples.speed, samples.temp,
+                       samples.conductivity, samples.sal, samples.source, samples.flag]
+            return self._add_blob(table=table, columns=columns, label=label)
+
+        # build the rows once from the column-stacked fields
+        values = np.column_stack([samples.pressure, samples.depth, samples.speed, samples.temp,
+                                  samples.conductivity, samples.sal, samples.source, samples.flag]).tolist()
+        rows = [[self.tmp_ssp_pk] + row for row in values]
+        # noinspection SqlResolve
+        query = """INSERT INTO %s VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""" % table
 
-        sz = self.tmp_data.data.num_samples
-        # logger.info("num samples to add: %s" % sz)
+        try:
+            self.conn.execute("""SAVEPOINT add_samples""")
+            self.conn.executemany(query, rows)
+            self.conn.execute("""RELEASE SAVEPOINT add_samples""")
+            # logger.info("added %s %s samples" % (sz, label))
+            return True
+
+        except sqlite3.IntegrityError as e:
+            logger.info("bulk insertion of %s samples failed due to %s: %s" % (label, type(e), e))
+            try:
+                self.conn.execute("""ROLLBACK TO SAVEPOINT add_samples""")
+                self.conn.execute("""RELEASE SAVEPOINT add_samples""")
+            except sqlite3.Error as e:
+                logger.error("during rollback of ssp %s samples, %s: %s" % (label, type(e), e))
+                return False
+
+        except sqlite3.Error as e:
+            logger.error("during adding ssp %s samples, %s: %s" % (label, type(e), e))
+            return False
 
         added_samples = 0
-        for i in range(sz):
+        for i, row in enumerate(rows):
 
             try:
-                # first check if the sample is already present with exactly the same values
-                # noinspection SqlResolve
-                self.conn.execute("""
-                                  INSERT INTO data VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                                  """, (self.tmp_ssp_pk,
-                                        self.tmp_data.data.pressure[i],
-                                        self.tmp_data.data.depth[i],
-                                        self.tmp_data.data.speed[i],
-                                        self.tmp_data.data.temp[i],
-                                        self.tmp_data.data.conductivity[i],
-                                        self.tmp_data.data.sal[i],
-                                        self.tmp_data.data.source[i],
-                                        self.tmp_data.data.flag[i],
-                                        ))
+                self.conn.execute(query, row)
                 added_samples += 1
+
             except sqlite3.IntegrityError as e:
                 logger.info("skipping row #%s due to %s: %s" % (i, type(e), e))
                 continue
+
             except sqlite3.Error as e:
-                print(self.tmp_data.data.depth[i], type(self.tmp_data.data.depth[i]))
-                # traceback.print_stack()
-                logger.error("during adding ssp raw samples, %s: %s" % (type(e), e))
+                logger.error("during adding ssp %s samples, %s: %s" % (label, type(e), e))
                 return False
 
-        # logger.info("added %s raw samples" % added_samples)
+        # logger.info("added %s %s samples" % (added_samples, label))
         return True
 
-    def _add_proc(self):
+    def _add_blob(self, table, columns, label):
+        try:
+            # noinspection SqlResolve
+            self.conn.execute("""
+                              INSERT INTO ssp_samples VALUES (?, ?, ?, ?)
+                              """, (self.tmp_ssp_pk, table, len(columns[1]), pack_samples(columns)))
 
-        sz = self.tmp_data.proc.num_samples
-        # logger.info("max processed samples to add: %s" % sz)
+        except sqlite3.Error as e:
+            logger.error("during adding ssp %s samples blob, %s: %s" % (label, type(e), e))
+            return False
 
-        added_samples = 0
-        for i in range(sz):
+        return True
+
+    def _add_summary(self):
+        """Store the summary values computed from the current cast (see _update_summary)"""
+        proc = self.tmp_data.proc
+        ss_at_min_depth, min_depth, max_depth, max_raw_depth = None, None, None, None
+        if proc.num_samples > 0:
+            valid = np.flatnonzero(proc.flag == Dicts.flags['valid'])
+            if valid.size > 0:
+                ss_at_min_depth = float(proc.speed[valid[0]])
+                min_depth = float(proc.depth[valid[0]])
+                max_depth = float(proc.depth[valid[-1]])
+
+            extensions = [Dicts.sources['woa09_ext'], Dicts.sources['woa13_ext'], Dicts.sources['woa18_ext'],
+                          Dicts.sources['rtofs_ext'], Dicts.sources['gomofs_ext'], Dicts.sources['ref_ext']]
+            raw = valid[~np.isin(proc.source[valid], extensions)]
+            if raw.size > 0:
+                max_raw_depth = float(proc.depth[raw[-1]])
+
+        nr_sis_samples = 0
+        if self.tmp_data.sis is not None:
+            nr_sis_samples = int(self.tmp_data.sis.num_samples)
+
+        try:
+            # noinspection SqlResolve
+            self.conn.execute("""
+                              INSERT OR REPLACE INTO ssp_summary VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                              """, (self.tmp_ssp_pk, ss_at_min_depth, min_depth, max_depth, max_raw_depth,
+                                    int(self.tmp_data.data.num_samples), int(proc.num_samples), nr_sis_samples))
+
+        except sqlite3.Error as e:
+            logger.error("during ssp summary addition, %s: %s" % (type(e), e))
+            return False
+
+        return True
+
+    def sample_storage(self):
+        """Return the layout used to store the samples: 'rows' (one row per sample) or 'blob' (one blob per cast)"""
+        try:
+            # noinspection SqlResolve
+            ret = self.conn.execute("""SELECT value FROM settings WHERE name='sample_storage'""").fetchone()
+
+        except sqlite3.Error as e:
+            logger.error("while getting the sample storage, %s: %s" % (type(e), e))
+            return None
+
+        if ret is None:
+            return "rows"
+        return ret[0]
+
+    def _read_storage_layout(self):
+        """Read the layout of the samples and the presence of the spatio-temporal index
+
+        Since both can be changed by another connection to the same db (e.g., the pooled db of another thread),
+        the layout is read again at the start of each transaction.
+        """
+        self.blob_storage = self.sample_storage() == "blob"
+        # noinspection SqlResolve
+        self.has_rtree = self.conn.execute("""
+                                           SELECT COUNT(*) FROM sqlite_master WHERE type='table' AND name='ssp_rtree'
+                                           """).fetchone()[0] > 0
+
+    def _begin_write(self):
+        """Start a write transaction, then read the layout (that cannot change until the end of the transaction)"""
+        self.conn.execute("""BEGIN IMMEDIATE""")
+        self._read_storage_layout()
+
+    def migrate_to_blob_storage(self):
+        """Convert the samples of all the casts from one row per sample to one compressed blob per table"""
+        if not self.conn:
+            logger.error("missing db connection")
+            return False
+
+        try:
+            with self.conn:
+                self._begin_write()
+                if self.blob_storage:
+                    logger.info("samples already stored as blobs")
+                    return True
+
+                # noinspection SqlResolve
+                pks = [row[0] for row in self.conn.execute("""SELECT pk FROM ssp""").fetchall()]
+                for pk in pks:
+                    self.tmp_ssp_pk = pk
+                    for table in ["data", "proc", "sis"]:
+                        columns = self._read_samples(table=table, pk=pk)
+                        if len(columns[1]) == 0:
+                            continue
+                        if not self._add_blob(table=table, columns=columns, label=table):
+                            raise sqlite3.Error("unable to add the %s samples blob of pk %s" % (table, pk))
+
+                for table in ["data", "proc", "sis"]:
+                    # noinspection SqlResolve
+                    self.conn.execute("""DELETE FROM %s""" % table)
 
-            try:
-                # first check if the sample is already present with exactly the same values
                 # noinspection SqlResolve
                 self.conn.execute("""
-                                  INSERT INTO proc VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                                  """, (self.tmp_ssp_pk,
-                                        self.tmp_data.proc.pressure[i],
-                                        self.tmp_data.proc.depth[i],
-                                        self.tmp_data.proc.speed[i],
-                                        self.tmp_data.proc.temp[i],
-                                        self.tmp_data.proc.conductivity[i],
-                                        self.tmp_data.proc.sal[i],
-                                        self.tmp_data.proc.source[i],
-                                        self.tmp_data.proc.flag[i],
-                                        ))
-                added_samples += 1
+                                  INSERT OR REPLACE INTO settings VALUES ('sample_storage', 'blob')
+                                  """)
 
-            except sqlite3.IntegrityError as e:
-                logger.info("skipping row #%s due to %s: %s" % (i, type(e), e))
-                continue
-            except sqlite3.Error as e:
-                logger.error("during adding ssp processed samples, %s: %s" % (type(e), e))
-                return False
+            self.tmp_ssp_pk = None
+            self.blob_storage = True
 
-        # logger.info("added %s processed samples" % added_samples)
+        except sqlite3.Error as e:
+            logger.error("during migration to blob storage, %s: %s" % (type(e), e))
+            self.tmp_ssp_pk = None
+            return False
+
+        try:
+            # reclaim the space of the deleted samples
+            self.conn.execute("""VACUUM""")
+
+        except sqlite3.Error as e:
+            logger.warning("unable to vacuum the db, %s: %s" % (type(e), e))
+
+        logger.info("migrated %s casts to blob storage" % len(pks))
         return True
 
-    def _add_sis(self):
+    def import_casts(self, input_db_path):
+        """Merge the casts of another project db (with up-to-date schema) in a single transaction
 
-        sz = self.tmp_data.sis.num_samples
-        # logger.info("max sis samples to add: %s" % sz)
+        The input db is attached, and its casts are copied with set-based inserts after having remapped their pks.
+        A cast with the same datetime and position of an existing cast is skipped.
 
-        added_samples = 0
-        for i in range(sz):
+        Returns:
+            tuple:          The input pks of the skipped casts and of the imported ones
+        """
+        if not self.conn:
+            logger.error("missing db connection")
+            return None, None
+
+        try:
+            self.conn.execute("""ATTACH DATABASE ? AS src""", (input_db_path,))
+
+        except sqlite3.Error as e:
+            logger.error("while attaching %s, %s: %s" % (input_db_path, type(e), e))
+            return None, None
+
+        pk_issues = list()
+        pk_done = list()
+        pk_map = list()  # (input pk, current pk, 1 if the current pk is new)
+        try:
+            with self.conn:
+                # read the existing casts only after having started the write transaction,
+                # so that the casts stored meanwhile by another connection are not missed
+                self._begin_write()
+
+                # the existing casts by (datetime, position) key, and the first free pk
+                # noinspection SqlResolve
+                rows = self.conn.execute("""
+                                         SELECT a.id, a.cast_datetime, a.cast_position, b.pk FROM main.ssp_pk a
+                                            LEFT OUTER JOIN main.ssp b ON a.id=b.pk
+                                         """).fetchall()
+                cur_keys = dict()
+                next_pk = 1
+                for row in rows:
+                    cur_keys[(row[1], row[2].x, row[2].y)] = (row[0], row[3] is not None)
+                    next_pk = max(next_pk, row[0] + 1)
+
+                # the map from input to current pks: a pk without cast (only in 'ssp_pk') is reused
+                # noinspection SqlResolve
+                rows = self.conn.execute("""
+                                         SELECT a.pk, b.cast_datetime, b.cast_position FROM src.ssp a
+                                            JOIN src.ssp_pk b ON a.pk=b.id ORDER BY a.pk
+                                         """).fetchall()
+                for row in rows:
+                    key = (row[1], row[2].x, row[2].y)
+                    cur_pk, has_cast = cur_keys.get(key, (None, False))
+                    if has_cast:
+                        pk_issues.append(row[0])
+                        continue
+
+                    if cur_pk is None:
+                        pk_map.append((row[0], next_pk, 1))
+                        cur_keys[key] = (next_pk, True)
+                        next_pk += 1
+                    else:
+                        pk_map.append((row[0], cur_pk, 0))
+                        cur_keys[key] = (cur_pk, True)
 
-            try:
-                # first check if the sample is already present with exactly the same values
                 # noinspection SqlResolve
                 self.conn.execute("""
-                                  INSERT INTO sis VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                                  """, (self.tmp_ssp_pk,
-                                        self.tmp_data.sis.pressure[i],
-                                        self.tmp_data.sis.depth[i],
-                                        self.tmp_data.sis.speed[i],
-                                        self.tmp_data.sis.temp[i],
-                                        self.tmp_data.sis.conductivity[i],
-                                        self.tmp_data.sis.sal[i],
-                                        self.tmp_data.sis.source[i],
-                                        self.tmp_data.sis.flag[i],
-                                        ))
-                added_samples += 1
+                                  CREATE TEMP TABLE IF NOT EXISTS import_map(
+                                     src_pk integer PRIMARY KEY,
+                                     pk integer NOT NULL,
+                                     new_pk integer NOT NULL)
+                                  """)
+                # noinspection SqlResolve
+                self.conn.execute("""DELETE FROM temp.import_map""")
+                # noinspection SqlResolve
+                self.conn.executemany("""INSERT INTO temp.import_map VALUES (?, ?, ?)""", pk_map)
 
-            except sqlite3.IntegrityError as e:
-                logger.info("skipping row #%s due to %s: %s" % (i, type(e), e))
-                continue
+                # noinspection SqlResolve
+                self.conn.execute("""
+                                  INSERT INTO main.ssp_pk SELECT m.pk, a.cast_datetime, a.cast_position
+                                     FROM src.ssp_pk a JOIN temp.import_map m ON a.id=m.src_pk WHERE m.new_pk=1
+                                  """)
 
-            except sqlite3.Error as e:
-                logger.error("during adding ssp sis samples, %s: %s" % (type(e), e))
-                return False
+                for table, pk_column in [("ssp", "pk"), ("ssp_summary", "pk"), ("data", "ssp_pk"),
+                                         ("proc", "ssp_pk"), ("sis", "ssp_pk"), ("ssp_samples", "ssp_pk")]:
+                    # noinspection SqlResolve
+                    columns = [row[1] for row in self.conn.execute("""PRAGMA main.table_info(%s)""" % table)
+                               if row[1] != pk_column]
+                    # noinspection SqlResolve
+                    self.conn.execute("""
+                                      INSERT INTO main.%s (%s, %s) SELECT m.pk, %s
+                                         FROM src.%s a JOIN temp.import_map m ON a.%s=m.src_pk ORDER BY a.rowid
+                                      """ % (table, pk_column, ", ".join(columns),
+                                             ", ".join(["a.%s" % column for column in columns]), table, pk_column))
+
+                if not self.blob_storage:
+                    # the input samples stored as blobs are converted to rows
+                    cursor = self.conn.cursor()
+                    cursor.row_factory = None  # plain tuples
+                    # noinspection SqlResolve
+                    rows = cursor.execute("""
+                                          SELECT ssp_pk, samples_table, samples FROM main.ssp_samples
+                                             WHERE ssp_pk IN (SELECT pk FROM temp.import_map)
+                                          """).fetchall()
+                    for pk, table, blob in rows:
+                        self.tmp_ssp_pk = pk
+                        samples = self._make_samples(fields=list(self.sample_columns.keys()),
+                                                     columns=unpack_samples(blob))
+                        if not self._add_samples(table=table, samples=samples, label=table):
+                            raise sqlite3.Error("unable to add the %s samples of pk %s" % (table, pk))
+                    # noinspection SqlResolve
+                    self.conn.execute("""
+                                      DELETE FROM main.ssp_samples WHERE ssp_pk IN (SELECT pk FROM temp.import_map)
+                                      """)
+                    self.tmp_ssp_pk = None
+
+                else:
+                    # the input samples stored as rows are converted to blobs
+                    for table in ["data", "proc", "sis"]:
+                        # noinspection SqlResolve
+                        rows = self.conn.execute("""
+                                                 SELECT DISTINCT ssp_pk FROM main.%s
+                                                    WHERE ssp_pk IN (SELECT pk FROM temp.import_map)
+                                                 """ % table).fetchall()
+                        for pk in [row[0] for row in rows]:
+                            self.tmp_ssp_pk = pk
+                            columns = self._read_samples(table=table, pk=pk)
+                            if not self._add_blob(table=table, columns=columns, label=table):
+                                raise sqlite3.Error("unable to add the %s samples blob of pk %s" % (table, pk))
+                        # noinspection SqlResolve
+                        self.conn.execute("""
+                                          DELETE FROM main.%s WHERE ssp_pk IN (SELECT pk FROM temp.import_map)
+                                          """ % table)
+                    self.tmp_ssp_pk = None
+
+                if self.has_rtree:
+                    # noinspection SqlResolve
+                    rows = self.conn.execute("""
+                                             SELECT id, cast_datetime, cast_position FROM main.ssp_pk
+                                                WHERE id IN (SELECT pk FROM temp.import_map)
+                                             """).fetchall()
+                    # noinspection SqlResolve
+                    self.conn.executemany("""
+                                          INSERT OR REPLACE INTO ssp_rtree VALUES (?, ?, ?, ?, ?, ?, ?)
+                                          """, [self._rtree_entry(pk=row[0], utc_time=row[1], point=row[2])
+                                                for row in rows])
 
-        # logger.info("added %s sis samples" % added_samples)
-        return True
+                # noinspection SqlResolve
+                self.conn.execute("""DROP TABLE temp.import_map""")
+
+            pk_done = [row[0] for row in pk_map]
+
+        except sqlite3.Error as e:
+            logger.error("during import of casts, %s: %s" % (type(e), e))
+            self.tmp_ssp_pk = None
+            pk_issues = sorted(pk_issues + [row[0] for row in pk_map])
+
+        try:
+            self.conn.execute("""DETACH DATABASE src""")
+
+        except sqlite3.Error as e:
+            logger.warning("unable to detach %s, %s: %s" % (input_db_path, type(e), e))
+
+        logger.info("imported casts: %d, skipped casts: %d" % (len(pk_done), len(pk_issues)))
+        return pk_issues, pk_done
+
+    def query_casts(self, bbox=None, center=None, radius_m=None, time_range=None, limit=None):
+        """Query the casts by location and time, using the spatio-temporal index
+
+        Args:
+            bbox:           (west, south, east, north) in degrees (west > east for a box crossing the antimeridian)
+            center:         (longitude, latitude) in degrees, the results are sorted by distance from this point
+            radius_m:       Max distance from center in meters (if None, the nearest casts are searched)
+            time_range:     (start, end) UTC datetimes, both included (None for an open end)
+            limit:          Max number of returned casts
+        Returns:
+            list:           (pk, cast_datetime, cast_position, distance in meters from center or None) tuples,
+                            sorted by distance (with center) or by cast datetime
+        """
+        if not self.conn:
+            logger.error("missing db connection")
+            return None
+
+        self._read_storage_layout()
+        if center is None:
+            return self._query_casts(bbox=bbox, center=None, radius_m=None, time_range=time_range, limit=limit)
+
+        if radius_m is not None:
+            return self._query_casts(bbox=bbox, center=center, radius_m=radius_m, time_range=time_range,
+                                     limit=limit)
+
+        # without a limit, all the casts are returned (sorted by distance)
+        max_radius = math.pi * 6371000.0
+        if limit is None:
+            return self._query_casts(bbox=bbox, center=center, radius_m=max_radius, time_range=time_range,
+                                     limit=None)
+
+        # search the nearest casts by expanding the radius, since the R*Tree has no nearest-neighbor query
+        radius_m = 10000.0
+        while True:
+            casts = self._query_casts(bbox=bbox, center=center, radius_m=radius_m, time_range=time_range,
+                                      limit=limit)
+            if (casts is None) or (len(casts) >= limit) or (radius_m >= max_radius):
+                return casts
+            radius_m = min(radius_m * 10.0, max_radius)
+
+    def _query_casts(self, bbox, center, radius_m, time_range, limit):
+        conditions = list()
+        args = list()
+
+        if bbox is not None:
+            west, south, east, north = bbox
+            lon_ranges = [(west, east)] if west <= east else [(west, 180.0), (-180.0, east)]
+            conditions.append(self._lon_condition(lon_ranges, args))
+            conditions.append("max_lat>=? AND min_lat<=?")
+            args.extend([south, north])
+
+        if center is not None:
+            lon_ranges, lat_range = self._radius_bounds(center=center, radius_m=radius_m)
+            conditions.append(self._lon_condition(lon_ranges, args))
+            conditions.append("max_lat>=? AND min_lat<=?")
+            args.extend(lat_range)
+
+        if time_range is not None:
+            if time_range[0] is not None:
+                conditions.append("max_time>=?")
+                args.append(self._rtree_time(time_range[0]))
+            if time_range[1] is not None:
+                conditions.append("min_time<=?")
+                args.append(self._rtree_time(time_range[1]))
+
+        if self.has_rtree:
+            # noinspection SqlResolve
+            sql = """SELECT pk, cast_datetime, cast_position FROM ssp_rtree a JOIN ssp_view b ON a.id=b.pk"""
+            if len(conditions) > 0:
+                sql += " WHERE " + " AND ".join(conditions)
+        else:
+            logger.warning("missing spatio-temporal index, scanning all the casts")
+            # noinspection SqlResolve
+            sql = """SELECT pk, cast_datetime, cast_position FROM ssp_view"""
+            args = list()
+
+        try:
+            rows = self.conn.execute(sql, args).fetchall()
+
+        except sqlite3.Error as e:
+            logger.error("during casts query, %s: %s" % (type(e), e))
+            return None
+
+        # the R*Tree bounds are approximated, so the candidates are checked with the exact values
+        casts = list()
+        for pk, cast_datetime, cast_position in rows:
+            lon, lat = cast_position.x, cast_position.y
+
+            if bbox is not None:
+                west, south, east, north = bbox
+                if (lat < south) or (lat > north):
+                    continue
+                if (west <= east) and ((lon < west) or (lon > east)):
+                    continue
+                if (west > east) and (east < lon < west):
+                    continue
+
+            if time_range is not None:
+                if (time_range[0] is not None) and (cast_datetime < time_range[0]):
+                    continue
+                if (time_range[1] is not None) and (cast_datetime > time_range[1]):
+                    continue
+
+            distance = None
+            if center is not None:
+                distance = Geodesy.haversine(long_1=center[0], lat_1=center[1], long_2=lon, lat_2=lat)
+                if distance > radius_m:
+                    continue
+
+            casts.append((pk, cast_datetime, cast_position, distance))
+
+        if center is not None:
+            casts.sort(key=lambda cast: cast[3])
+        else:
+            casts.sort(key=lambda cast: cast[1])
+
+        return casts[:limit]
+
+    @staticmethod
+    def _lon_condition(lon_ranges, args):
+        conditions = list()
+        for west, east in lon_ranges:
+            conditions.append("(max_lon>=? AND min_lon<=?)")
+            args.extend([west, east])
+        return "(" + " OR ".join(conditions) + ")"
+
+    @staticmethod
+    def _radius_bounds(center, radius_m):
+        """Return the longitude ranges and the latitude range of the circle with the passed center and radius"""
+        lon, lat = center
+        angle = radius_m / 6371000.0  # on a spherical Earth, as for the haversine distance
+        d_lat = math.degrees(angle)
+        lat_range = [max(lat - d_lat, -90.0), min(lat + d_lat, 90.0)]
+
+        # a circle including a pole spans all the longitudes
+        if (lat + d_lat >= 90.0) or (lat - d_lat <= -90.0):
+            return [(-180.0, 180.0)], lat_range
+
+        d_lon = math.degrees(math.asin(min(math.sin(angle) / math.cos(math.radians(lat)), 1.0)))
+        west, east = lon - d_lon, lon + d_lon
+        if west < -180.0:
+            return [(west + 360.0, 180.0), (-180.0, east)], lat_range
+        if east > 180.0:
+            return [(west, 180.0), (-180.0, east - 360.0)], lat_range
+        return [(west, east)], lat_range
+
+    @staticmethod
+    def _rtree_time(utc_time):
+        return (utc_time - datetime.datetime(1970, 1, 1)).total_seconds()
+
+    @classmethod
+    def _rtree_entry(cls, pk, utc_time, point):
+        time_stamp = cls._rtree_time(utc_time)
+        return pk, point.x, point.x, point.y, point.y, time_stamp, time_stamp
 
     def timestamp_list(self):
         """Create and return the timestamp list (and the pk)"""
@@ -611,13 +1150,22 @@ class ProjectDb:
             logger.error("missing db connection")
             return None
 
+        def as_text(value):
+            if value is None:
+                return ''
+            return '%0.2f' % value
+
         ssp_list = list()
-        # noinspection SqlResolve
-        sql = self.conn.execute("SELECT * FROM ssp_view")
 
         try:
             with self.conn:
-                for row in sql:
+                # noinspection SqlResolve
+                rows = self.conn.execute("""
+                                         SELECT a.*, b.ss_at_min_depth, b.min_depth, b.max_depth, b.max_raw_depth
+                                            FROM ssp_view a LEFT OUTER JOIN ssp_summary b ON a.pk=b.pk
+                                         """).fetchall()
+
+                for row in rows:
 
                     # special handling in case of unknown future sensor type
                     sensor_type = row['sensor_type']
@@ -629,26 +1177,6 @@ class ProjectDb:
                     if probe_type not in Dicts.probe_types.values():
                         probe_type = Dicts.probe_types['Future']
 
-                    # special handling for surface sound speed, min depth, max depth
-                    # noinspection SqlResolve
-                    ssp_samples = self.conn.execute("SELECT * FROM proc WHERE ssp_pk=? AND flag=?",
-                                                    (row['pk'], Dicts.flags['valid'])).fetchall()
-                    ss_at_min_depth = '%0.2f' % ssp_samples[0]['speed']
-                    min_depth = '%0.2f' % ssp_samples[0]['depth']
-                    max_depth = '%0.2f' % ssp_samples[-1]['depth']
-
-                    # noinspection SqlResolve
-                    ssp_samples = self.conn.execute("SELECT * FROM proc WHERE ssp_pk=? AND flag=? "
-                                                    "AND source!=? AND source!=? AND source!=? AND source!=? "
-                                                    "AND source!=? AND source!=?",
-                                                    (row['pk'], Dicts.flags['valid'],
-                                                     Dicts.sources['woa09_ext'], Dicts.sources['woa13_ext'],
-                                                     Dicts.sources['woa18_ext'],
-                                                     Dicts.sources['rtofs_ext'], Dicts.sources['gomofs_ext'],
-                                                     Dicts.sources['ref_ext'],
-                                                     )).fetchall()
-                    max_raw_depth = '%0.2f' % ssp_samples[-1]['depth']
-
                     ssp_list.append((row['pk'],  # 0
                                      row['cast_datetime'],  # 1
                                      row['cast_position'],  # 2
@@ -669,10 +1197,10 @@ class ProjectDb:
                                      row['temperature_uom'],  # 17
                                      row['conductivity_uom'],  # 18
                                      row['salinity_uom'],  # 19
-                                     ss_at_min_depth,  # 20
-                                     min_depth,  # 21
-                                     max_depth,  # 22
-                                     max_raw_depth,  # 23
+                                     as_text(row['ss_at_min_depth']),  # 20
+                                     as_text(row['min_depth']),  # 21
+                                     as_text(row['max_depth']),  # 22
+                                     as_text(row['max_raw_depth']),  # 23
                                      ))
             return ssp_list
 
@@ -686,6 +1214,7 @@ class ProjectDb:
             return None
 
         # logger.info("retrieve profile with pk: %s" % pk)
+        self._read_storage_layout()
 
         ssp = ProfileList()
         ssp.append()
@@ -742,22 +1271,9 @@ class ProjectDb:
 
             # raw data
             try:
-                # noinspection SqlResolve
-                ssp_samples = self.conn.execute("SELECT * FROM data WHERE ssp_pk=?", (pk,)).fetchall()
-                num_samples = len(ssp_samples)
-                ssp.cur.init_data(num_samples)
-                # logger.debug("raw data samples: %s" % num_samples)
-                for i in range(num_samples):
-                    # print(ssp_samples[i])
-
-                    ssp.cur.data.pressure[i] = ssp_samples[i]['pressure']
-                    ssp.cur.data.depth[i] = ssp_samples[i]['depth']
-                    ssp.cur.data.speed[i] = ssp_samples[i]['speed']
-                    ssp.cur.data.temp[i] = ssp_samples[i]['temperature']
-                    ssp.cur.data.conductivity[i] = ssp_samples[i]['conductivity']
-                    ssp.cur.data.sal[i] = ssp_samples[i]['salinity']
-                    ssp.cur.data.source[i] = ssp_samples[i]['source']
-                    ssp.cur.data.flag[i] = ssp_samples[i]['flag']
+                columns = self._read_samples(table="data", pk=pk)
+                ssp.cur.init_data(len(columns[1]))
+                self._set_samples(ssp.cur.data, columns)
 
             except sqlite3.Error as e:
                 logger.error("reading raw samples for %s pk, %s: %s" % (pk, type(e), e))
@@ -765,21 +1281,9 @@ class ProjectDb:
 
             # proc data
             try:
-                # noinspection SqlResolve
-                ssp_samples = self.conn.execute("SELECT * FROM proc WHERE ssp_pk=?", (pk,)).fetchall()
-                num_samples = len(ssp_samples)
-                ssp.cur.init_proc(num_samples)
-                # logger.debug("proc data samples: %s" % num_samples)
-                for i in range(num_samples):
-                    # print(ssp_samples[i])
-                    ssp.cur.proc.pressure[i] = ssp_samples[i]['pressure']
-                    ssp.cur.proc.depth[i] = ssp_samples[i]['depth']
-                    ssp.cur.proc.speed[i] = ssp_samples[i]['speed']
-                    ssp.cur.proc.temp[i] = ssp_samples[i]['temperature']
-                    ssp.cur.proc.conductivity[i] = ssp_samples[i]['conductivity']
-                    ssp.cur.proc.sal[i] = ssp_samples[i]['salinity']
-                    ssp.cur.proc.source[i] = ssp_samples[i]['source']
-                    ssp.cur.proc.flag[i] = ssp_samples[i]['flag']
+                columns = self._read_samples(table="proc", pk=pk)
+                ssp.cur.init_proc(len(columns[1]))
+                self._set_samples(ssp.cur.proc, columns)
 
             except sqlite3.Error as e:
                 logger.error("reading raw samples for %s pk, %s: %s" % (pk, type(e), e))
@@ -787,21 +1291,11 @@ class ProjectDb:
 
             # sis data
             try:
-                # noinspection SqlResolve
-                ssp_samples = self.conn.execute("SELECT * FROM sis WHERE ssp_pk=?", (pk,)).fetchall()
-                num_samples = len(ssp_samples)
-                ssp.cur.init_sis(num_samples)
-                # logger.debug("sis data samples: %s" % num_samples)
-                for i in range(num_samples):
-                    # print(ssp_samples[i])
-                    ssp.cur.sis.pressure[i] = ssp_samples[i]['depth']
-                    ssp.cur.sis.depth[i] = ssp_samples[i]['depth']
-                    ssp.cur.sis.speed[i] = ssp_samples[i]['speed']
-                    ssp.cur.sis.temp[i] = ssp_samples[i]['temperature']
-                    ssp.cur.sis.conductivity[i] = ssp_samples[i]['conductivity']
-                    ssp.cur.sis.sal[i] = ssp_samples[i]['salinity']
-                    ssp.cur.sis.source[i] = ssp_samples[i]['source']
-                    ssp.cur.sis.flag[i] = ssp_samples[i]['flag']
+                columns = self._read_samples(table="sis", pk=pk)
+                ssp.cur.init_sis(len(columns[1]))
+                self._set_samples(ssp.cur.sis, columns)
+                if ssp.cur.sis.num_samples > 0:  # the sis pressure is populated with the depth values
+                    ssp.cur.sis.pressure[:] = ssp.cur.sis.depth
 
             except sqlite3.Error as e:
                 logger.error("reading sis samples for %s pk, %s: %s" % (pk, type(e), e))
@@ -812,37 +1306,372 @@ class ProjectDb:
 
         return ssp
 
+    def _read_samples(self, table, pk):
+        """Read all the samples of a table for the passed pk as a list of columns (one for each field)
+
+        The samples are read from the blob, if present, otherwise from the table rows.
+        """
+        cursor = self.conn.cursor()
+        cursor.row_factory = None  # plain tuples
+
+        if self.blob_storage:
+            # noinspection SqlResolve
+            ret = cursor.execute("""
+                                 SELECT samples FROM ssp_samples WHERE ssp_pk=? AND samples_table=?
+                                 """, (pk, table)).fetchone()
+            if ret is not None:
+                return unpack_samples(ret[0])
+
+        # noinspection SqlResolve
+        rows = cursor.execute("""
+                              SELECT pressure, depth, speed, temperature, conductivity, salinity, source, flag
+                                 FROM %s WHERE ssp_pk=? ORDER BY rowid
+                              """ % table, (pk,)).fetchall()
+        return np.array(rows, dtype=np.float64).reshape(-1, 8).T  # NULL values are converted to NaN
+
+    @staticmethod
+    def _set_samples(samples, columns):
+        if len(columns[1]) == 0:
+            return
+
+        samples.pressure[:] = columns[0]
+        samples.depth[:] = columns[1]
+        samples.speed[:] = columns[2]
+        samples.temp[:] = columns[3]
+        samples.conductivity[:] = columns[4]
+        samples.sal[:] = columns[5]
+        samples.source[:] = columns[6]
+        samples.flag[:] = columns[7]
+
+    # the db columns of the samples fields
+    sample_columns = {
+        'pressure': 'pressure',
+        'depth': 'depth',
+        'speed': 'speed',
+        'temp': 'temperature',
+        'conductivity': 'conductivity',
+        'sal': 'salinity',
+        'source': 'source',
+        'flag': 'flag',
+    }
+
+    def iter_profiles(self, pks=None, tables=('proc',), flags=('valid',), fields=None, batch_size=100):
+        """Stream the samples of many casts, reading batches of casts with one query for each table
+
+        Args:
+            pks:            The pks of the casts (all the casts, if None), yielded in the same order
+            tables:         The sample tables to read: 'data', 'proc', and/or 'sis'
+            flags:          The names of the flags of the samples to read (all the samples, if None)
+            fields:         The samples fields to read (e.g., ['depth', 'speed']; all the fields, if None)
+            batch_size:     The number of casts read at once
+        Yields:
+            tuple:          The cast pk and a dict with a Samples object for each table
+        """
+        if not self.conn:
+            logger.error("missing db connection")
+            return
+
+        self._read_storage_layout()
+        if pks is None:
+            # noinspection SqlResolve
+            pks = [row[0] for row in self.conn.execute("""SELECT pk FROM ssp ORDER BY pk""").fetchall()]
+
+        if fields is None:
+            fields = list(self.sample_columns.keys())
+
+        flag_values = None
+        if flags is not None:
+            flag_values = [Dicts.flags[flag] for flag in flags]
+
+        for start in range(0, len(pks), batch_size):
+            batch = list(pks[start:start + batch_size])
+            batch_samples = dict([(pk, dict()) for pk in batch])
+
+            for table in tables:
+                columns = self._read_batch_samples(table=table, pks=batch, flag_values=flag_values, fields=fields)
+                for pk in batch:
+                    batch_samples[pk][table] = self._make_samples(fields=fields, columns=columns.get(pk))
+
+            for pk in batch:
+                yield pk, batch_samples.pop(pk)
+
+    def _read_batch_samples(self, table, pks, flag_values, fields):
+        """Read the samples of a table for the passed pks as a dict of (flag-filtered) columns for each pk"""
+        cursor = self.conn.cursor()
+        cursor.row_factory = None  # plain tuples
+        pks_marks = ", ".join(["?"] * len(pks))
+        columns = dict()
+
+        if self.blob_storage:
+            # noinspection SqlResolve
+            rows = cursor.execute("""
+                                  SELECT ssp_pk, samples FROM ssp_samples WHERE samples_table=? AND ssp_pk IN (%s)
+                                  """ % pks_marks, [table] + list(pks)).fetchall()
+            names = list(self.sample_columns.keys())
+            for pk, blob in rows:
+                blob_columns = unpack_samples(blob)
+                selected = slice(None)
+                if flag_values is not None:
+                    selected = np.isin(blob_columns[names.index('flag')], flag_values)
+                columns[pk] = [blob_columns[names.index(field)][selected] for field in fields]
+
+            # the casts without blob are read from the table rows
+            pks = [pk for pk in pks if pk not in columns]
+            if len(pks) == 0:
+                return columns
+            pks_marks = ", ".join(["?"] * len(pks))
+
+        sql = "SELECT ssp_pk, %s FROM %s WHERE ssp_pk IN (%s)" \
+              % (", ".join([self.sample_columns[field] for field in fields]), table, pks_marks)
+        args = list(pks)
+        if flag_values is not None:
+            sql += " AND flag IN (%s)" % ", ".join(["?"] * len(flag_values))
+            args += flag_values
+        sql += " ORDER BY ssp_pk, rowid"
+
+        rows = cursor.execute(sql, args).fetchall()
+        if len(rows) == 0:
+            return columns
+
+        values = np.array(rows, dtype=np.float64)  # NULL values are converted to NaN
+        row_pks = values[:, 0].astype(np.int64)
+        unique_pks, starts = np.unique(row_pks, return_index=True)
+        ends = np.append(starts[1:], row_pks.size)
+        for pk, start, end in zip(unique_pks, starts, ends):
+            columns[int(pk)] = values[start:end, 1:].T
+
+        return columns
+
+    @staticmethod
+    def _make_samples(fields, columns):
+        if columns is None:  # no samples
+            columns = [np.zeros(0)] * len(fields)
+
+        samples = Samples()
+        samples.num_samples = len(columns[0])
+        for field, values in zip(fields, columns):
+            setattr(samples, field, values)
+        return samples
+
+    def climatology(self, pks=None, bbox=None, time_range=None, edges=None, field='speed', table='proc'):
+        """Aggregate by depth bins the values of many casts, as a project climatology
+
+        Args:
+            pks:            The pks of the casts (if None, the casts selected by bbox and time_range)
+            bbox:           (west, south, east, north) in degrees (see query_casts)
+            time_range:     (start, end) UTC datetimes (see query_casts)
+            edges:          The depth bin edges (if None, 10-m bins from 0 to 780 m)
+            field:          The aggregated samples field
+            table:          The sample table: 'data', 'proc', or 'sis'
+        Returns:
+            ProfileAggregate:   The per-bin statistics (None in case of errors)
+        """
+        if not self.conn:
+            logger.error("missing db connection")
+            return None
+
+        if pks is None:
+            casts = self.query_casts(bbox=bbox, time_range=time_range)
+            if casts is None:
+                return None
+            pks = [cast[0] for cast in casts]
+
+        if edges is None:
+            edges = ProfileAggregate.linear_edges()
+        aggregate = ProfileAggregate(edges=edges)
+
+        for _, samples in self.iter_profiles(pks=pks, tables=(table, ), fields=['depth', field]):
+            aggregate.add_samples(samples[table].depth, getattr(samples[table], field))
+
+        return aggregate
+
     def delete_profile_by_pk(self, pk):
         """Delete all the entries related to a SSP primary key"""
         self.tmp_ssp_pk = pk
 
         with self.conn:
+            self._begin_write()
             if not self._delete_old_ssp(full=True):
                 raise RuntimeError("unable to delete ssp with pk: %s" % pk)
 
         self.tmp_ssp_pk = None
         return True
 
-    def _updates_to_version_3(self, old_version):
+    def _create_indexes(self):
+        """Create (if missing) the indexes used to filter the samples by ssp pk, flag, source and depth"""
+
+        for table in ["data", "proc", "sis"]:
+            # noinspection SqlResolve
+            self.conn.execute("""
+                              CREATE INDEX IF NOT EXISTS %s_pk_flag_source_idx ON %s(ssp_pk, flag, source)
+                              """ % (table, table))
+
         # noinspection SqlResolve
+        self.conn.execute("""CREATE INDEX IF NOT EXISTS proc_pk_depth_idx ON proc(ssp_pk, depth)""")
 
-        # - 'ssp' table
         # noinspection SqlResolve
-        self.conn.execute("""ALTER TABLE ssp ADD COLUMN surveylines text NOT NULL DEFAULT ''""")
+        self.conn.execute("""CREATE INDEX IF NOT EXISTS ssp_pk_datetime_idx ON ssp_pk(cast_datetime)""")
+
+    def _create_summary_table(self):
+        """Create (if missing) the table with the per-cast summary values used to list the profiles"""
 
-        # - 'ssp_view' view
         # noinspection SqlResolve
-        self.conn.execute("""DROP VIEW ssp_view""")
+        self.conn.execute("""
+                          CREATE TABLE IF NOT EXISTS ssp_summary(
+                             pk integer NOT NULL,
+                             ss_at_min_depth real,
+                             min_depth real,
+                             max_depth real,
+                             max_raw_depth real,
+                             nr_data_samples integer NOT NULL DEFAULT 0,
+                             nr_proc_samples integer NOT NULL DEFAULT 0,
+                             nr_sis_samples integer NOT NULL DEFAULT 0,
+                             PRIMARY KEY (pk),
+                             FOREIGN KEY(pk) REFERENCES ssp(pk))
+                          """)
+
+    def _update_summary(self, pk=None):
+        """Compute and store the summary values of the cast with the passed pk (all the casts, if None)
+
+        The surface sound speed, min and max depth are from the valid processed samples, while the max raw depth
+        excludes the samples from the extensions.
+        """
+        valid = Dicts.flags['valid']
+        extensions = (Dicts.sources['woa09_ext'], Dicts.sources['woa13_ext'], Dicts.sources['woa18_ext'],
+                      Dicts.sources['rtofs_ext'], Dicts.sources['gomofs_ext'], Dicts.sources['ref_ext'])
+
+        sql = """
+              INSERT OR REPLACE INTO ssp_summary
+                 SELECT pk,
+                    (SELECT speed FROM proc WHERE ssp_pk=a.pk AND flag=%d ORDER BY rowid LIMIT 1),
+                    (SELECT depth FROM proc WHERE ssp_pk=a.pk AND flag=%d ORDER BY rowid LIMIT 1),
+                    (SELECT depth FROM proc WHERE ssp_pk=a.pk AND flag=%d ORDER BY rowid DESC LIMIT 1),
+                    (SELECT depth FROM proc WHERE ssp_pk=a.pk AND flag=%d AND source NOT IN (%s)
+                       ORDER BY rowid DESC LIMIT 1),
+                    (SELECT COUNT(*) FROM data WHERE ssp_pk=a.pk),
+                    (SELECT COUNT(*) FROM proc WHERE ssp_pk=a.pk),
+                    (SELECT COUNT(*) FROM sis WHERE ssp_pk=a.pk)
+                    FROM ssp a
+              """ % (valid, valid, valid, valid, ", ".join(["%d" % ext for ext in extensions]))
+
+        try:
+            if pk is None:
+                # noinspection SqlResolve
+                self.conn.execute(sql)
+            else:
+                # noinspection SqlResolve
+                self.conn.execute(sql + "WHERE pk=?", (pk,))
+
+        except sqlite3.Error as e:
+            logger.error("during ssp summary update, %s: %s" % (type(e), e))
+            return False
+
+        return True
+
+    def _create_blob_tables(self):
+        """Create (if missing) the tables used by the blob storage of the samples"""
 
-        # - 'library' table
+        # noinspection SqlResolve
+        self.conn.execute("""
+                          CREATE TABLE IF NOT EXISTS settings(
+                             name text PRIMARY KEY NOT NULL,
+                             value text NOT NULL)
+                          """)
+
+        # noinspection SqlResolve
+        self.conn.execute("""
+                          CREATE TABLE IF NOT EXISTS ssp_samples(
+                             ssp_pk integer NOT NULL,
+                             samples_table text NOT NULL,
+                             nr_samples integer NOT NULL,
+                             samples blob NOT NULL,
+                             PRIMARY KEY (ssp_pk, samples_table),
+                             FOREIGN KEY(ssp_pk) REFERENCES ssp(pk))
+                          """)
+
+    def _create_rtree(self):
+        """Create (if missing) the R*Tree used as spatio-temporal index of the casts"""
+
+        try:
+            # noinspection SqlResolve
+            self.conn.execute("""
+                              CREATE VIRTUAL TABLE IF NOT EXISTS ssp_rtree USING rtree(
+                                 id,
+                                 min_lon, max_lon,
+                                 min_lat, max_lat,
+                                 min_time, max_time)
+                              """)
+
+        except sqlite3.OperationalError as e:
+            logger.warning("unable to create the spatio-temporal index, %s: %s" % (type(e), e))
+            return False
+
+        self.has_rtree = True
+        return True
+
+    def _update_library_version(self, old_version, new_version):
         # noinspection SqlResolve
         self.conn.execute("""DELETE FROM library WHERE version=?""", (old_version,))
         # noinspection SqlResolve
         self.conn.execute("""
                           INSERT INTO library VALUES (?, ?, ?)
-                          """, (self.cur_version, "%s v.%s" % (lib_info.lib_name, lib_info.lib_version),
+                          """, (new_version, "%s v.%s" % (lib_info.lib_name, lib_info.lib_version),
                                 datetime.datetime.utcnow(),))
 
+    def _updates_to_version_3(self, old_version):
+        # noinspection SqlResolve
+
+        # - 'ssp' table
+        # noinspection SqlResolve
+        self.conn.execute("""ALTER TABLE ssp ADD COLUMN surveylines text NOT NULL DEFAULT ''""")
+
+        # - 'ssp_view' view
+        # noinspection SqlResolve
+        self.conn.execute("""DROP VIEW ssp_view""")
+
+        # - 'library' table
+        self._update_library_version(old_version=old_version, new_version=3)
+
+    def _updates_to_version_4(self, old_version):
+
+        # - indexes on the 'ssp_pk', 'data', 'proc', and 'sis' tables
+        self._create_indexes()
+
+        # - 'library' table
+        self._update_library_version(old_version=old_version, new_version=4)
+
+    def _updates_to_version_5(self, old_version):
+
+        # - 'ssp_summary' table, back-filled for the existing casts
+        self._create_summary_table()
+        if not self._update_summary():
+            raise sqlite3.Error("unable to back-fill ssp summary")
+
+        # - 'library' table
+        self._update_library_version(old_version=old_version, new_version=5)
+
+    def _updates_to_version_6(self, old_version):
+
+        # - 'settings' and 'ssp_samples' tables (the samples are still stored as rows)
+        self._create_blob_tables()
+
+        # - 'library' table
+        self._update_library_version(old_version=old_version, new_version=6)
+
+    def _updates_to_version_7(self, old_version):
+
+        # - 'ssp_rtree' table, back-filled for the existing casts
+        if self._create_rtree():
+            # noinspection SqlResolve
+            rows = self.conn.execute("""SELECT id, cast_datetime, cast_position FROM ssp_pk""").fetchall()
+            # noinspection SqlResolve
+            self.conn.executemany("""
+                                  INSERT OR REPLACE INTO ssp_rtree VALUES (?, ?, ?, ?, ?, ?, ?)
+                                  """, [self._rtree_entry(pk=row[0], utc_time=row[1], point=row[2]) for row in rows])
+
+        # - 'library' table
+        self._update_library_version(old_version=old_version, new_version=7)
+
     def __repr__(self):
         msg = "<%s>\n" % self.__class__.__name__
 
@@ -9,6 +9,8 @@ from mpl_toolkits.basemap import Basemap
 import matplotlib.pyplot as plt
 import logging
 
+from hyo2.soundspeed.profile.aggregate import ProfileAggregate
+
 matplotlib.use('qt5agg')
 logger = logging.getLogger(__name__)
 
@@ -162,57 +164,11 @@ class PlotDb:
             for t in x[m][1]:
                 t.set_color(color)
 
-    class AvgSsp:
-        def __init__(self):
-            # create and populate list used in the calculations
-            self.limits = list()  # bin limits
-            self.depths = list()  # avg depth for each bin
-            self.bins = list()  # a list of list with all the value within a bin
-
-            # populating
-            for i, z in enumerate(range(10, 781, 10)):
-                self.limits.append(z)
-                # self.depths.append(z + 5.)
-                self.bins.append(list())
-
-            # output lists
-            self.min_2std = list()
-            self.max_2std = list()
-            self.mean = list()
-
-        def add_samples(self, depths, values):
-
-            for i, d in enumerate(depths):
-
-                for j, lim in enumerate(self.limits):
-
-                    if d < lim:
-                        self.bins[j].append(values[i])
-                        break
-
-        def calc_avg(self):
+    def aggregate_plot(self, dates, output_folder, save_fig=False, edges=None):
+        """aggregate plot with all the SSPs between the passed dates
 
-            for i, i_bin in enumerate(self.bins):
-
-                # to avoid unstable statistics
-                if len(i_bin) < 3:
-                    continue
-
-                if i == 0:
-                    self.depths.append(0.)
-                elif i == (len(self.bins) - 1):
-                    self.depths.append(780.)
-                else:
-                    self.depths.append(self.limits[i] - 5.)
-
-                avg = np.mean(i_bin)
-                std = np.std(i_bin)
-                self.mean.append(avg)
-                self.min_2std.append(avg - 2 * std)
-                self.max_2std.append(avg + 2 * std)
-
-    def aggregate_plot(self, dates, output_folder, save_fig=False):
-        """aggregate plot with all the SSPs between the passed dates"""
+        The mean and the 2-sigma limits are calculated on the passed depth bin edges (by default, 10-m bins to 780 m)
+        """
 
         if not save_fig:
             plt.ion()
@@ -236,9 +192,11 @@ class PlotDb:
         plt.ylabel('Depth [m]', fontsize=10)
         ax.grid(linewidth=0.8, color=(0.3, 0.3, 0.3))
 
-        avg_ssp = PlotDb.AvgSsp()
+        if edges is None:
+            edges = ProfileAggregate.linear_edges()
+        avg_ssp = ProfileAggregate(edges=edges)
 
-        ssp_count = 0
+        pks = list()
         for ts_pk in ts_list:
 
             tmp_date = ts_pk[1].date()
@@ -246,24 +204,26 @@ class PlotDb:
             if (tmp_date < dates[0]) or (tmp_date > dates[1]):
                 continue
 
+            pks.append(ts_pk[0])
+
+        ssp_count = 0
+        for pk, samples in self.db.iter_profiles(pks=pks, fields=['depth', 'speed']):
             ssp_count += 1
-            # print(ts_pk[1], ts_pk[0])
-            tmp_ssp = self.db.profile_by_pk(ts_pk[0])
-            # print(tmp_ssp)
-            ax.plot(tmp_ssp.cur.proc.speed[tmp_ssp.cur.proc_valid], tmp_ssp.cur.proc.depth[tmp_ssp.cur.proc_valid], '.',
+            proc = samples['proc']
+            ax.plot(proc.speed, proc.depth, '.',
                     color=(0.85, 0.85, 0.85), markersize=2
                     # label='%s [%04d] ' % (ts_pk[0].time(), ts_pk[1])
                     )
 
-            avg_ssp.add_samples(tmp_ssp.cur.proc.depth[tmp_ssp.cur.proc_valid],
-                                tmp_ssp.cur.proc.speed[tmp_ssp.cur.proc_valid])
+            avg_ssp.add_samples(proc.depth, proc.speed)
 
-        avg_ssp.calc_avg()
-        ax.plot(avg_ssp.mean, avg_ssp.depths, '-b', linewidth=2)
-        ax.plot(avg_ssp.min_2std, avg_ssp.depths, '--b', linewidth=1)
-        ax.plot(avg_ssp.max_2std, avg_ssp.depths, '--b', linewidth=1)
+        # to avoid unstable statistics, only the bins with at least 3 samples are used
+        avg_depths, avg_mean, avg_std = avg_ssp.stats(min_count=3)
+        ax.plot(avg_mean, avg_depths, '-b', linewidth=2)
+        ax.plot(avg_mean - 2 * avg_std, avg_depths, '--b', linewidth=1)
+        ax.plot(avg_mean + 2 * avg_std, avg_depths, '--b', linewidth=1)
         # fill between std-curves
-        # ax.fill_betweenx(avg_ssp.depths, avg_ssp.min_2std, avg_ssp.max_2std, color='b', alpha='0.1')
+        # ax.fill_betweenx(avg_depths, avg_mean - 2 * avg_std, avg_mean + 2 * avg_std, color='b', alpha='0.1')
 
         if save_fig:
             plt.savefig(os.path.join(self.plots_folder(output_folder), 'aggregate_%s_%s.png' % (dates[0], dates[1])),
@@ -312,14 +272,14 @@ class PlotDb:
             ax.invert_yaxis()
 
         # plot each profile
-        for row in rows:
+        profiles = self.db.iter_profiles(pks=[row[0] for row in rows], fields=['depth', 'speed'])
+        for row, (_, samples) in zip(rows, profiles):
             row_date = row[1].date()  # 1 is the cast_datetime
             date_plots[row_date] += 1
 
             fig = plt.figure(date_list.index(row_date))
-            row_ssp = self.db.profile_by_pk(row[0])
-            fig.get_axes()[0].plot(row_ssp.cur.proc.speed[row_ssp.cur.proc_valid],
-                                   row_ssp.cur.proc.depth[row_ssp.cur.proc_valid],
+            fig.get_axes()[0].plot(samples['proc'].speed,
+                                   samples['proc'].depth,
                                    label='%s [%04d]' % (row[1].time(), row[0]))
 
         # print(date_plots)
@@ -0,0 +1,69 @@
+import os
+import threading
+import logging
+
+from hyo2.soundspeed.db.db import ProjectDb
+
+logger = logging.getLogger(__name__)
+
+
+class ProjectDbPool:
+    """Pool of the open project dbs, shared by the library across the GUI, listener and server threads
+
+    Since a sqlite3 connection should not be used by multiple threads at the same time, each thread gets its own
+    ProjectDb for a given project. The schema of a project db is only checked (and upgraded) when the db is opened
+    for the first time. The dbs opened by threads that have exited are closed at the next request to the pool.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._dbs = dict()  # (db path, thread) -> ProjectDb
+        self._checked = set()  # db paths with checked schema
+
+    def project_db(self, projects_folder, project_name):
+        """Return the open ProjectDb of the passed project for the calling thread"""
+        db_path = ProjectDb.make_db_path(projects_folder=projects_folder, project_name=project_name)
+        key = (db_path, threading.current_thread())
+
+        with self._lock:
+            self._close_exited()
+
+            db = self._dbs.get(key)
+            if (db is not None) and db.conn and os.path.exists(db_path):
+                return db
+
+            if not os.path.exists(db_path):
+                self.close(db_path=db_path)
+
+            db = ProjectDb(projects_folder=projects_folder, project_name=project_name,
+                           check_schema=db_path not in self._checked, pooled=True)
+            self._checked.add(db_path)
+            self._dbs[key] = db
+            # logger.debug("opened %s (%d open dbs)" % (db_path, len(self._dbs)))
+
+        return db
+
+    def close(self, db_path=None):
+        """Close the open dbs of the passed db path (or all of them, if None)"""
+        with self._lock:
+            for key in list(self._dbs.keys()):
+                if (db_path is not None) and (key[0] != db_path):
+                    continue
+                self._dbs.pop(key).disconnect()
+                self._checked.discard(key[0])
+
+    def _close_exited(self):
+        """Close the open dbs of the threads that have exited"""
+        for key in [key for key in self._dbs.keys() if not key[1].is_alive()]:
+            self._dbs.pop(key).disconnect()
+            # logger.debug("closed %s of exited thread %s" % key)
+
+    def close_project(self, projects_folder, project_name):
+        self.close(db_path=ProjectDb.make_db_path(projects_folder=projects_folder, project_name=project_name))
+
+    def __repr__(self):
+        msg = "<%s>\n" % self.__class__.__name__
+
+        msg += "  <open dbs: %d>" % len(self._dbs)
+
+        return msg
@@ -2,6 +2,8 @@ from abc import ABCMeta, abstractmethod  # , abstractproperty
 import os
 import logging
 
+import numpy as np
+
 logger = logging.getLogger(__name__)
 
 from hyo2.soundspeed.base.files import FileManager
@@ -42,6 +44,16 @@ class AbstractTextWriter(AbstractWriter, metaclass=ABCMeta):
     def __init__(self):
         super(AbstractTextWriter, self).__init__()
 
+    @classmethod
+    def _format_rows(cls, row_fmt, *columns):
+        """Render all the rows at once, applying the '%'-style row format to the passed (same-size) columns"""
+        nr_rows = len(columns[0])
+        if nr_rows == 0:
+            return str()
+
+        values = np.column_stack(columns).ravel().tolist()
+        return (row_fmt * nr_rows) % tuple(values)
+
     def _write(self, data_path, data_file, encoding='utf8', append=False, binary=False):
         """Helper function to write the raw file"""
 
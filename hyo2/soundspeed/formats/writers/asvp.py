@@ -82,45 +82,27 @@ class Asvp(AbstractTextWriter):
     def _write_body_abs(self, freq):
         # logger.debug('generating body for %d kHz' % freq)
 
-        ti = self.ssp.cur.sis_thinned
-
-        top_mean = 0
-        bottom_mean = 0
-
-        body = str()
-        sample_sz = int(np.sum(ti))
-        has_skipped_salinity = False
-        for i in range(sample_sz):
-
-            if self.ssp.cur.sis.sal[ti][i] <= 0:
-                if not has_skipped_salinity:
-                    logger.info("skipping invalid salinity values")
-                    has_skipped_salinity = True
-                continue
-
-            abs = Oc.attenuation(f=freq, t=self.ssp.cur.sis.temp[ti][i], d=self.ssp.cur.sis.depth[ti][i],
-                                 s=self.ssp.cur.sis.sal[ti][i], ph=8.1)
-
-            if i == 0:  # first
-                delta = (self.ssp.cur.sis.depth[ti][0] + self.ssp.cur.sis.depth[ti][1]) / 2.0
-
-            elif i == sample_sz - 1:  # last
-                delta = (self.ssp.cur.sis.depth[ti][sample_sz - 1] -
-                         (self.ssp.cur.sis.depth[ti][sample_sz - 1] + self.ssp.cur.sis.depth[ti][sample_sz - 2]) / 2.0)
-
-            else:
-                delta = ((self.ssp.cur.sis.depth[ti][i + 1] + self.ssp.cur.sis.depth[ti][i]) / 2.0 -
-                         (self.ssp.cur.sis.depth[ti][i] + self.ssp.cur.sis.depth[ti][i - 1]) / 2.0)
-
-            top_mean += abs * delta
-            bottom_mean += delta
-
-            mean_abs = top_mean / bottom_mean
-
-            body += "%.3f %.3f %.3f %s\n" \
-                    % (self.ssp.cur.sis.depth[ti][i], abs, mean_abs, "999.000")
-
-        self.fod.io.write(body)
+        sis = self.ssp.cur.sis_view('thinned')
+        depths = sis.depth
+        if sis.num_samples == 0:
+            self.fod.io.close()
+            return
+
+        # layer thickness around each sample (half-way between the neighbors)
+        mids = (depths[1:] + depths[:-1]) / 2.0
+        deltas = np.empty_like(depths)
+        deltas[0] = mids[0]
+        deltas[1:-1] = np.diff(mids)
+        deltas[-1] = depths[-1] - mids[-1]
+
+        valid = ~(sis.sal <= 0)  # only the non-positive values are skipped (NaN values are kept)
+        if not valid.all():
+            logger.info("skipping invalid salinity values")
+
+        abs = Oc.attenuation(f=freq, t=sis.temp[valid], d=depths[valid], s=sis.sal[valid], ph=8.1)
+        mean_abs = np.cumsum(abs * deltas[valid]) / np.cumsum(deltas[valid])
+
+        self.fod.io.write(self._format_rows("%.3f %.3f %.3f 999.000\n", depths[valid], abs, mean_abs))
         self.fod.io.close()
 
     def convert(self, ssp, fmt):
@@ -154,23 +136,18 @@ class Asvp(AbstractTextWriter):
         return self.header
 
     def _convert_body(self, fmt):
-        body = str()
-
-        ti = self.ssp.cur.sis_thinned
-        depths = self.ssp.cur.sis.depth[ti]
-        speeds = self.ssp.cur.sis.speed[ti]
-        temps = self.ssp.cur.sis.temp[ti]
-        sals = self.ssp.cur.sis.sal[ti]
-
-        for i in range(int(np.sum(ti))):
-            if (fmt == Dicts.kng_formats['S00']) or (fmt == Dicts.kng_formats['S10']):
-                body += "%.2f,%.1f,,,\r\n" % (depths[i], speeds[i])
-            elif (fmt == Dicts.kng_formats['S01']) or (fmt == Dicts.kng_formats['S12']):
-                body += "%.2f,%.1f,%.2f,%.2f,\r\n" % (depths[i], speeds[i], temps[i], sals[i])
-            elif (fmt == Dicts.kng_formats['S02']) or (fmt == Dicts.kng_formats['S22']):
-                body += "%.2f,,%.2f,%.2f,\r\n" % (depths[i], temps[i], sals[i])
-            elif fmt == Dicts.kng_formats['ASVP']:
-                body += "%.2f %.2f\n" % (depths[i], speeds[i])
+        sis = self.ssp.cur.sis_view('thinned')
+
+        if (fmt == Dicts.kng_formats['S00']) or (fmt == Dicts.kng_formats['S10']):
+            body = self._format_rows("%.2f,%.1f,,,\r\n", sis.depth, sis.speed)
+        elif (fmt == Dicts.kng_formats['S01']) or (fmt == Dicts.kng_formats['S12']):
+            body = self._format_rows("%.2f,%.1f,%.2f,%.2f,\r\n", sis.depth, sis.speed, sis.temp, sis.sal)
+        elif (fmt == Dicts.kng_formats['S02']) or (fmt == Dicts.kng_formats['S22']):
+            body = self._format_rows("%.2f,,%.2f,%.2f,\r\n", sis.depth, sis.temp, sis.sal)
+        elif fmt == Dicts.kng_formats['ASVP']:
+            body = self._format_rows("%.2f %.2f\n", sis.depth, sis.speed)
+        else:
+            body = str()
 
         if fmt == Dicts.kng_formats['ASVP']:
             return body
@@ -1,5 +1,4 @@
 import logging
-import numpy as np
 
 from hyo2.soundspeed.formats.writers.abstract import AbstractTextWriter
 
@@ -58,17 +57,13 @@ class Calc(AbstractTextWriter):
         return header
 
     def _convert_body(self):
-        body = str()
-        vi = self.ssp.cur.proc_valid
+        sis = self.ssp.cur.sis.select(self.ssp.cur.proc_valid)
+        positive = ~(sis.depth < 0.0)
+        body = self._format_rows("%5.1f %4.2f %1.3f\n", sis.depth[positive], sis.speed[positive], sis.temp[positive])
 
         last_depth = None
-        for i in range(np.sum(vi)):
-            if self.ssp.cur.sis.depth[vi][i] < 0.0:
-                continue
-            body += "%5.1f %4.2f %1.3f\n" % (self.ssp.cur.sis.depth[vi][i],
-                                             self.ssp.cur.sis.speed[vi][i],
-                                             self.ssp.cur.sis.temp[vi][i])
-            last_depth = self.ssp.cur.sis.depth[vi][i]
+        if positive.any():
+            last_depth = sis.depth[positive][-1]
 
         body += " 0  0  0\n"
         body += "*** NAV ****\n"
@@ -2,8 +2,6 @@ import math
 import datetime
 import logging
 
-import numpy as np
-
 from hyo2.soundspeed.formats.writers.abstract import AbstractTextWriter
 
 logger = logging.getLogger(__name__)
@@ -77,8 +75,5 @@ class Caris(AbstractTextWriter):
 
     def _write_body(self):
         # logger.debug('generating body')
-        vi = self.ssp.cur.proc_valid
-        # noinspection PyTypeChecker
-        for idx in range(np.sum(vi)):
-            self.fod.io.write("%.6f %.6f\r\n"
-                              % (self.ssp.cur.proc.depth[vi][idx], self.ssp.cur.proc.speed[vi][idx],))
+        proc = self.ssp.cur.proc_view('valid')
+        self.fod.io.write(self._format_rows("%.6f %.6f\r\n", proc.depth, proc.speed))
@@ -1,4 +1,3 @@
-import numpy as np
 import logging
 
 logger = logging.getLogger(__name__)
@@ -52,7 +51,5 @@ class Csv(AbstractTextWriter):
 
     def _write_body(self):
         # logger.debug('generating body')
-        vi = self.ssp.cur.proc_valid
-        for idx in range(np.sum(vi)):
-            self.fod.io.write("%.2f,%.2f\n"
-                              % (self.ssp.cur.proc.depth[vi][idx], self.ssp.cur.proc.speed[vi][idx],))
+        proc = self.ssp.cur.proc_view('valid')
+        self.fod.io.write(self._format_rows("%.2f,%.2f\n", proc.depth, proc.speed))
@@ -1,4 +1,3 @@
-import numpy as np
 import logging
 
 logger = logging.getLogger(__name__)
@@ -42,12 +41,8 @@ class Elac(AbstractTextWriter):
 
     def _write_body(self):
         # logger.debug('generating body')
-        vi = self.ssp.cur.proc_valid
-        for idx in range(np.sum(vi)):
-            self.fod.io.write("%8.2f%10.2f%10.2f%10.2f%10.2f\n"
-                              % (self.ssp.cur.proc.depth[vi][idx], self.ssp.cur.proc.speed[vi][idx],
-                                 self.ssp.cur.proc.temp[vi][idx], self.ssp.cur.proc.sal[vi][idx],
-                                 Oc.s2c(s=self.ssp.cur.proc.sal[vi][idx],
-                                        p=Oc.d2p(d=self.ssp.cur.proc.depth[vi][idx],
-                                                 lat=self.ssp.cur.meta.latitude),
-                                        t=self.ssp.cur.proc.temp[vi][idx])))
+        proc = self.ssp.cur.proc_view('valid')
+        pressure = Oc.d2p(d=proc.depth, lat=self.ssp.cur.meta.latitude)
+        conductivity = Oc.s2c(s=proc.sal, p=pressure, t=proc.temp)
+        self.fod.io.write(self._format_rows("%8.2f%10.2f%10.2f%10.2f%10.2f\n", proc.depth, proc.speed, proc.temp,
+                                            proc.sal, conductivity))
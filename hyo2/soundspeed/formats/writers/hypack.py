@@ -1,4 +1,3 @@
-import numpy as np
 import logging
 
 from hyo2.soundspeed.formats.writers.abstract import AbstractTextWriter
@@ -39,7 +38,5 @@ class Hypack(AbstractTextWriter):
 
     def _write_body(self):
         # logger.debug('generating body')
-        vi = self.ssp.cur.proc_valid
-        for idx in range(np.sum(vi)):
-            self.fod.io.write("%.1f %.1f\n"
-                              % (self.ssp.cur.proc.depth[vi][idx], self.ssp.cur.proc.speed[vi][idx],))
+        proc = self.ssp.cur.proc_view('valid')
+        self.fod.io.write(self._format_rows("%.1f %.1f\n", proc.depth, proc.speed))
@@ -60,24 +60,21 @@ class Qps(AbstractTextWriter):
             _flags = 2 ** 1  # Oceanographic Model
         else:
             _flags = 2 ** 2  # User designated
-        vi = self.ssp.cur.proc_valid
-        for idx in range(np.sum(vi)):
-            depth = self.ssp.cur.proc.depth[vi][idx]
-            speed = self.ssp.cur.proc.speed[vi][idx]
-            temperature = self.ssp.cur.proc.temp[vi][idx]
-            salinity = self.ssp.cur.proc.sal[vi][idx]
-            pressure = self.ssp.cur.proc.pressure[vi][idx]
-            conductivity = self.ssp.cur.proc.conductivity[vi][idx]
-            source = self.ssp.cur.proc.source[vi][idx]
-            if source == Dicts.sources['raw']:
-                flags = _flags
-            elif source == Dicts.sources['user']:
-                flags = 2 ** 2 + 2 ** 17  # User designated and Added (by user)
-            elif source == Dicts.sources['rtofs_ext']:
-                flags = 2 ** 1  # Oceanographic Model
-            else:
-                flags = 2 ** 2  # User designated
+        proc = self.ssp.cur.proc_view('valid')
+        flags = np.select([proc.source == Dicts.sources['raw'],
+                           proc.source == Dicts.sources['user'],
+                           proc.source == Dicts.sources['rtofs_ext']],
+                          [_flags,
+                           2 ** 2 + 2 ** 17,  # User designated and Added (by user)
+                           2 ** 1],  # Oceanographic Model
+                          2 ** 2)  # User designated
 
-            data = struct.pack('iffffffI', idx, depth, speed, temperature, salinity, pressure, conductivity, flags)
-            # data = '%i %.1f %.1f %.1f %.1f %.1f %.1f %i\n' % (idx, depth, speed, temperature, salinity, pressure, conductivity, flags)
-            self.fod.io.write(data)
+        # same layout of struct.pack('iffffffI', idx, depth, speed, temp, sal, pressure, conductivity, flags)
+        data = np.empty(proc.num_samples, dtype=[('idx', '=i4'), ('depth', '=f4'), ('speed', '=f4'), ('temp', '=f4'),
+                                                 ('sal', '=f4'), ('pressure', '=f4'), ('conductivity', '=f4'),
+                                                 ('flags', '=u4')])
+        data['idx'] = np.arange(proc.num_samples)
+        for name in ['depth', 'speed', 'temp', 'sal', 'pressure', 'conductivity']:
+            data[name] = getattr(proc, name)
+        data['flags'] = flags
+        self.fod.io.write(data.tobytes())
@@ -71,8 +71,6 @@ class Unb(AbstractTextWriter):
 
     def _write_body(self):
         # logger.debug('generating body')
-        vi = self.ssp.cur.proc_valid
-        for idx in range(np.sum(vi)):
-            self.fod.io.write("%d %.3f %.3f %.3f %.3f 0.000 0\n"
-                              % (idx + 1, self.ssp.cur.proc.depth[vi][idx], self.ssp.cur.proc.speed[vi][idx],
-                                 self.ssp.cur.proc.temp[vi][idx], self.ssp.cur.proc.sal[vi][idx]))
+        proc = self.ssp.cur.proc_view('valid')
+        self.fod.io.write(self._format_rows("%d %.3f %.3f %.3f %.3f 0.000 0\n", np.arange(1, proc.num_samples + 1),
+                                            proc.depth, proc.speed, proc.temp, proc.sal))
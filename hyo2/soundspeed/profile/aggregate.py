@@ -0,0 +1,95 @@
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ProfileAggregate:
+    """Per-depth-bin statistics (count, mean, and standard deviation) of the values of many profiles
+
+    The bins are defined by increasing edges, with the i-th bin as [edges[i], edges[i + 1]).
+    Each added profile is binned in a single pass, and the bins are combined with the parallel variant of the
+    Welford's algorithm (Chan et al.), so that partial aggregates (e.g., computed in parallel) can be merged.
+    """
+
+    def __init__(self, edges):
+        self.edges = np.asarray(edges, dtype=np.float64)
+        if (self.edges.ndim != 1) or (self.edges.size < 2) or not (np.diff(self.edges) > 0).all():
+            raise RuntimeError("invalid bin edges: %s" % (edges, ))
+
+        self.count = np.zeros(self.nr_bins, dtype=np.int64)
+        self.mean = np.zeros(self.nr_bins)
+        self.m2 = np.zeros(self.nr_bins)  # sum of the squared differences from the mean
+
+    @classmethod
+    def linear_edges(cls, max_depth=780.0, step=10.0, min_depth=0.0):
+        """Edges of bins with constant size"""
+        return np.arange(min_depth, max_depth + step / 2.0, step)
+
+    @classmethod
+    def log_edges(cls, max_depth=12000.0, nr_bins=60, first_edge=5.0):
+        """Edges of bins growing logarithmically with depth (the first bin from the surface to 'first_edge')"""
+        return np.append(0.0, np.geomspace(first_edge, max_depth, nr_bins))
+
+    @property
+    def nr_bins(self):
+        return self.edges.size - 1
+
+    @property
+    def depths(self):
+        """The central depth of each bin"""
+        return (self.edges[:-1] + self.edges[1:]) / 2.0
+
+    @property
+    def variance(self):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.count > 0, self.m2 / self.count, np.nan)
+
+    @property
+    def std(self):
+        return np.sqrt(self.variance)
+
+    def add_samples(self, depths, values):
+        """Add the values of a profile, binned by the corresponding depths (out-of-range samples are skipped)"""
+        depths = np.asarray(depths, dtype=np.float64)
+        values = np.asarray(values, dtype=np.float64)
+
+        idx = np.searchsorted(self.edges, depths, side='right') - 1
+        inside = (idx >= 0) & (idx < self.nr_bins)
+        idx = idx[inside]
+        values = values[inside]
+
+        count = np.bincount(idx, minlength=self.nr_bins)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.bincount(idx, weights=values, minlength=self.nr_bins) / count
+        m2 = np.bincount(idx, weights=(values - mean[idx]) ** 2, minlength=self.nr_bins)
+
+        self._combine(count, mean, m2)
+
+    def merge(self, other):
+        """Merge the statistics of another aggregate with the same bin edges"""
+        if not np.array_equal(self.edges, other.edges):
+            raise RuntimeError("unable to merge aggregates with different bin edges")
+
+        self._combine(other.count, other.mean, other.m2)
+
+    def _combine(self, count, mean, m2):
+        total = self.count + count
+        used = count > 0
+        delta = mean[used] - self.mean[used]
+        self.mean[used] += delta * count[used] / total[used]
+        self.m2[used] += m2[used] + delta ** 2 * self.count[used] * count[used] / total[used]
+        self.count = total
+
+    def stats(self, min_count=3):
+        """Return depths, mean, and standard deviation of the bins with at least 'min_count' values"""
+        enough = self.count >= min_count
+        return self.depths[enough], self.mean[enough], self.std[enough]
+
+    def __repr__(self):
+        msg = "<%s>\n" % self.__class__.__name__
+
+        msg += "  <bins: %d [%.1f, %.1f]>\n" % (self.nr_bins, self.edges[0], self.edges[-1])
+        msg += "  <values: %d>\n" % self.count.sum()
+
+        return msg
@@ -155,8 +155,17 @@ class Oceanography:
             s: salinity in practical salinity units (ppt)
             lat: latitude in decimal degree
 
+        Depth, temperature and salinity can be arrays (to process a whole cast in one call).
+
         Returns: sound speed in m/s
         """
+        cwtp, atp, btp, dtp = cls._speed_coefficients(d=d, t=t, lat=lat)
+
+        return cwtp + atp * s + btp * s ** 1.5 + dtp * s ** 2
+
+    @classmethod
+    def _speed_coefficients(cls, d, t, lat):
+        """Return the coefficients of the salinity terms of the speed() polynomial (that only depend on d and t)"""
 
         p = cls.d2p_backup(d, lat) / 10  # pressure in bar
 
@@ -220,12 +229,59 @@ class Oceanography:
                (c20 + c21 * t + c22 * t ** 2 + c23 * t ** 3 + c24 * t ** 4) * p ** 2 + \
                (c30 + c31 * t + c32 * t ** 2) * p ** 3
 
-        return cwtp + atp * s + btp * s ** 1.5 + dtp * s ** 2
+        return cwtp, atp, btp, dtp
+
+    @classmethod
+    def sal(cls, d, speed, t, lat=30, tolerance=0.0005, max_iterations=20):
+        """Calculate the salinity inverting the speed() method with the Newton's method
+
+        The salinity is bounded in the 0 - 50 ppt range (as in sal_bisection()).
+
+        Args:
+            d: depth in meter
+            speed: sound speed in m/sec
+            t: temperature in deg Celsius
+            lat: latitude in decimal degree
+            tolerance: max difference in m/sec between the passed speed and the one of the calculated salinity
+            max_iterations: max number of Newton's iterations
+
+        Depth, sound speed and temperature can be arrays (to process a whole cast in one call).
+
+        Returns:  Salinity in PSU (ppt)
+
+        """
+        is_scalar = np.ndim(d) == 0 and np.ndim(speed) == 0 and np.ndim(t) == 0
+        speed = np.asarray(speed, dtype=np.float64)
+        cwtp, atp, btp, dtp = cls._speed_coefficients(d=np.asarray(d, dtype=np.float64),
+                                                      t=np.asarray(t, dtype=np.float64), lat=lat)
+
+        salinity = np.full(np.broadcast(speed, cwtp).shape, 35.0)
+        for _ in range(max_iterations):
+            diff = cwtp + atp * salinity + btp * salinity ** 1.5 + dtp * salinity ** 2 - speed
+            # the samples at the range limits with the root outside of the range are also converged
+            converged = (np.abs(diff) <= tolerance) | ~np.isfinite(diff) \
+                | ((salinity == 0.0) & (diff > 0.0)) | ((salinity == 50.0) & (diff < 0.0))
+            if converged.all():
+                break
+
+            slope = atp + 1.5 * btp * np.sqrt(salinity) + 2.0 * dtp * salinity
+            salinity = np.where(converged, salinity, np.clip(salinity - diff / slope, 0.0, 50.0))
+
+        else:
+            logger.warning("too many iterations to obtain the salinity value")
+
+        salinity[~np.isfinite(speed + cwtp)] = np.nan
+
+        if is_scalar:
+            return float(salinity)
+        return salinity
 
     @classmethod
-    def sal(cls, d, speed, t, lat=30):
+    def sal_bisection(cls, d, speed, t, lat=30):
         """Iteratively calculate the salinity based on the speed() method
 
+        Scalar reference for sal(), using bisection.
+
         Args:
             d: depth in meter
             speed: sound speed in m/sec
@@ -319,26 +375,69 @@ class Oceanography:
         h = pr - p
         xk = h * cls.atg(s=s, t=t, p=p)
 
-        t += + 0.5 * xk
+        # not in-place, to leave untouched the passed arrays
+        t = t + 0.5 * xk
         q = xk
-        p += 0.5 * h
+        p = p + 0.5 * h
         xk = h * cls.atg(s=s, t=t, p=p)
 
-        t += 0.29289322 * (xk - q)
+        t = t + 0.29289322 * (xk - q)
         q = 0.58578644 * xk + 0.121320344 * q
         xk = h * cls.atg(s=s, t=t, p=p)
 
-        t += 1.707106781 * (xk - q)
+        t = t + 1.707106781 * (xk - q)
         q = 3.414213562 * xk - 4.121320344 * q
-        p += 0.5 * h
+        p = p + 0.5 * h
         xk = h * cls.atg(s=s, t=t, p=p)
 
         return t + (xk - 2.0 * q) / 6.0
 
     @classmethod
-    def in_situ_temp(cls, s, t, p, pr):
+    def in_situ_temp(cls, s, t, p, pr, tolerance=0.0001, max_iterations=20):
+        """Compute in-situ temperature at pressure, inverting the pot_temp() method with the Newton's method
+
+        Args:
+            s: salinity in PSU ppt
+            t: potential temperature at the reference pressure
+            p: pressure
+            pr: reference pressure
+            tolerance: max difference in deg C between the passed potential temperature and the calculated one
+            max_iterations: max number of Newton's iterations
+
+        Salinity, temperature and pressure can be arrays (to process a whole cast in one call).
+
+        Returns: in-situ temperature in deg C
+        """
+        is_scalar = np.ndim(s) == 0 and np.ndim(t) == 0 and np.ndim(p) == 0
+        s = np.asarray(s, dtype=np.float64)
+        t = np.asarray(t, dtype=np.float64)
+        p = np.asarray(p, dtype=np.float64)
+
+        temp = np.array(np.broadcast_to(t, np.broadcast(s, t, p).shape), dtype=np.float64)
+        dt = 0.001  # step for the numerical derivative
+        for _ in range(max_iterations):
+            diff = cls.pot_temp(s=s, t=temp, p=p, pr=pr) - t
+            converged = (np.abs(diff) <= tolerance) | np.isnan(diff)
+            if converged.all():
+                break
+
+            slope = (cls.pot_temp(s=s, t=temp + dt, p=p, pr=pr) - cls.pot_temp(s=s, t=temp - dt, p=p, pr=pr)) \
+                / (2.0 * dt)
+            temp = np.where(converged, temp, temp - diff / slope)
+
+        else:
+            logger.warning("too many iterations to obtain the in-situ temperature value")
+
+        if is_scalar:
+            return float(temp)
+        return temp
+
+    @classmethod
+    def in_situ_temp_stepping(cls, s, t, p, pr):
         """Compute in-situ temperature at pressure
 
+        Scalar reference for in_situ_temp(), stepping the temperature by 0.001 deg C.
+
         Args:
             s: salinity in PSU ppt
             t: temperature
@@ -444,8 +543,55 @@ class Oceanography:
 
     @classmethod
     def s2c(cls, s, p, t):
+        """Calculate conductivity, bisecting the 0.1 mmho/cm steps of s2c_stepping() for all the samples at once
+
+        Args:
+            s: salinity in psu
+            p: pressure in dBar
+            t: temperature in deg Celsisu
+
+        Salinity, pressure and temperature can be arrays (to process a whole cast in one call).
+
+        Returns: Conductivity mmho/cm
+        """
+        is_scalar = np.ndim(s) == 0 and np.ndim(p) == 0 and np.ndim(t) == 0
+        s, p, t = np.broadcast_arrays(np.asarray(s, dtype=np.float64), np.asarray(p, dtype=np.float64),
+                                      np.asarray(t, dtype=np.float64))
+
+        # the conductivity steps (accumulated as in s2c_stepping), with the step where the stepping stops
+        steps = np.add.accumulate(np.r_[0.0, np.full(1100, 0.1)])
+        steps = steps[:np.count_nonzero(steps < 100) + 1]
+        nr_steps = steps.size - 1
+
+        # first step with a salinity larger than the passed one (nr_steps if none)
+        low = np.zeros(s.shape, dtype=np.intp)
+        high = np.full(s.shape, nr_steps, dtype=np.intp)
+        with np.errstate(invalid='ignore'):
+            while (low < high).any():
+                mid = (low + high) // 2
+                above = cls.c2s(steps[mid], p, t) > s
+                searching = low < high
+                high = np.where(searching & above, mid, high)
+                low = np.where(searching & ~above, mid + 1, low)
+
+            c = steps[low]
+            last_c = np.where(low > 0, steps[np.maximum(low - 1, 0)], 0.0)
+            last_s = np.where(low > 0, cls.c2s(last_c, p, t), -1.0)
+            # out of range, s2c_stepping divides by a null salinity step (returning inf, or nan for a nan salinity)
+            calc_s = np.where(low == nr_steps, last_s, cls.c2s(c, p, t))
+            with np.errstate(divide='ignore'):
+                conductivity = last_c + (c - last_c) / (calc_s - last_s) * (s - last_s)
+
+        if is_scalar:
+            return float(conductivity)
+        return conductivity
+
+    @classmethod
+    def s2c_stepping(cls, s, p, t):
         """Calculate conductivity iteratively
 
+        Scalar reference for s2c(), stepping the conductivity by 0.1 mmho/cm.
+
         Args:
             s: salinity in psu
             p: pressure in dBar
@@ -714,6 +860,11 @@ class Oceanography:
         # S Salinity (ppt)
         # D Depth (m)
         # pH Acidity
+        # Temperature, salinity and depth can be arrays (to process a whole cast in one call)
+        is_scalar = np.ndim(t) == 0 and np.ndim(s) == 0 and np.ndim(d) == 0
+        t = np.asarray(t, dtype=np.float64)
+        s = np.asarray(s, dtype=np.float64)
+        d = np.asarray(d, dtype=np.float64)
         abs_temp = 273.0 + t
 
         # sound speed calculation
@@ -723,18 +874,17 @@ class Oceanography:
         A1 = (8.86 / c) * math.pow(10.0, (0.78 * ph - 5.0))
         P1 = 1.0
 
-        f1 = 2.8 * math.pow((s / 35.0), 0.5) * math.pow(10.0, 4.0 - (1245.0 / abs_temp))
+        f1 = 2.8 * np.power((s / 35.0), 0.5) * np.power(10.0, 4.0 - (1245.0 / abs_temp))
 
         # MgSO4 Contribution
         A2 = (21.44 * s / c) * (1.0 + 0.025 * t)
         P2 = (1.0 - 1.37E-4 * d) + (6.2E-9 * d * d)
-        f2 = (8.17 * math.pow(10.0, 8.0 - 1990.0 / abs_temp)) / (1.0 + 0.0018 * (s - 35.0))
+        f2 = (8.17 * np.power(10.0, 8.0 - 1990.0 / abs_temp)) / (1.0 + 0.0018 * (s - 35.0))
 
         # Pure Water Contribution
-        if t <= 20.0:
-            A3 = 4.937E-4 - 2.59E-5 * t + 9.11E-7 * t * t - 1.50E-8 * t * t * t
-        else:
-            A3 = 3.964E-4 - 1.146E-5 * t + 1.45E-7 * t * t - 6.5E-10 * t * t * t
+        A3 = np.where(t <= 20.0,
+                      4.937E-4 - 2.59E-5 * t + 9.11E-7 * t * t - 1.50E-8 * t * t * t,
+                      3.964E-4 - 1.146E-5 * t + 1.45E-7 * t * t - 6.5E-10 * t * t * t)
 
         P3 = 1.0 - 3.83E-5 * d + 4.9E-10 * d * d
 
@@ -744,4 +894,6 @@ class Oceanography:
 
         atten = boric + magnes + purewat
 
+        if is_scalar:
+            return float(atten)
         return atten
@@ -142,37 +142,58 @@ class Profile:
     @property
     def data_valid(self):
         """Return indices of valid data"""
-        return np.equal(self.data.flag, Dicts.flags['valid'])
+        return self.data.mask(Dicts.flags['valid'])
 
     @property
     def proc_valid(self):
         """Return indices of valid proc samples"""
-        return np.equal(self.proc.flag, Dicts.flags['valid'])
+        return self.proc.mask(Dicts.flags['valid'])
 
     @property
     def nr_valid_proc_samples(self):
         """Return the number of valid proc samples"""
-        return len(self.proc.depth[self.proc_valid])
+        return np.count_nonzero(self.proc_valid)
 
     @property
     def proc_dqa_valid(self):
         """Return indices of DQA valid proc samples"""
-        return np.logical_and(self.proc_valid, np.equal(self.proc.source, Dicts.sources['raw']))
+        return self.proc.mask(Dicts.flags['valid'], source=Dicts.sources['raw'])
 
     @property
     def sis_valid(self):
         """Return indices of valid sis samples"""
-        return np.equal(self.sis.flag, Dicts.flags['valid'])
+        return self.sis.mask(Dicts.flags['valid'])
 
     @property
     def sis_thinned(self):
         """Return indices of thinned sis samples"""
-        return np.equal(self.sis.flag, Dicts.flags['thin'])
+        return self.sis.mask(Dicts.flags['thin'])
 
     @property
     def proc_invalid_direction(self):
         """Return indices of invalid data for direction"""
-        return np.equal(self.proc.flag, Dicts.flags['direction'])  # numpy 1.10.4 if a warning
+        return self.proc.mask(Dicts.flags['direction'])
+
+    def data_view(self, selection='valid'):
+        """Return a copy of the raw data samples for the passed selection ('valid')"""
+        return self.data.select(self._selection_mask('data', selection))
+
+    def proc_view(self, selection='valid'):
+        """Return a copy of the proc samples for the passed selection ('valid', 'dqa_valid', 'invalid_direction')
+
+        The selected samples are copied at each call, so take the view once outside of per-sample loops.
+        """
+        return self.proc.select(self._selection_mask('proc', selection))
+
+    def sis_view(self, selection='thinned'):
+        """Return a copy of the sis samples for the passed selection ('valid', 'thinned')"""
+        return self.sis.select(self._selection_mask('sis', selection))
+
+    def _selection_mask(self, samples, selection):
+        try:
+            return getattr(self, "%s_%s" % (samples, selection))
+        except AttributeError:
+            raise RuntimeError("unknown %s selection: %s" % (samples, selection))
 
     @property
     def proc_depth_min(self):
@@ -336,60 +357,36 @@ class Profile:
 
         # Calculate local mean and std dev for each sample, use 2 neighbors on either sides.
         # Endpoints treated separately. Target: single point fliers
-        for i in range(2, nr_samples - 2):
-            speed_sum = 0
-            speed_sum_sq = 0
-            for k in range(-2, 3):
-                if k == 0:  # skip itself
-                    continue
-                speed_sum += speed[i + k]
-                speed_sum_sq += speed[i + k] * speed[i + k]
-
-            variance = ((4 * speed_sum_sq) - speed_sum * speed_sum) / (4 * 3)  # unbiased variance
-            speed_mean[i] = speed_sum / 4
-            if variance < 0:
-                variance = 0
-            sigma[i] = np.sqrt(variance)  # Local standard deviation
-            if sigma[i] < sigma_min_th:
-                sigma[i] = sigma_min_th
+        speed_sq = speed * speed
+        speed_sum = speed[:-4] + speed[1:-3] + speed[3:-1] + speed[4:]  # skip itself
+        speed_sum_sq = speed_sq[:-4] + speed_sq[1:-3] + speed_sq[3:-1] + speed_sq[4:]
+        variance = ((4 * speed_sum_sq) - speed_sum * speed_sum) / (4 * 3)  # unbiased variance
+        speed_mean[2:nr_samples - 2] = speed_sum / 4
+        sigma[2:nr_samples - 2] = np.sqrt(np.maximum(variance, 0))  # Local standard deviation
+        sigma = np.maximum(sigma, sigma_min_th)
 
         # Endpoints (use only three neighboring points). Relax tolerance.
         c_end = 1.3  # Relaxed tolerance factor at endpoints.
-        ends_i = [0, 1, nr_samples - 2, nr_samples - 1]
-        index = [(1, 2, 3), (0, 2, 3), (nr_samples - 4, nr_samples - 3, nr_samples - 1),
-                 (nr_samples - 4, nr_samples - 3, nr_samples - 2)]
-        for k in range(4):
-            speed_sum = 0
-            speed_sum_sq = 0
-            i = ends_i[k]  # Point number
-            for j in range(3):
-                ind_kj = index[k][j]
-                speed_sum += speed[ind_kj]
-                speed_sum_sq += speed[ind_kj] * speed[ind_kj]
-
-            variance = ((3 * speed_sum_sq) - speed_sum * speed_sum) / (3 * 2)  # unbiased variance
-            speed_mean[i] = speed_sum / 3
-            if variance < 0:
-                variance = 0
-            sigma[i] = np.sqrt(variance)
-            if sigma[i] < sigma_min_th:
-                sigma[i] = sigma_min_th
-            sigma[i] *= c_end  # Relax tolerance for end pts
+        ends_i = np.array([0, 1, nr_samples - 2, nr_samples - 1])
+        index = np.array([(1, 2, 3), (0, 2, 3), (nr_samples - 4, nr_samples - 3, nr_samples - 1),
+                          (nr_samples - 4, nr_samples - 3, nr_samples - 2)])
+        speed_sum = speed[index[:, 0]] + speed[index[:, 1]] + speed[index[:, 2]]
+        speed_sum_sq = speed_sq[index[:, 0]] + speed_sq[index[:, 1]] + speed_sq[index[:, 2]]
+        variance = ((3 * speed_sum_sq) - speed_sum * speed_sum) / (3 * 2)  # unbiased variance
+        speed_mean[ends_i] = speed_sum / 3
+        sigma[ends_i] = np.maximum(np.sqrt(np.maximum(variance, 0)), sigma_min_th) * c_end  # Relax tolerance
 
         # identify the sample to filter
         nr_std_dev = 2  # number of standard deviations to use for error band.
         tolerance_factor = 1.3  # Tolerance factor.
         depth_th = 33.0  # Depth at which to relax error band.
-        factor = tolerance_factor
-        stat_filtered = np.zeros(nr_samples, dtype=bool)
-        for i in range(nr_samples):
-            if depth[i] > depth_th:
-                factor = 1.0
-            th = factor * nr_std_dev * sigma[i]
-            if np.absolute(speed[i] - speed_mean[i]) > th:
-                logger.debug("statistical filtering for sample #%d (%.2f, %.2f, th: %.2f)"
-                             % (i, speed[i], speed_mean[i], th))
-                stat_filtered[i] = True
+        # the tolerance factor is dropped from the first sample deeper than the depth threshold onward
+        factor = np.where(np.logical_or.accumulate(depth > depth_th), 1.0, tolerance_factor)
+        th = factor * nr_std_dev * sigma
+        stat_filtered = np.absolute(speed - speed_mean) > th
+        for i in np.flatnonzero(stat_filtered):
+            logger.debug("statistical filtering for sample #%d (%.2f, %.2f, th: %.2f)"
+                         % (i, speed[i], speed_mean[i], th[i]))
 
         # finally apply the statistical filtering
         filtered_ii = np.zeros(len(self.proc_valid), dtype=bool)
@@ -443,35 +440,26 @@ class Profile:
             logger.debug("cosine avg -> storage: rows %s, columns %s" % (storage.shape[0], storage.shape[1]))
 
         # populate bin values (row #0)
-        for i in range(storage.shape[1]):
-            storage[0][i] = z_min + (- bin_width + i) * bin_size
+        storage[0] = z_min + (np.arange(storage.shape[1]) - bin_width) * bin_size
         if verbose:
             logger.debug("cosine avg -> storage bin values: %s" % (storage[0],))
 
         # populate weights
-        for i, z in enumerate(zs):
-
-            # calculate the index of the central bin value
-            center_idx = int((z - z_min) / bin_size + .5) + bin_width
-            # if debug:
-            #     logger.debug("cosine avg -> z: %s, center index: %s" % (z, center_idx))
-
-            # calculate the differences from the current z values in the averaging windows
-            z_diff = z - storage[0][center_idx - bin_width:center_idx + bin_width + 1]
-            # if debug:
-            #     logger.debug("cosine avg -> z: %s, z diff: %s" % (z, z_diff))
-
-            # Insure that weight will be .1 at a window width from point I
-            bin_weights = 1.0 + np.cos(2.69 * z_diff / window_width[i])
-            bin_weights *= np.absolute(z_diff) < window_width[i]  # set to 0 when outside the window width
-            # if debug:
-            #     logger.debug("cosine avg -> z: %s, bin weights: %s" % (z, bin_weights))
-
-            for j, name in enumerate(names):
-                # summing up for all the types, row is j + 1 since the first row is for bin values
-                storage[1 + j][center_idx - bin_width:center_idx + bin_width + 1] += records[name][i] * bin_weights
-
-            storage[-1][center_idx - bin_width:center_idx + bin_width + 1] += bin_weights
+        # - calculate the index of the central bin value (and of the bins in the averaging windows)
+        center_idx = ((zs - z_min) / bin_size + .5).astype(int) + bin_width
+        bin_idx = center_idx[:, np.newaxis] + np.arange(-bin_width, bin_width + 1)[np.newaxis, :]
+        # - calculate the differences from the z values in the averaging windows
+        z_diff = zs[:, np.newaxis] - storage[0][bin_idx]
+        # - insure that weight will be .1 at a window width from the point
+        bin_weights = 1.0 + np.cos(2.69 * z_diff / window_width[:, np.newaxis])
+        bin_weights *= np.absolute(z_diff) < window_width[:, np.newaxis]  # set to 0 when outside the window width
+        # - summing up for all the types, row is j + 1 since the first row is for bin values
+        #   (bincount accumulates in sample order, so the sums are the same of a per-sample loop)
+        bin_idx = bin_idx.ravel()
+        for j, name in enumerate(names):
+            storage[1 + j] += np.bincount(bin_idx, weights=(records[name][:, np.newaxis] * bin_weights).ravel(),
+                                          minlength=storage.shape[1])
+        storage[-1] += np.bincount(bin_idx, weights=bin_weights.ravel(), minlength=storage.shape[1])
 
         if verbose:
             logger.debug("cosine avg -> storage weights: %s" % (storage[-1],))
@@ -494,98 +482,68 @@ class Profile:
 
         # logger.debug(self.proc.depth)
 
-        # insert created data into the self.proc arrays
-        last_depth = 0.0
-        for row in storage.T:
-
-            # index of where the storage record falls
-            d_th = float(row[0])
-            if d_th < last_depth:
-                continue
-            last_depth = d_th
-            try:
-                z_bools = np.logical_and(self.proc_valid, self.proc.depth > d_th)
-                i = np.argwhere(z_bools)[0]
-            except IndexError:
-                i = zs.size
-
-            self.proc.depth = np.insert(self.proc.depth, i, d_th)
-            self.proc.source = np.insert(self.proc.source, i, Dicts.sources['smoothing'])
-            self.proc.flag = np.insert(self.proc.flag, i, Dicts.flags['valid'])
-            for j, name in enumerate(names):
-                setattr(self.proc, name, np.insert(getattr(self.proc, name), i, row[j + 1]))
+        # skip the bins at negative depth
+        storage = np.compress(storage[0] >= 0.0, storage, axis=1)
 
-            # logger.debug(self.proc.depth)
+        # insert created data into the self.proc arrays, in a single pass:
+        # each bin goes before the first valid sample deeper than it (or after the last valid sample)
+        valid_ii = np.flatnonzero(self.proc_valid)
+        deepest = np.maximum.accumulate(self.proc.depth[valid_ii])
+        insert_ii = np.append(valid_ii, valid_ii[-1] + 1)[np.searchsorted(deepest, storage[0], side='right')]
 
-        # since we inserted new samples
-        self.proc.num_samples = self.proc.depth.size
+        self.proc.insert(insert_ii, depth=storage[0], source=Dicts.sources['smoothing'], flag=Dicts.flags['valid'],
+                         **{name: storage[j + 1] for j, name in enumerate(names)})
 
         # mark previous 'valid' data as 'smoothed'
         self.proc.flag[self.proc.source != Dicts.sources['smoothing']] = Dicts.flags['smoothed']
 
     def reduce_up_down(self, ssp_direction, use_pressure=False):
-        """Reduce the raw data samples based on the passed direction"""
+        """Reduce the raw data samples based on the passed direction
+
+        The first sample at the max depth (or pressure) is the turning point. For a downcast, only the samples
+        deeper than all the previous ones are kept up to the turning point. For an upcast, only the samples
+        shallower than all the previous ones are kept from the turning point (excluded), then the data are flipped.
+
+        Return the index of the turning point (None if there are no data).
+        """
         if self.data.num_samples == 0:  # skipping if there are no data
-            return
+            return None
 
         # identify max depth
         if use_pressure:
-            max_value = self.data.pressure[self.data_valid].max()  # max pressure
+            values = self.data.pressure
+            max_value = values[self.data_valid].max()  # max pressure
             logger.debug("reduce up/down > max pressure: %s" % max_value)
 
         else:
-            max_value = self.data.depth[self.data_valid].max()  # max depth
+            values = self.data.depth
+            max_value = values[self.data_valid].max()  # max depth
             logger.debug("reduce up/down > max depth: %s" % max_value)
 
-        # loop through the sample using max depth as turning point
-        max_reached = False
-        last_value = None
-        for i in range(self.data.num_samples):
-
-            if use_pressure:
-                value = self.data.pressure[i]
-            else:
-                value = self.data.depth[i]
-
-            if (ssp_direction == Dicts.ssp_directions['up'] and not max_reached) \
-                    or (ssp_direction == Dicts.ssp_directions['down'] and max_reached):
-                self.data.flag[i] = Dicts.flags['direction']  # set invalid for direction
+        # use the first sample at max depth as turning point
+        turning_idx = int(np.argmax(values == max_value))
+        logger.debug("reduce up/down > turning point: #%d" % turning_idx)
 
-            elif ssp_direction == Dicts.ssp_directions['down'] and not max_reached:
+        wrong_direction = np.zeros(self.data.num_samples, dtype=bool)
+        if ssp_direction == Dicts.ssp_directions['down']:
+            down = values[:turning_idx + 1]
+            wrong_direction[1:turning_idx + 1] = down[1:] <= np.maximum.accumulate(down)[:-1]
+            wrong_direction[turning_idx + 1:] = True
 
-                if (i != 0) and (last_value is not None):
-                    if value <= last_value:
-                        # print(last_value, value)
-                        self.data.flag[i] = Dicts.flags['direction']  # set invalid for direction
-                    else:
-                        last_value = value
-                else:
-                    last_value = value
-
-            elif ssp_direction == Dicts.ssp_directions['up'] and max_reached:
-
-                if (i != 0) and (last_value is not None):
-                    if value >= last_value:
-                        self.data.flag[i] = Dicts.flags['direction']  # set invalid for direction
-                    else:
-                        last_value = value
-                else:
-                    last_value = value
+        elif ssp_direction == Dicts.ssp_directions['up']:
+            up = values[turning_idx:]
+            wrong_direction[:turning_idx + 1] = True
+            wrong_direction[turning_idx + 1:] = up[1:] >= np.minimum.accumulate(up)[:-1]
 
-            if value == max_value:
-                max_reached = True
-                last_value = value
+        self.data.flag[wrong_direction] = Dicts.flags['direction']  # set invalid for direction
 
         if ssp_direction == Dicts.ssp_directions['up']:
             logger.debug("flipping data for up direction")
-            self.data.pressure[:] = np.flipud(self.data.pressure)
-            self.data.depth[:] = np.flipud(self.data.depth)
-            self.data.speed[:] = np.flipud(self.data.speed)
-            self.data.temp[:] = np.flipud(self.data.temp)
-            self.data.conductivity[:] = np.flipud(self.data.conductivity)
-            self.data.sal[:] = np.flipud(self.data.sal)
-            self.data.source[:] = np.flipud(self.data.source)
-            self.data.flag[:] = np.flipud(self.data.flag)
+            for name in ['pressure', 'depth', 'speed', 'temp', 'conductivity', 'sal', 'source', 'flag']:
+                values = getattr(self.data, name)
+                values[:] = values[::-1].copy()
+
+        return turning_idx
 
     def calc_salinity_from_conductivity(self):
         if np.count_nonzero(self.data.pressure):
@@ -615,9 +573,7 @@ class Profile:
         else:
             latitude = self.meta.latitude
 
-        for count in range(self.data.num_samples):
-            self.data.sal[count] = Oc.sal(d=self.data.depth[count], speed=self.data.speed[count],
-                                          t=self.data.temp[count], lat=latitude)
+        self.data.sal[:] = Oc.sal(d=self.data.depth, speed=self.data.speed, t=self.data.temp, lat=latitude)
         self.modify_proc_info(Dicts.proc_import_infos['CALC_SAL'])
 
     def calc_dyn_height(self):
@@ -718,11 +674,7 @@ class Profile:
         else:
             latitude = self.meta.latitude
 
-        for count in range(self.data.num_samples):
-            self.data.speed[count] = Oc.speed(self.data.depth[count],
-                                              self.data.temp[count],
-                                              self.data.sal[count],
-                                              latitude)
+        self.data.speed[:] = Oc.speed(self.data.depth, self.data.temp, self.data.sal, latitude)
         self.modify_proc_info(Dicts.proc_import_infos['CALC_SPD'])
 
     def calc_proc_speed(self):
@@ -734,11 +686,7 @@ class Profile:
         else:
             latitude = self.meta.latitude
 
-        for count in range(self.proc.num_samples):
-            self.proc.speed[count] = Oc.speed(self.proc.depth[count],
-                                              self.proc.temp[count],
-                                              self.proc.sal[count],
-                                              latitude)
+        self.proc.speed[:] = Oc.speed(self.proc.depth, self.proc.temp, self.proc.sal, latitude)
         self.modify_proc_info(Dicts.proc_user_infos['RECALC_SPD'])
 
     def calc_attenuation(self, frequency, ph):
@@ -826,33 +774,22 @@ class Profile:
             # interpolate for pressure
             pi = np.array([self.proc.pressure[valid][m_ids[0]], self.proc.pressure[valid][m_ids[1]]])
             pm, pc = np.linalg.lstsq(a, pi, rcond=None)[0]
-            self.proc.pressure = np.insert(self.proc.pressure, j, pm * depth + pc)
-            # print(self.proc.pressure[0], self.proc.pressure.size)
 
             # interpolate for temp
             ti = np.array([self.proc.temp[valid][m_ids[0]], self.proc.temp[valid][m_ids[1]]])
             tm, tc = np.linalg.lstsq(a, ti, rcond=None)[0]
-            self.proc.temp = np.insert(self.proc.temp, j, tm * depth + tc)
-            # print(self.proc.temp[0], self.proc.temp.size)
 
             # interpolate for conductivity
             ci = np.array([self.proc.conductivity[valid][m_ids[0]], self.proc.conductivity[valid][m_ids[1]]])
             cm, cc = np.linalg.lstsq(a, ci, rcond=None)[0]
-            self.proc.conductivity = np.insert(self.proc.conductivity, j, cm * depth + cc)
-            # print(self.proc.conductivity[0], self.proc.conductivity.size)
 
             # interpolate for sal
             si = np.array([self.proc.sal[valid][m_ids[0]], self.proc.sal[valid][m_ids[1]]])
             sm, sc = np.linalg.lstsq(a, si, rcond=None)[0]
-            self.proc.sal = np.insert(self.proc.sal, j, sm * depth + sc)
-            # print(self.proc.sal[0], self.proc.sal.size)
-
-            self.proc.depth = np.insert(self.proc.depth, j, depth)
-            self.proc.speed = np.insert(self.proc.speed, j, speed)
-            self.proc.source = np.insert(self.proc.source, j, src)
-            self.proc.flag = np.insert(self.proc.flag, j, Dicts.flags['valid'])
 
-            self.proc.num_samples += 1
+            self.proc.insert(j, pressure=pm * depth + pc, depth=depth, speed=speed, temp=tm * depth + tc,
+                             conductivity=cm * depth + cc, sal=sm * depth + sc, source=src,
+                             flag=Dicts.flags['valid'])
 
     def insert_sis_speed(self, depth, speed, src=Dicts.sources['user'], temp=None, cond=None, sal=None):
         # logger.debug("insert speed to sis data: d:%s, vs:%s" % (depth, speed))
@@ -921,43 +858,28 @@ class Profile:
             # interpolate for pressure
             pi = np.array([self.sis.pressure[valid][m_ids[0]], self.sis.pressure[valid][m_ids[1]]])
             pm, pc = np.linalg.lstsq(a, pi, rcond=None)[0]
-            self.sis.pressure = np.insert(self.sis.pressure, j, pm * depth + pc)
-            # print(self.sis.pressure[0], self.sis.pressure.size)
 
             # interpolate for temp
             if temp is None:
                 ti = np.array([self.sis.temp[valid][m_ids[0]], self.sis.temp[valid][m_ids[1]]])
                 tm, tc = np.linalg.lstsq(a, ti, rcond=None)[0]
-                self.sis.temp = np.insert(self.sis.temp, j, tm * depth + tc)
-            else:
-                self.sis.temp = np.insert(self.sis.temp, j, temp)
-            # logger.debug("added temperature: %s" % self.sis.temp[j])
+                temp = tm * depth + tc
 
             # interpolate for conductivity
             if cond is None:
                 ci = np.array([self.sis.conductivity[valid][m_ids[0]], self.sis.conductivity[valid][m_ids[1]]])
                 cm, cc = np.linalg.lstsq(a, ci, rcond=None)[0]
-                self.sis.conductivity = np.insert(self.sis.conductivity, j, cm * depth + cc)
-            else:
-                self.sis.conductivity = np.insert(self.sis.conductivity, j, cond)
-            # logger.debug("added conductivity: %s" % self.sis.conductivity[j])
+                cond = cm * depth + cc
 
             # interpolate for sal
             if sal is None:
                 si = np.array([self.sis.sal[valid][m_ids[0]], self.sis.sal[valid][m_ids[1]]])
                 sm, sc = np.linalg.lstsq(a, si, rcond=None)[0]
-                self.sis.sal = np.insert(self.sis.sal, j, sm * depth + sc)
-            else:
-                self.sis.sal = np.insert(self.sis.sal, j, sal)
-            # logger.debug("added salinity: %s" % self.sis.sal[j])
+                sal = sm * depth + sc
 
-            self.sis.depth = np.insert(self.sis.depth, j, depth)
-            self.sis.speed = np.insert(self.sis.speed, j, speed)
-            self.sis.source = np.insert(self.sis.source, j, src)
             # we flag it as thin since the user most likely wants to have this value in the export
-            self.sis.flag = np.insert(self.sis.flag, j, Dicts.flags['thin'])
-
-            self.sis.num_samples += 1
+            self.sis.insert(j, pressure=pm * depth + pc, depth=depth, speed=speed, temp=temp, conductivity=cond,
+                            sal=sal, source=src, flag=Dicts.flags['thin'])
 
     def insert_proc_temp_sal(self, depth, temp, sal):
         logger.debug("insert temp, sal to proc data: d:%s, t:%s, s:%s" % (depth, temp, sal))
@@ -1022,23 +944,14 @@ class Profile:
             # interpolate for pressure
             pi = np.array([self.proc.pressure[valid][m_ids[0]], self.proc.pressure[valid][m_ids[1]]])
             pm, pc = np.linalg.lstsq(a, pi, rcond=None)[0]
-            self.proc.pressure = np.insert(self.proc.pressure, j, pm * depth + pc)
-            # print(self.proc.pressure[0], self.proc.pressure.size)
 
             # interpolate for conductivity
             ci = np.array([self.proc.conductivity[valid][m_ids[0]], self.proc.conductivity[valid][m_ids[1]]])
             cm, cc = np.linalg.lstsq(a, ci, rcond=None)[0]
-            self.proc.conductivity = np.insert(self.proc.conductivity, j, cm * depth + cc)
-            # print(self.proc.conductivity[0], self.proc.conductivity.size)
-
-            self.proc.depth = np.insert(self.proc.depth, j, depth)
-            self.proc.speed = np.insert(self.proc.speed, j, speed)
-            self.proc.temp = np.insert(self.proc.temp, j, temp)
-            self.proc.sal = np.insert(self.proc.sal, j, sal)
-            self.proc.source = np.insert(self.proc.source, j, Dicts.sources['user'])
-            self.proc.flag = np.insert(self.proc.flag, j, Dicts.flags['valid'])
 
-            self.proc.num_samples += 1
+            self.proc.insert(j, pressure=pm * depth + pc, depth=depth, speed=speed, temp=temp,
+                             conductivity=cm * depth + cc, sal=sal, source=Dicts.sources['user'],
+                             flag=Dicts.flags['valid'])
 
     def extend_profile(self, extender, ext_type):
         """ Use the extender samples to extend the profile """
@@ -1075,23 +988,15 @@ class Profile:
             return True
 
         # stack the extending samples after the last valid (max depth) index
-        self.proc.pressure = np.hstack([self.proc.depth[:max_idx + 1],
-                                        np.zeros_like(extender.cur.proc.depth[ext_vi][ind2:])])
-        self.proc.depth = np.hstack([self.proc.depth[:max_idx + 1],
-                                     extender.cur.proc.depth[ext_vi][ind2:]])
-        self.proc.speed = np.hstack([self.proc.speed[:max_idx + 1],
-                                     extender.cur.proc.speed[ext_vi][ind2:]])
-        self.proc.temp = np.hstack([self.proc.temp[:max_idx + 1],
-                                    extender.cur.proc.temp[ext_vi][ind2:]])
-        self.proc.conductivity = np.hstack([self.proc.sal[:max_idx + 1],
-                                            np.zeros_like(extender.cur.proc.sal[ext_vi][ind2:])])
-        self.proc.sal = np.hstack([self.proc.sal[:max_idx + 1],
-                                   extender.cur.proc.sal[ext_vi][ind2:]])
-        self.proc.source = np.hstack([self.proc.source[:max_idx + 1],
-                                      extender.cur.proc.source[ext_vi][ind2:]])
-        self.proc.flag = np.hstack([self.proc.flag[:max_idx + 1],
-                                    extender.cur.proc.flag[ext_vi][ind2:]])
-        self.proc.num_samples = self.proc.depth.size
+        self.proc.resize(min(max_idx + 1, self.proc.num_samples))
+        self.proc.pressure[:] = self.proc.depth
+        self.proc.conductivity[:] = self.proc.sal
+        self.proc.append(depth=extender.cur.proc.depth[ext_vi][ind2:],
+                         speed=extender.cur.proc.speed[ext_vi][ind2:],
+                         temp=extender.cur.proc.temp[ext_vi][ind2:],
+                         sal=extender.cur.proc.sal[ext_vi][ind2:],
+                         source=extender.cur.proc.source[ext_vi][ind2:],
+                         flag=extender.cur.proc.flag[ext_vi][ind2:])
 
         # update processing info
         if ext_type == Dicts.sources['ref_ext']:
@@ -1213,62 +1118,114 @@ class Profile:
 
     # - thinning
 
-    def thin(self, tolerance):
-        """Thin the sis data"""
+    def thin(self, tolerance, levels=None):
+        """Thin the sis data
+
+        The optional levels are those returned by thin_levels (to avoid to re-run the thinning algorithm
+        when trying several tolerances on the same profile).
+        """
         # logger.info("thinning the sis samples")
 
+        vi = self.sis_valid
+        depth = self.sis.depth[vi]
+        speed = self.sis.speed[vi]
+
         # if the profile is too short, we just pass it back
-        if self.sis.depth[self.sis_valid].size < 100:
-            self.sis.flag[self.sis_valid] = Dicts.flags['thin']
-            logger.debug("skipping thinning for short profile (%d samples)" % self.sis.depth[self.sis_valid].size)
+        if depth.size < 100:
+            self.sis.flag[vi] = Dicts.flags['thin']
+            logger.debug("skipping thinning for short profile (%d samples)" % depth.size)
             return True
 
         # - 1000 points for: EM2040, EM710, EM302 and EM122;
         # - 570 points for: EM3000, EM3002, EM1002, EM300, EM120
-        flagged = self.sis.flag[self.sis_valid][:]
-        idx_start = 0
-        idx_end = self.sis.depth[self.sis_valid].size - 1
-        # logger.debug('first: %s, last: %s[%s]'
-        #              % (self.sis.depth[self.sis_valid][idx_start],
-        #                 self.sis.depth[self.sis_valid][idx_end],
-        #                 self.sis.flag[self.sis_valid][idx_end]))
-        self.douglas_peucker_1d(idx_start, idx_end, tolerance=tolerance, data=flagged)
-        self.sis.flag[self.sis_valid] = flagged[:]
+        flagged = self.sis.flag[vi]
+        if levels is None:
+            kept = self.douglas_peucker_1d(depth=depth, speed=speed, tolerance=tolerance)
+        else:
+            if levels.size != depth.size:
+                logger.warning("mismatch between thinning levels and valid samples: %d != %d"
+                               % (levels.size, depth.size))
+                return False
+            kept = levels > tolerance
+        flagged[kept] = Dicts.flags['thin']
+        self.sis.flag[vi] = flagged
 
         # logger.info("thinned: %s" % self.sis.flag[self.sis_thinned].size)
         return True
 
-    def douglas_peucker_1d(self, start, end, tolerance, data):
-        """ Recursive implementation """
-        # logger.debug("dp: %s, %s" % (start, end))
+    def thin_levels(self):
+        """Return the thinning levels for the valid proc samples (that become the valid sis samples once cloned)
+
+        A sample is kept by thin() for all the tolerances lower than its level.
+        """
+        vi = self.proc_valid
+        return self.douglas_peucker_1d_levels(depth=self.proc.depth[vi], speed=self.proc.speed[vi])
+
+    @classmethod
+    def thin_sizes(cls, levels, tolerances):
+        """Return the number of samples kept by the thinning for each of the passed tolerances"""
+        tolerances = np.atleast_1d(np.array(tolerances, dtype=np.float64))
+        sorted_levels = np.sort(levels)
+        return levels.size - np.searchsorted(sorted_levels, tolerances, side='right')
+
+    def thin_tolerance(self, tolerances, max_samples, levels=None):
+        """Return the lowest of the passed tolerances that keeps less than max_samples (or the last one)"""
+        if levels is None:
+            levels = self.thin_levels()
+        if levels.size < 100:  # short profiles are not thinned
+            return tolerances[0]
+
+        sizes = self.thin_sizes(levels, tolerances)
+        for tolerance, size in zip(tolerances, sizes):
+            if size < max_samples:
+                return tolerance
+            logger.info("too many samples with tolerance %.3f: %d" % (tolerance, size))
+        return tolerances[-1]
+
+    @classmethod
+    def douglas_peucker_1d(cls, depth, speed, tolerance):
+        """Iterative (stack-based) implementation, returning the mask of the samples to keep"""
+        return cls.douglas_peucker_1d_levels(depth=depth, speed=speed, min_tolerance=tolerance) > tolerance
+
+    @classmethod
+    def douglas_peucker_1d_levels(cls, depth, speed, min_tolerance=0.0):
+        """Iterative (stack-based) implementation, returning for each sample the level of importance
+
+        The level is the largest tolerance at which the sample is dropped (so the thinning with a given
+        tolerance keeps the samples with a level larger than the tolerance). The end points are always kept.
+        The segments are not split further once their error is below the passed min tolerance.
+        """
+        levels = np.zeros(depth.size, dtype=np.float64)
+        if depth.size == 0:
+            return levels
 
         # We always keep end points
-        data[start] = Dicts.flags['thin']
-        data[end] = Dicts.flags['thin']
+        levels[0] = np.inf
+        levels[-1] = np.inf
 
-        slope = (self.sis.speed[self.sis_valid][end] - self.sis.speed[self.sis_valid][start]) / \
-                (self.sis.depth[self.sis_valid][end] - self.sis.depth[self.sis_valid][start])
+        segments = [(0, depth.size - 1, np.inf), ]
+        while segments:
+            start, end, parent_level = segments.pop()
+            if end - start < 2:
+                continue
 
-        max_dist = 0
-        max_ind = 0
-        for ind in range(start + 1, end):
-            dist = abs(self.sis.speed[self.sis_valid][start] +
-                       slope * (self.sis.depth[self.sis_valid][ind] - self.sis.depth[self.sis_valid][start]) -
-                       self.sis.speed[self.sis_valid][ind])
+            with np.errstate(divide='ignore', invalid='ignore'):
+                slope = (speed[end] - speed[start]) / (depth[end] - depth[start])
+                dist = np.abs(speed[start] + slope * (depth[start + 1:end] - depth[start]) - speed[start + 1:end])
+            dist[np.isnan(dist)] = -1.0  # never selected (as in the comparison with a NaN)
 
-            if dist > max_dist:
-                max_dist = dist
-                max_ind = ind
+            max_idx = int(np.argmax(dist))
+            if dist[max_idx] <= min_tolerance:
+                continue
 
-        if max_dist <= tolerance:
-            return
+            # a sample is kept only if all the splits leading to it are kept
+            level = min(parent_level, dist[max_idx])
+            max_ind = start + 1 + max_idx
+            levels[max_ind] = level
+            segments.append((start, max_ind, level))
+            segments.append((max_ind, end, level))
 
-        else:
-            data[max_ind] = Dicts.flags['thin']
-            # print(max_ind, max_dist, data[max_ind])
-            self.douglas_peucker_1d(start, max_ind, tolerance, data=data)
-            self.douglas_peucker_1d(max_ind, end, tolerance, data=data)
-            return
+        return levels
 
     # - debugging
 
@@ -1357,8 +1314,12 @@ class Profile:
 
         return cast_speed
 
-    def compute_ray_paths(self, draft, thetas_deg, travel_times=None, res=.005, b_project=False):
-        """Returns a RayPath object for each launch angle."""
+    def compute_rays(self, draft, thetas_deg, travel_times=None, res=.005, b_project=False):
+        """Returns a (angles, times, 3) array with travel time, depth and across-track for each launch angle.
+
+        When the travel times are not passed, they are generated to reach the end of the profile for the
+        launch angle with the longest travel time. Out-of-range samples have across-track set to -1.
+        """
         if not draft or draft == 'Unknown':
             draft = 0.0
         else:
@@ -1367,19 +1328,28 @@ class Profile:
         depths = self.proc.depth[self.proc_dqa_valid] - draft
         speeds = self.proc.speed[self.proc_dqa_valid]
 
-        ray_paths = []
-        for launch in thetas_deg:
+        params = RayTracing.get_svp_layer_parameters_many(np.deg2rad(thetas_deg), depths, speeds)
+        if travel_times is None:
+            tt = np.arange(res, np.nanmax(params[-2][:, -1]), res)  # make travel_times to reach end of profile
+        else:
+            tt = np.array(travel_times)
 
-            params = RayTracing.get_svp_layer_parameters(np.deg2rad(launch), depths, speeds)
-            if travel_times is None:
-                tt = np.arange(res, params[-2][-1], res)  # make travel_times to reach end of profile
-            else:
-                tt = np.array(travel_times)
+        rays = RayTracing.ray_trace_many(tt, depths, speeds, params, b_project=b_project)
+        rays[:, :, 1] += draft
 
-            rays = RayTracing.ray_trace(tt, depths, speeds, params, b_project=b_project)
-            rays[:, 0] += draft
+        return rays
 
-            ray_paths.append(RayPath(np.vstack((tt, rays.transpose())).transpose()))
+    def compute_ray_paths(self, draft, thetas_deg, travel_times=None, res=.005, b_project=False):
+        """Returns a RayPath object for each launch angle."""
+        rays = self.compute_rays(draft, thetas_deg, travel_times=travel_times, res=res, b_project=b_project)
+        if travel_times is not None:
+            return [RayPath(ray) for ray in rays]
+
+        # each ray stops at the end of the profile for its own launch angle
+        ray_paths = []
+        for ray in rays:
+            nr_times = np.count_nonzero(ray[:, 2] != -1.0)
+            ray_paths.append(RayPath(ray[:nr_times]))
 
         return ray_paths
 
@@ -6,6 +6,12 @@ logger = logging.getLogger(__name__)
 
 
 class DiffTracedProfiles:
+    """Compare the rays of two traced profiles
+
+    After calc_diff, the new and old rays are (angles, 3, samples) arrays with travel time, across-track
+    distance and depth from the common minimum depth, truncated at the common travel time. Since each
+    ray has its own length, the arrays are padded with NaN and the valid lengths are in new_sizes/old_sizes.
+    """
 
     def __init__(self, old_tp, new_tp):
         # required inputs
@@ -16,103 +22,70 @@ class DiffTracedProfiles:
         self.fixed_allowable_error = 0.3
 
         # output
-        self.new_rays = list()
-        self.old_rays = list()
+        self.new_rays = None
+        self.old_rays = None
+        self.new_sizes = None
+        self.old_sizes = None
         self.max_tolerances = None
 
+    @property
+    def new_ends(self):
+        """Return the (angles, 3) last valid samples of the new rays (NaN for empty rays)"""
+        return self._ends(self.new_rays, self.new_sizes)
+
+    @property
+    def old_ends(self):
+        """Return the (angles, 3) last valid samples of the old rays (NaN for empty rays)"""
+        return self._ends(self.old_rays, self.old_sizes)
+
+    @classmethod
+    def _ends(cls, rays, sizes):
+        ends = np.full((rays.shape[0], 3), np.nan)
+        has_samples = sizes > 0
+        ends[has_samples] = rays[has_samples, :, sizes[has_samples] - 1]
+        return ends
+
     def calc_diff(self):
         if self.old_tp is None:
             raise RuntimeError("first set the old traced profile")
         if self.new_tp is None:
             raise RuntimeError("first set the new traced profile")
 
-        for ang in range(len(self.new_tp.rays)):
-            # logger.info("[angle: %d]" % ang)
-            ray_new = self.new_tp.rays[ang]
-            ray_old = self.old_tp.rays[ang]
-
-            new_t = list()
-            new_x = list()
-            new_z = list()
-
-            old_t = list()
-            old_x = list()
-            old_z = list()
-
-            init_done = False
-            init_new_t = None
-            init_new_x = None
-            init_new_z = None
-            init_old_t = None
-            init_old_x = None
-            init_old_z = None
-
-            # first retrieve common areas for both profiles (and reset the 0 values)
-            for idx in range(len(ray_new[0])):
-
-                if ray_new[0][idx] == -1:
-                    continue
-                if ray_old[0][idx] == -1:
-                    continue
-
-                if not init_done:
-                    # logger.debug("begin z: %s/%s" % (ray_new[2][idx], ray_old[2][idx]))
-                    init_new_t = ray_new[0][idx]
-                    init_new_x = ray_new[1][idx]
-                    init_new_z = ray_new[2][idx]
-                    init_old_t = ray_old[0][idx]
-                    init_old_x = ray_old[1][idx]
-                    init_old_z = ray_old[2][idx]
-                    init_done = True
-
-                new_t.append(ray_new[0][idx] - init_new_t)
-                new_x.append(ray_new[1][idx] - init_new_x)
-                new_z.append(ray_new[2][idx] - init_new_z)
-
-                old_t.append(ray_old[0][idx] - init_old_t)
-                old_x.append(ray_old[1][idx] - init_old_x)
-                old_z.append(ray_old[2][idx] - init_old_z)
-
-            # logger.debug("end z: %s/%s" % (new_z[-1], old_z[-1]))
-
-            if (len(new_t) == 0) or (len(old_t) == 0):
-                self.new_rays.append(np.array([list(), list(), list()]))
-                self.old_rays.append(np.array([list(), list(), list()]))
-                return
-
-            new_is_longer = False
-            min_time = new_t[-1]
-            if new_t[-1] > old_t[-1]:
-                min_time = old_t[-1]
-                new_is_longer = True
-            # logger.debug("new is longer: %s" % new_is_longer)
-            # logger.debug("min time: %s" % min_time)
-
-            n_t = list()
-            n_x = list()
-            n_z = list()
-
-            # stop to the minimum common time
-            for idx in range(len(new_t)):
-                if new_t[idx] > min_time:
-                    break
-
-                n_t.append(new_t[idx])
-                n_x.append(new_x[idx])
-                n_z.append(new_z[idx])
-
-            o_t = list()
-            o_x = list()
-            o_z = list()
-
-            # stop to the minimum common time
-            for idx in range(len(old_t)):
-                if old_t[idx] > min_time:
-                    break
-
-                o_t.append(old_t[idx])
-                o_x.append(old_x[idx])
-                o_z.append(old_z[idx])
-
-            self.new_rays.append(np.array([n_t, n_x, n_z]))
-            self.old_rays.append(np.array([o_t, o_x, o_z]))
+        nr_samples = min(self.new_tp.rays.shape[2], self.old_tp.rays.shape[2])
+        ray_new = self.new_tp.rays[:, :, :nr_samples]
+        ray_old = self.old_tp.rays[:, :, :nr_samples]
+        nr_angles = ray_new.shape[0]
+
+        # first retrieve common areas for both profiles (moving them at the beginning of each ray)
+        valid = np.logical_and(ray_new[:, 0] != -1, ray_old[:, 0] != -1)
+        nr_valid = np.count_nonzero(valid, axis=1)
+        order = np.argsort(~valid, axis=1, kind='stable')[:, np.newaxis, :]
+        new = np.take_along_axis(ray_new, order, axis=2)
+        old = np.take_along_axis(ray_old, order, axis=2)
+
+        # reset the values at the beginning of the common area
+        new -= new[:, :, :1]
+        old -= old[:, :, :1]
+
+        # stop to the minimum common time
+        idx = np.arange(nr_samples)[np.newaxis, :]
+        last = np.maximum(nr_valid - 1, 0)
+        min_time = np.minimum(new[np.arange(nr_angles), 0, last], old[np.arange(nr_angles), 0, last])
+        self.new_sizes = self._cut_sizes(times=new[:, 0], min_time=min_time, nr_valid=nr_valid, idx=idx)
+        self.old_sizes = self._cut_sizes(times=old[:, 0], min_time=min_time, nr_valid=nr_valid, idx=idx)
+        for ang in np.flatnonzero(nr_valid == 0):
+            logger.info("no common samples for angle #%d" % ang)
+
+        # compact the outcome to the longest ray, padding with NaN
+        max_size = max(self.new_sizes.max(initial=0), self.old_sizes.max(initial=0))
+        idx = idx[:, :max_size]
+        new_padding = (idx >= self.new_sizes[:, np.newaxis])[:, np.newaxis, :]
+        old_padding = (idx >= self.old_sizes[:, np.newaxis])[:, np.newaxis, :]
+        self.new_rays = np.where(new_padding, np.nan, new[:, :, :max_size])
+        self.old_rays = np.where(old_padding, np.nan, old[:, :, :max_size])
+
+    @classmethod
+    def _cut_sizes(cls, times, min_time, nr_valid, idx):
+        """Return the number of samples up to the first sample after the passed time"""
+        beyond = np.logical_or(times > min_time[:, np.newaxis], idx >= nr_valid[:, np.newaxis])
+        return np.where(beyond.any(axis=1), np.argmax(beyond, axis=1), times.shape[1])
@@ -84,23 +84,23 @@ class PlotTracedProfiles:
         svp_ax.grid(True)
 
         # calculate limits
-        z_max = max(max(self._d.new_rays[-1][2]),
-                    max(self._d.old_rays[-1][2]))
-        x_max = max(max(self._d.new_rays[-1][1]),
-                    max(self._d.old_rays[-1][1]))
+        z_max = max(np.nanmax(self._d.new_rays[-1][2]),
+                    np.nanmax(self._d.old_rays[-1][2]))
+        x_max = max(np.nanmax(self._d.new_rays[-1][1]),
+                    np.nanmax(self._d.old_rays[-1][1]))
 
         old_last_ray_x = self._d.old_rays[-1][1]
         new_last_ray_x = self._d.new_rays[-1][1]
         old_last_ray_z = self._d.old_rays[-1][2]
         new_last_ray_z = self._d.new_rays[-1][2]
-        old_x_ends = [ray[1][-1] for ray in self._d.old_rays]
-        new_x_ends = [ray[1][-1] for ray in self._d.new_rays]
-        old_z_ends = [ray[2][-1] for ray in self._d.old_rays]
-        new_z_ends = [ray[2][-1] for ray in self._d.new_rays]
-        up_tol = [(ray[2][-1] - ray[2][-1] * self._d.variable_allowable_error - self._d.fixed_allowable_error)
-                  for ray in self._d.new_rays]
-        down_tol = [(ray[2][-1] + ray[2][-1] * self._d.variable_allowable_error + self._d.fixed_allowable_error)
-                    for ray in self._d.new_rays]
+        old_ends = self._d.old_ends
+        new_ends = self._d.new_ends
+        old_x_ends = old_ends[:, 1]
+        new_x_ends = new_ends[:, 1]
+        old_z_ends = old_ends[:, 2]
+        new_z_ends = new_ends[:, 2]
+        up_tol = new_z_ends - new_z_ends * self._d.variable_allowable_error - self._d.fixed_allowable_error
+        down_tol = new_z_ends + new_z_ends * self._d.variable_allowable_error + self._d.fixed_allowable_error
 
         # error plot axis
         err_ax = fig.add_subplot(1, 2, 2)
@@ -138,54 +138,26 @@ class PlotTracedProfiles:
 
         start_time = datetime.now()
 
-        z_max = max(max(self._d.new_rays[-1][2]),
-                    max(self._d.old_rays[-1][2]))
-        x_max = max(max(self._d.new_rays[-1][1]),
-                    max(self._d.old_rays[-1][1]))
+        z_max = max(np.nanmax(self._d.new_rays[-1][2]),
+                    np.nanmax(self._d.old_rays[-1][2]))
+        x_max = max(np.nanmax(self._d.new_rays[-1][1]),
+                    np.nanmax(self._d.old_rays[-1][1]))
 
         xi, zi = np.mgrid[0:x_max:1000j, 0:z_max:1000j]
 
-        t1 = np.zeros(0, dtype=np.float32)
-        x1 = np.zeros(0, dtype=np.float32)
-        z1 = np.zeros(0, dtype=np.float32)
+        # sub-sample each ray based on its number of samples, only where both rays are present
+        new_sizes = self._d.new_sizes[:, np.newaxis]
+        old_sizes = self._d.old_sizes[:, np.newaxis]
+        nr_steps = np.where(new_sizes < 500, 10, np.where(new_sizes < 2500, 50, 100))
+        idx = np.arange(self._d.new_rays.shape[2])[np.newaxis, :]
+        picked = np.logical_and.reduce([idx % nr_steps == 0, idx < new_sizes, idx < old_sizes])
 
-        t2 = np.zeros(0, dtype=np.float32)
-        x2 = np.zeros(0, dtype=np.float32)
-        z2 = np.zeros(0, dtype=np.float32)
+        x1 = self._d.new_rays[:, 1][picked]
+        z1 = self._d.new_rays[:, 2][picked]
 
-        dx = np.zeros(0, dtype=np.float32)
-        dz = np.zeros(0, dtype=np.float32)
-
-        for ang, ray in enumerate(self._d.new_rays):
-
-            nr_samples = len(ray[0])
-            if nr_samples < 500:
-                nr_steps = 10
-            elif nr_samples < 2500:
-                nr_steps = 50
-            else:
-                nr_steps = 100
-
-            for idx in range(0, nr_samples, nr_steps):
-
-                try:
-                    _ = ray[0][idx]
-                    _ = self._d.old_rays[ang][0][idx]
-                except IndexError as e:
-                    logger.debug("skipping idx %s" % idx)
-                    continue
-
-                t1 = np.append(t1, ray[0][idx])
-                x1 = np.append(x1, ray[1][idx])
-                z1 = np.append(z1, ray[2][idx])
-
-                t2 = np.append(t2, self._d.old_rays[ang][0][idx])
-                x2 = np.append(x2, self._d.old_rays[ang][1][idx])
-                z2 = np.append(z2, self._d.old_rays[ang][2][idx])
-
-                dx = np.append(dx, np.abs(ray[1][idx] - self._d.old_rays[ang][1][idx]))
-                # dz = np.append(dz, np.abs(ray[2][idx] - self._d.old_rays[ang][2][idx]))
-                dz = np.append(dz, np.abs(ray[0][idx] - self._d.old_rays[ang][0][idx]) * 1500)
+        dx = np.abs(self._d.new_rays[:, 1][picked] - self._d.old_rays[:, 1][picked])
+        # dz = np.abs(self._d.new_rays[:, 2][picked] - self._d.old_rays[:, 2][picked])
+        dz = np.abs(self._d.new_rays[:, 0][picked] - self._d.old_rays[:, 0][picked]) * 1500
 
         logger.debug("timing: %s" % (datetime.now() - start_time))
 
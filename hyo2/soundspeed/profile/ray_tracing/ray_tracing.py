@@ -9,7 +9,56 @@ class RayTracing:
 
     @classmethod
     def get_svp_layer_parameters(cls, launch_angle_radians, depths, speeds):
-        return cls.get_svp_layer_parameters_slow(launch_angle_radians, depths, speeds)
+        gradient, gamma, radius, total_time, total_range = \
+            cls.get_svp_layer_parameters_many([launch_angle_radians, ], depths, speeds)
+        return gradient, gamma[0], radius[0], total_time[0], total_range[0]
+
+    @classmethod
+    def get_svp_layer_parameters_many(cls, launch_angles_radians, depths, speeds):
+        """Layer parameters for many launch angles at once
+
+        The returned gamma, radius, total_time and total_range have shape (angles, layers), while
+        the gradient (that does not depend on the angle) is a 1D array as in the slow version.
+        """
+        angles = np.atleast_1d(np.array(launch_angles_radians, np.float64))
+
+        speed = np.array(speeds, np.float64)  # need double precision for this computation
+        depth = np.array(depths, np.float64)
+        depth[0] = 0.0  # assume zero for top layer
+
+        delta_depth = np.diff(depth)
+        gradient = np.diff(speed) / delta_depth
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+
+            # Snell's law: the ray parameter sin(gamma) / speed is constant along the ray
+            gamma = arcsin(sin(angles)[:, np.newaxis] * (speed / speed[0])[np.newaxis, :])
+            gamma[:, 0] = angles
+            # once a ray is reflected (invalid arcsin), all the following layers are invalid as well
+            gamma[np.logical_or.accumulate(np.isnan(gamma), axis=1)] = np.nan
+
+            g_top = gamma[:, :-1]
+            g_bottom = gamma[:, 1:]
+            is_nadir = g_top == 0
+            is_constant = np.logical_and(~is_nadir, (gradient == 0)[np.newaxis, :])
+            is_curved = np.logical_and(~is_nadir, ~is_constant)
+
+            radius = np.zeros(gamma.shape, np.float64)
+            radius[:, :-1] = np.where(is_curved, speed[:-1] / (gradient * sin(g_top)), 0.0)
+
+            delta_time = np.where(is_nadir, delta_depth / ((speed[1:] + speed[:-1]) / 2.0),
+                                  np.where(is_constant, delta_depth / (speed[:-1] * cos(g_top)),
+                                           log(tan(g_bottom / 2.0) / tan(g_top / 2.0)) / gradient))
+            delta_range = np.where(is_nadir, 0.0,
+                                   np.where(is_constant, delta_depth * tan(g_top),
+                                            radius[:, :-1] * (cos(g_top) - cos(g_bottom))))
+
+        total_time = np.zeros(gamma.shape, np.float64)
+        total_time[:, 1:] = np.cumsum(delta_time, axis=1)
+        total_range = np.zeros(gamma.shape, np.float64)
+        total_range[:, 1:] = np.cumsum(delta_range, axis=1)
+
+        return gradient, gamma, radius, total_time, total_range
 
     @classmethod
     def get_svp_layer_parameters_slow(cls, launch_angle_radians, depths, speeds):
@@ -126,3 +175,71 @@ class RayTracing:
                 ret[ind] = (final_depth, final_range)
 
         return ret
+
+    @classmethod
+    def ray_trace_many(cls, travel_times, depths, speeds, params, b_project=False):
+        """Ray-trace all the launch angles in params at the passed travel times
+
+        The params are those returned by get_svp_layer_parameters_many. The result is a
+        (angles, times, 3) array with travel time, depth and across-track distance. As in
+        ray_trace, -1 denotes a depth/range out of the profile range.
+        """
+        nr_layers = len(depths) - 1
+
+        speed = np.array(speeds, np.float64)
+        depth = np.array(depths, np.float64)
+        depth[0] = 0.0  # assume zero for top layer
+
+        gradient, gamma, radius, total_time, total_range = params
+        travel_times = np.atleast_1d(np.array(travel_times, np.float64))
+        nr_angles = gamma.shape[0]
+
+        ret = np.zeros([nr_angles, len(travel_times), 3]) - 1.0  # -1 denotes out of range
+        ret[:, :, 0] = travel_times
+        if len(travel_times) == 0:
+            return ret
+
+        nr_end_layers = np.empty((nr_angles, len(travel_times)), dtype=np.intp)
+        for ang in range(nr_angles):
+            nr_end_layers[ang] = total_time[ang].searchsorted(travel_times) - 1
+        nr_end_layers[nr_end_layers == -1] = 0
+
+        if b_project:
+            valid = np.ones(nr_end_layers.shape, dtype=bool)
+        else:
+            valid = nr_end_layers < nr_layers
+        ang_idx, tt_idx = np.nonzero(valid)
+        k = nr_end_layers[ang_idx, tt_idx]
+        k_next = np.minimum(k + 1, nr_layers)
+        tt = travel_times[tt_idx]
+
+        g_k = gamma[ang_idx, k]
+        r_k = radius[ang_idx, k]
+        t_k = total_time[ang_idx, k]
+        t_next = total_time[ang_idx, k_next]
+        tau = tt - t_k
+        # the last gradient is never used (radius is zero), we just pad it to use the same indices
+        grad_k = np.append(gradient, 0.0)[k]
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+
+            # zero radius: linearly interpolate the speed within the layer (projecting the last speed to
+            # infinite depth when past the last layer)
+            end_speed = np.where(tt >= t_next, speed[k_next],
+                                 (speed[k_next] - speed[k]) / (t_next - t_k) * (tt - t_k) + speed[k])
+            end_speed = np.where(tt <= t_k, speed[k], end_speed)
+            end_speed = np.where(k < nr_layers, end_speed, speed[k])
+            avg_speed = (speed[k] + end_speed) / 2.0
+            straight_depth = avg_speed * tau * cos(g_k) + depth[k]
+            straight_range = avg_speed * tau * sin(g_k) + total_range[ang_idx, k]
+
+            # curved path
+            beta = 2 * arctan(tan(g_k / 2.0) * exp(grad_k * tau))
+            curved_depth = r_k * (sin(beta) - sin(g_k)) + depth[k]
+            curved_range = r_k * (-cos(beta) + cos(g_k)) + total_range[ang_idx, k]
+
+        is_straight = r_k == 0
+        ret[ang_idx, tt_idx, 1] = np.where(is_straight, straight_depth, curved_depth)
+        ret[ang_idx, tt_idx, 2] = np.where(is_straight, straight_range, curved_range)
+
+        return ret
@@ -0,0 +1,180 @@
+import math
+import numpy
+from scipy.interpolate import interp1d
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class TracedProfile:
+    """Ray-traced profile for a set of launch angles (ref: Lurton, An Introduction to UA, p.50-52)
+
+    The rays are stored as a (angles, 3, samples) array with travel time, across-track distance and depth,
+    interpolated on a depth grid (starting from zero) at the passed resolution down to the max valid depth.
+    Out-of-range values are set to -1.
+    """
+
+    def __init__(self, ssp, half_swath=70, avg_depth=10000, tss_depth=None, tss_value=None, depth_resolution=0.2):
+        self.avg_depth = avg_depth
+        self.half_swath = half_swath
+        self.depth_resolution = depth_resolution
+
+        depths, speeds = self._select_samples(ssp=ssp, tss_depth=tss_depth, tss_value=tss_value)
+
+        logger.info("profile timestamp: %s" % ssp.meta.utc_time)
+        logger.debug("valid samples: %d" % (len(depths)), )
+        if len(depths) == 0:
+            raise RuntimeError("invalid profile with zero valid depth values")
+        logger.debug("depth: min %.2f, max %.2f" % (depths[0], depths[-1]))
+
+        angles = numpy.arange(0, int(math.ceil(self.half_swath + 1)))
+        total_z, total_x, total_t = self._trace(angles=angles, depths=depths, speeds=speeds)
+
+        if len(depths) > 1:
+            with numpy.errstate(divide='ignore', invalid='ignore'):
+                self.harmonic_means = ((total_z[-1] - total_z[0]) / (total_t[:, -1] - total_t[:, 0])).tolist()
+
+            # interpolate between 0 and the max depth with the passed resolution
+            nr_samples = int(math.floor(total_z.max() / self.depth_resolution)) + 1
+            interp_z = numpy.arange(nr_samples, dtype=numpy.float64) * self.depth_resolution
+            f_xt = interp1d(total_z, numpy.vstack([total_t, total_x]), kind='cubic', axis=1,
+                            bounds_error=False, fill_value=-1)
+            interp_xt = f_xt(interp_z)
+
+            self.rays = numpy.empty((len(angles), 3, nr_samples), dtype=numpy.float64)
+            self.rays[:, 0] = interp_xt[:len(angles)]
+            self.rays[:, 1] = interp_xt[len(angles):]
+            self.rays[:, 2] = interp_z
+
+        else:
+            self.harmonic_means = [depths[0], ] * len(angles)
+            self.rays = numpy.empty((len(angles), 3, 1), dtype=numpy.float64)
+            self.rays[:, 0] = total_t
+            self.rays[:, 1] = total_x
+            self.rays[:, 2] = total_z
+
+        logger.debug("rays: %d (%d samples per-ray)" % (self.rays.shape[0], self.rays.shape[2]))
+        self.date_time = ssp.meta.utc_time
+        self.latitude = ssp.meta.latitude
+        self.longitude = ssp.meta.longitude
+        self.data = [depths, speeds]
+
+    def _select_samples(self, ssp, tss_depth, tss_value):
+        """Select samples for the ray tracing (must be deeper than the transducer depth)"""
+        vi = ssp.proc_valid
+        depths = ssp.proc.depth[vi]
+        speeds = ssp.proc.speed[vi]
+
+        # skip samples at depth less than the draft
+        if tss_depth is not None:
+            deeper = depths > tss_depth
+            depths = depths[deeper]
+            speeds = speeds[deeper]
+
+        # stop after the first sample deeper than the avg depth (safer)
+        too_deep = numpy.flatnonzero(depths > self.avg_depth)
+        if too_deep.size > 0:
+            depths = depths[:too_deep[0] + 1]
+            speeds = speeds[:too_deep[0] + 1]
+
+        if tss_depth is not None:
+            depths = numpy.hstack([[tss_depth, ], depths])
+        if tss_value is not None:
+            speeds = numpy.hstack([[tss_value, ], speeds])
+        depths = numpy.array(depths, dtype=numpy.float64)
+        speeds = numpy.array(speeds, dtype=numpy.float64)
+
+        # remove extension value (if any)
+        if len(depths) > 3:
+            if (depths[-1] - depths[-2]) > 1000:
+                logger.info("removed latest extension depth: %s" % depths[-1])
+                depths = depths[:-1]
+                speeds = speeds[:-1]
+
+        return depths, speeds
+
+    @classmethod
+    def _trace(cls, angles, depths, speeds):
+        """Trace all the angles at once
+
+        Return the cumulative depth (common to all the angles), and the (angles, samples) cumulative
+        across-track distance and travel time.
+        """
+        nr_angles = len(angles)
+
+        # calculate delta (next - current)
+        dz = numpy.diff(depths)
+        dc = numpy.diff(speeds)
+
+        # Snell's law: cos(beta) / speed is constant along the ray, but cos(beta) is capped to 1
+        beta_0 = numpy.radians(90.0 - numpy.array(angles, dtype=numpy.float64))
+        beta_cos = numpy.cos(beta_0)[:, numpy.newaxis] * (speeds / speeds[0])[numpy.newaxis, :]
+        cap = numpy.maximum.accumulate(numpy.maximum(beta_cos, 1.0), axis=1)
+        for ang in numpy.flatnonzero(cap[:, -1] > 1.0):
+            logger.warning("angle %d -> invalid beta cos for %d samples"
+                           % (angles[ang], numpy.count_nonzero(cap[ang] > 1.0)))
+        beta_cos /= cap
+        beta = numpy.arccos(beta_cos)
+        beta[:, 0] = beta_0
+
+        # the same-depth samples just adjust the ray angle
+        moving = dz != 0
+        dz = dz[moving]
+        dc = dc[moving]
+        c_top = speeds[:-1][moving]
+        c_bottom = speeds[1:][moving]
+        b_top = beta[:, :-1][:, moving]
+        b_bottom = beta[:, 1:][:, moving]
+
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+
+            # "constant speed" case: no curvature
+            straight_dx = dz / numpy.tan(b_bottom)
+            straight_dt = numpy.sqrt(straight_dx ** 2 + dz ** 2) / c_bottom
+
+            gradient = dc / dz  # Lurton, (2.64)
+            b_top_cos = numpy.cos(b_top)
+            curve = numpy.where(b_top_cos == 0, 0.0, c_top / (gradient * b_top_cos))  # Lurton, (2.66)
+            curved_dx = curve * (numpy.sin(b_top) - numpy.sin(b_bottom))  # Lurton, (2.67)
+            curved_dt = numpy.abs((1 / gradient) *
+                                  numpy.log((c_bottom / c_top) *
+                                            numpy.abs((1 + numpy.sin(b_top)) / (1 + numpy.sin(b_bottom)))))  # (2.70)
+
+        is_straight = dc == 0
+        dx = numpy.where(is_straight, straight_dx, curved_dx)
+        dt = numpy.where(is_straight, straight_dt, curved_dt)
+
+        total_z = numpy.empty(dz.size + 1, dtype=numpy.float64)
+        total_z[0] = depths[0]
+        total_z[1:] = depths[0] + numpy.cumsum(dz)
+        total_x = numpy.zeros((nr_angles, dz.size + 1), dtype=numpy.float64)
+        total_x[:, 1:] = numpy.cumsum(dx, axis=1)
+        total_t = numpy.zeros((nr_angles, dz.size + 1), dtype=numpy.float64)
+        total_t[:, 1:] = numpy.cumsum(dt, axis=1)
+
+        return total_z, total_x, total_t
+
+    def str_rays(self):
+        msg = str()
+        for ang in range(len(self.rays)):
+            msg += "[%d]\n" % ang
+
+            for idx in range(len(self.rays[ang][0])):
+                msg += "%10.2f %10.2f %10.2f\n" \
+                       % (self.rays[ang][0][idx], self.rays[ang][1][idx], self.rays[ang][2][idx])
+        return msg
+
+    def __repr__(self):
+        msg = "<%s>\n" % self.__class__.__name__
+
+        msg += "  <timestamp: %s>\n" % self.date_time
+        msg += "  <latitude: %.7f>\n" % self.latitude
+        msg += "  <longitude: %.7f>\n" % self.longitude
+        msg += "  <avg depth: %.3f>\n" % self.avg_depth
+        msg += "  <half swatch: %.1f>\n" % self.half_swath
+        msg += "  <depth resolution: %.3f>\n" % self.depth_resolution
+        msg += "  <profile valid samples: %d>" % len(self.data[0])
+        msg += "  <rays: %d>\n" % len(self.rays)
+        msg += "  <samples per ray: %d>\n" % len(self.rays[0][0])
+
+        return msg
@@ -4,64 +4,211 @@ import logging
 logger = logging.getLogger(__name__)
 
 
+def _field(name):
+    """Create the property to access a field as a view of the samples buffer"""
+
+    def getter(self):
+        return self._view(name)
+
+    def setter(self, value):
+        self._set(name, value)
+
+    return property(getter, setter, doc="The %s values (view of the samples buffer)" % name)
+
+
+class _TrackedArray(np.ndarray):
+    """View of a samples field that invalidates the cached masks of its owner on item assignment"""
+
+    def __array_finalize__(self, obj):
+        # copies, fancy-indexed selections and ufunc outputs do not share the buffer, thus are not tracked
+        owner = getattr(obj, 'owner', None)
+        if (owner is not None) and not np.may_share_memory(self, obj):
+            owner = None
+        self.owner = owner
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        if self.owner is not None:
+            self.owner.invalidate_masks()
+
+
 class Samples:
+    """Samples stored as rows of a single 2D buffer with amortized growth
+
+    Each field (e.g., depth) is accessed as a view of the first num_samples values of its row,
+    while the field is None until initialized.
+
+    The masks on flag and source values are cached, and invalidated by bumping the version when
+    the number of samples changes or when flag and source are modified.
+    """
+
+    fields = ['pressure', 'depth', 'speed', 'temp', 'conductivity', 'sal', 'source', 'flag']
+    tracked_fields = ['source', 'flag']
+    min_capacity = 16
+
+    pressure = _field('pressure')
+    depth = _field('depth')
+    speed = _field('speed')
+    temp = _field('temp')
+    conductivity = _field('conductivity')
+    sal = _field('sal')
+    source = _field('source')
+    flag = _field('flag')
+
     def __init__(self):
-        self.num_samples = 0
-        self.pressure = None
-        self.depth = None
-        self.speed = None
-        self.temp = None
-        self.conductivity = None
-        self.sal = None
-        self.source = None
-        self.flag = None
+        self._num_samples = 0
+        self._buffer = np.zeros((len(self.fields), 0))
+        self._initialized = set()
+        self._version = 0
+        self._masks = dict()
+
+    @property
+    def num_samples(self):
+        return self._num_samples
+
+    @num_samples.setter
+    def num_samples(self, value):
+        self.resize(value)
+
+    @property
+    def capacity(self):
+        return self._buffer.shape[1]
+
+    @property
+    def version(self):
+        return self._version
+
+    def invalidate_masks(self):
+        """Bump the version, so that the cached masks are recomputed"""
+        self._version += 1
+
+    def mask(self, flag, source=None):
+        """Return the cached (read-only) mask of the samples with the passed flag (and source, if passed)"""
+        if ('flag' not in self._initialized) or ((source is not None) and ('source' not in self._initialized)):
+            return np.equal(self.flag, flag)
+
+        key = (flag, source)
+        version, mask = self._masks.get(key, (None, None))
+        if version != self._version:
+            mask = np.equal(self._buffer[self.fields.index('flag'), :self._num_samples], flag)
+            if source is not None:
+                mask &= np.equal(self._buffer[self.fields.index('source'), :self._num_samples], source)
+            mask.flags.writeable = False
+            self._masks[key] = (self._version, mask)
+        return mask
+
+    def select(self, mask):
+        """Return new samples with a copy of the initialized fields at the passed mask"""
+        selected = Samples()
+        selected.num_samples = np.count_nonzero(mask)
+        for name in self._initialized:
+            setattr(selected, name, getattr(self, name)[mask])
+        return selected
+
+    def _view(self, name):
+        if name not in self._initialized:
+            return None
+        view = self._buffer[self.fields.index(name), :self._num_samples]
+        if name in self.tracked_fields:
+            view = view.view(_TrackedArray)
+            view.owner = self
+        return view
+
+    def _set(self, name, value):
+        if value is None:
+            self._initialized.discard(name)
+            self.invalidate_masks()
+            return
+
+        if (np.ndim(value) > 0) and (len(value) != self._num_samples):
+            logger.debug("resizing samples to %d for the passed %s values" % (len(value), name))
+            self.resize(len(value))
+        self._buffer[self.fields.index(name), :self._num_samples] = value
+        self._initialized.add(name)
+        if name in self.tracked_fields:
+            self.invalidate_masks()
+
+    def _init_field(self, name):
+        self._buffer[self.fields.index(name), :self._num_samples] = 0.0
+        self._initialized.add(name)
+        if name in self.tracked_fields:
+            self.invalidate_masks()
 
     def init_pressure(self):
-        self.pressure = np.zeros(self.num_samples)
+        self._init_field('pressure')
 
     def init_depth(self):
-        self.depth = np.zeros(self.num_samples)
+        self._init_field('depth')
 
     def init_speed(self):
-        self.speed = np.zeros(self.num_samples)
+        self._init_field('speed')
 
     def init_temp(self):
-        self.temp = np.zeros(self.num_samples)
+        self._init_field('temp')
 
     def init_conductivity(self):
-        self.conductivity = np.zeros(self.num_samples)
+        self._init_field('conductivity')
 
     def init_sal(self):
-        self.sal = np.zeros(self.num_samples)
+        self._init_field('sal')
 
     def init_source(self):
-        self.source = np.zeros(self.num_samples)
+        self._init_field('source')
 
     def init_flag(self):
-        self.flag = np.zeros(self.num_samples)
+        self._init_field('flag')
+
+    def reserve(self, capacity):
+        """Make room for at least the passed number of samples (the capacity grows geometrically)"""
+        if capacity <= self.capacity:
+            return
+
+        buffer = np.zeros((len(self.fields), max(capacity, 2 * self.capacity, self.min_capacity)))
+        buffer[:, :self._num_samples] = self._buffer[:, :self._num_samples]
+        self._buffer = buffer
 
     def resize(self, count):
         """Resize the arrays (if present) to the new given number of elements"""
-        if self.num_samples == count:
+        if self._num_samples == count:
             return
-        self.num_samples = count
-
-        if self.pressure is not None:
-            self.pressure = np.resize(self.pressure, count)
-        if self.depth is not None:
-            self.depth = np.resize(self.depth, count)
-        if self.speed is not None:
-            self.speed = np.resize(self.speed, count)
-        if self.temp is not None:
-            self.temp = np.resize(self.temp, count)
-        if self.conductivity is not None:
-            self.conductivity = np.resize(self.conductivity, count)
-        if self.sal is not None:
-            self.sal = np.resize(self.sal, count)
-        if self.source is not None:
-            self.source = np.resize(self.source, count)
-        if self.flag is not None:
-            self.flag = np.resize(self.flag, count)
+
+        self.reserve(count)
+        if count > self._num_samples:
+            self._buffer[:, self._num_samples:count] = 0.0
+        self._num_samples = count
+        self.invalidate_masks()
+
+    def insert(self, index, **values):
+        """Insert samples before the passed index (or sorted indices), shifting the following samples in place
+
+        The passed values (scalar or one per index) are stored in the named fields, the others are set to zero.
+        """
+        indices = np.atleast_1d(index)
+        count = indices.size
+        old_size = self._num_samples
+        self.reserve(old_size + count)
+
+        if count == 1:
+            idx = int(indices[0])
+            self._buffer[:, idx + 1:old_size + 1] = self._buffer[:, idx:old_size]
+            inserted = indices
+
+        else:
+            inserted = indices + np.arange(count)
+            shifted = np.ones(old_size + count, dtype=bool)
+            shifted[inserted] = False
+            self._buffer[:, :old_size + count][:, shifted] = self._buffer[:, :old_size].copy()
+
+        self._num_samples = old_size + count
+        self._buffer[:, inserted] = 0.0
+        for name, value in values.items():
+            self._buffer[self.fields.index(name), inserted] = value
+        self.invalidate_masks()
+
+    def append(self, **values):
+        """Append samples at the end (as many as the passed values), see insert()"""
+        count = max([np.size(value) for value in values.values()] + [1, ])
+        self.insert(np.full(count, self._num_samples), **values)
 
     def __repr__(self):
         msg = "  <Samples>\n"
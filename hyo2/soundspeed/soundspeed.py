@@ -19,6 +19,7 @@ from hyo2.soundspeed.base.callbacks.abstract_callbacks import AbstractCallbacks
 from hyo2.soundspeed.base.callbacks.cli_callbacks import CliCallbacks
 from hyo2.soundspeed.base.setup import Setup
 from hyo2.soundspeed.db.db import ProjectDb
+from hyo2.soundspeed.db.pool import ProjectDbPool
 from hyo2.soundspeed.listener.listeners import Listeners
 from hyo2.soundspeed.logger.sqlitelogging import SqliteLogging
 from hyo2.soundspeed.profile.profilelist import ProfileList
@@ -68,6 +69,7 @@ class SoundSpeedLibrary:
         self.listeners = Listeners(prj=self)
         self.cb.sis_listener = self.listeners.sis4  # to provide default values from SIS4 (if available)  #TODO: SIS5?
         self.server = Server(prj=self)
+        self.db_pool = ProjectDbPool()  # open project dbs
         self.logs = SqliteLogging(self._release_folder)  # (user and server) loggers
 
         self.logging()  # Set on/off logging for user and server based on loaded settings
@@ -105,6 +107,8 @@ class SoundSpeedLibrary:
             self.server.stop()
             self.server.join(2)
 
+        self.db_pool.close()
+
         logger.info("** > LIB: closed!")
 
     # --- library, release, atlases, and projects folders
@@ -434,34 +438,33 @@ class SoundSpeedLibrary:
         self.ssp = reader.ssp
         logger.debug("data file successfully parsed!")
 
-        # retrieve atlases data for each retrieved profile
-        for pr in self.ssp.l:
-
-            if self.use_woa09() and self.has_woa09() and not skip_atlas:
-                pr.woa09 = self.atlases.woa09.query(lat=pr.meta.latitude, lon=pr.meta.longitude,
-                                                    datestamp=pr.meta.utc_time)
-
-            if self.use_woa13() and self.has_woa13() and not skip_atlas:
-                pr.woa13 = self.atlases.woa13.query(lat=pr.meta.latitude, lon=pr.meta.longitude,
-                                                    datestamp=pr.meta.utc_time)
-
-            if self.use_rtofs() and not skip_atlas:
-                # noinspection PyBroadException
-                try:
-                    pr.rtofs = self.atlases.rtofs.query(lat=pr.meta.latitude, lon=pr.meta.longitude,
-                                                        datestamp=pr.meta.utc_time)
-                except Exception:
-                    pr.rtofs = None
-                    logger.warning("unable to retrieve RTOFS data")
-
-            if self.use_gomofs() and not skip_atlas:
-                # noinspection PyBroadException
-                try:
-                    pr.gomofs = self.atlases.gomofs.query(lat=pr.meta.latitude, lon=pr.meta.longitude,
-                                                          datestamp=pr.meta.utc_time)
-                except Exception:
-                    pr.gomofs = None
-                    logger.warning("unable to retrieve GOMOFS data")
+        if skip_atlas:
+            return
+
+        # retrieve atlases data for all the retrieved profiles at once
+        lats = [pr.meta.latitude for pr in self.ssp.l]
+        lons = [pr.meta.longitude for pr in self.ssp.l]
+        datestamps = [pr.meta.utc_time for pr in self.ssp.l]
+
+        if self.use_woa09() and self.has_woa09():
+            results = self.atlases.woa09.query_many(lats=lats, lons=lons, datestamps=datestamps)
+            for pr, result in zip(self.ssp.l, results):
+                pr.woa09 = result
+
+        if self.use_woa13() and self.has_woa13():
+            results = self.atlases.woa13.query_many(lats=lats, lons=lons, datestamps=datestamps)
+            for pr, result in zip(self.ssp.l, results):
+                pr.woa13 = result
+
+        if self.use_rtofs():
+            results = self.atlases.rtofs.query_many(lats=lats, lons=lons, datestamps=datestamps)
+            for pr, result in zip(self.ssp.l, results):
+                pr.rtofs = result
+
+        if self.use_gomofs():
+            results = self.atlases.gomofs.query_many(lats=lats, lons=lons, datestamps=datestamps)
+            for pr, result in zip(self.ssp.l, results):
+                pr.gomofs = result
 
     # --- receive data
 
@@ -683,10 +686,14 @@ class SoundSpeedLibrary:
             # special case for Kongsberg asvp format
             if name == 'asvp':
 
+                # pick the tolerance from the number of thinned samples, then check the size of the sis samples
+                # (since the preparation may add the samples at 0 and 12000 m)
                 tolerances = [0.01, 0.03, 0.06, 0.1, 0.5]
-                for tolerance in tolerances:
+                thin_levels = self.cur.thin_levels()
+                tolerance = self.cur.thin_tolerance(tolerances=tolerances, max_samples=1000, levels=thin_levels)
+                for tolerance in tolerances[tolerances.index(tolerance):]:
 
-                    if not self.prepare_sis(thin_tolerance=tolerance):
+                    if not self.prepare_sis(thin_tolerance=tolerance, thin_levels=thin_levels):
                         logger.warning("issue in preparing the data for SIS")
                         return False
 
@@ -748,6 +755,13 @@ class SoundSpeedLibrary:
     def current_project(self, value):
         self.setup.current_project = value
 
+    def project_db(self, project=None):
+        """Return the open project db (for the calling thread) of the passed project (the current one, if None)"""
+        if project is None:
+            project = self.current_project
+
+        return self.db_pool.project_db(projects_folder=self.projects_folder, project_name=project)
+
     def rename_current_project(self, name):
         old_db_path = os.path.join(self.projects_folder, self.current_project + ".db")
         if not os.path.exists(old_db_path):
@@ -757,6 +771,9 @@ class SoundSpeedLibrary:
         if os.path.exists(new_db_path):
             raise RuntimeError("the project already exists: %s" % new_db_path)
 
+        # closing the connections also checkpoints the WAL journal into the db file
+        self.db_pool.close_project(projects_folder=self.projects_folder, project_name=self.current_project)
+
         shutil.copy(old_db_path, new_db_path)
         if not os.path.exists(new_db_path):
             raise RuntimeError("unable to copy the project db: %s" % new_db_path)
@@ -775,6 +792,7 @@ class SoundSpeedLibrary:
         if not os.path.exists(db_path):
             raise RuntimeError("unable to locate the project to delete: %s" % db_path)
 
+        self.db_pool.close_project(projects_folder=self.projects_folder, project_name=name)
         os.remove(db_path)
 
     def list_projects(self):
@@ -796,7 +814,7 @@ class SoundSpeedLibrary:
         if not self.has_ssp():
             raise RuntimeError("Data not loaded")
 
-        db = ProjectDb(projects_folder=self.projects_folder, project_name=self.current_project)
+        db = self.project_db()
 
         # special case: synthetic multiple profiles, we just save the average profile
         if (self.ssp.l[0].meta.sensor_type == Dicts.sensor_types['Synthetic']) and \
@@ -808,7 +826,6 @@ class SoundSpeedLibrary:
 
         else:
             success = db.remove_casts(self.ssp)
-        db.disconnect()
 
         # take care of listeners
         if success:
@@ -826,7 +843,7 @@ class SoundSpeedLibrary:
         if not self.has_ssp():
             raise RuntimeError("Data not loaded")
 
-        db = ProjectDb(projects_folder=self.projects_folder, project_name=self.current_project)
+        db = self.project_db()
 
         # special case: synthetic multiple profiles, we just save the average profile
         if (self.ssp.l[0].meta.sensor_type == Dicts.sensor_types['Synthetic']) and \
@@ -838,7 +855,6 @@ class SoundSpeedLibrary:
 
         else:
             success = db.add_casts(self.ssp)
-        db.disconnect()
 
         # take care of listeners
         if success:
@@ -854,16 +870,22 @@ class SoundSpeedLibrary:
         if project is None:
             project = self.current_project
 
-        db = ProjectDb(projects_folder=self.projects_folder, project_name=project)
+        db = self.project_db(project=project)
         lst = db.list_profiles()
-        db.disconnect()
         return lst
 
+    def db_migrate_to_blob_storage(self, project=None):
+        """Convert the project db to store the samples of each cast as compressed blobs"""
+        if project is None:
+            project = self.current_project
+
+        db = self.project_db(project=project)
+        return db.migrate_to_blob_storage()
+
     def db_retrieve_profile(self, pk):
         """Retrieve a profile by primary key"""
-        db = ProjectDb(projects_folder=self.projects_folder, project_name=self.current_project)
+        db = self.project_db()
         ssp = db.profile_by_pk(pk=pk)
-        db.disconnect()
         return ssp
 
     def db_import_data_from_db(self, input_db_path):
@@ -872,58 +894,40 @@ class SoundSpeedLibrary:
         in_project_name = os.path.splitext(os.path.basename(input_db_path))[0]
         logger.debug('input: folder: %s, db: %s' % (in_projects_folder, in_project_name))
 
+        # the input db is opened to bring its schema up-to-date before the merge
         in_db = ProjectDb(projects_folder=in_projects_folder, project_name=in_project_name)
+        in_version = in_db.get_db_version()
+        in_db.disconnect()
 
-        if in_db.get_db_version() > 2:
-            raise RuntimeError("unsupported db version: %s" % in_db.get_db_version())
-        logger.debug('input project db version: %s' % in_db.get_db_version())
-
-        cur_db = ProjectDb(projects_folder=self.projects_folder, project_name=self.current_project)
-
-        in_lst = in_db.list_profiles()
-        cur_lst = cur_db.list_profiles()
-        logger.debug('profiles to import: %s' % len(in_lst))
-        logger.debug('current profiles: %s' % len(cur_lst))
-
-        # create list of current pks
-        cur_pks = list()
-        for cur_ssp in cur_lst:
-            cur_pks.append("%s;%s" % (cur_ssp[1], cur_ssp[2]))
-        # print(cur_pks)
-
-        # copy after having checked that the profile is not already there
-        pk_issues = list()
-        pk_done = list()
-
-        for in_ssp in in_lst:
-
-            in_key = "%s;%s" % (in_ssp[1], in_ssp[2])
-            # print(in_key)
-            if in_key in cur_pks:
-                pk_issues.append(in_ssp[0])
-                continue
-
-            ssp = in_db.profile_by_pk(pk=in_ssp[0])
-            success = cur_db.add_casts(ssp)
-            if success:
-                pk_done.append(in_ssp[0])
-
-            else:
-                pk_issues.append(in_ssp[0])
-
-            continue
+        cur_db = self.project_db()
+        if in_version > cur_db.cur_version:
+            raise RuntimeError("unsupported db version: %s" % in_version)
+        logger.debug('input project db version: %s' % in_version)
 
-        in_db.disconnect()
+        pk_issues, pk_done = cur_db.import_casts(input_db_path=in_db.db_path)
+        if pk_issues is None:
+            raise RuntimeError("unable to import data from: %s" % input_db_path)
 
         return pk_issues, pk_done
 
     def db_timestamp_list(self):
         """Retrieve a list with the timestamp of all the profiles"""
-        db = ProjectDb(projects_folder=self.projects_folder, project_name=self.current_project)
+        db = self.project_db()
         lst = db.timestamp_list()
-        db.disconnect()
         return lst
 
+    def db_query_casts(self, bbox=None, center=None, radius_m=None, time_range=None, limit=None):
+        """Retrieve the profiles by location and time (see ProjectDb.query_casts)"""
+        db = self.project_db()
+        lst = db.query_casts(bbox=bbox, center=center, radius_m=radius_m, time_range=time_range, limit=limit)
+        return lst
+
+    def db_climatology(self, pks=None, bbox=None, time_range=None, edges=None, field='speed'):
+        """Aggregate by depth bins the processed profiles of the project (see ProjectDb.climatology)"""
+        db = self.project_db()
+        aggregate = db.climatology(pks=pks, bbox=bbox, time_range=time_range, edges=edges, field=field)
+        return aggregate
+
     def profile_stats(self):
         msg = str()
         if not self.has_ssp():
@@ -1023,9 +1027,8 @@ class SoundSpeedLibrary:
 
     def delete_db_profile(self, pk):
         """Retrieve a profile by primary key"""
-        db = ProjectDb(projects_folder=self.projects_folder, project_name=self.current_project)
+        db = self.project_db()
         ret = db.delete_profile_by_pk(pk=pk)
-        db.disconnect()
         return ret
 
     def ray_tracing_comparison(self, pk1, pk2):
@@ -1152,52 +1155,45 @@ class SoundSpeedLibrary:
     # plotting
 
     def raise_plot_window(self):
-        db = ProjectDb(projects_folder=self.projects_folder, project_name=self.current_project)
+        db = self.project_db()
         _ = db.plot.raise_window()
-        db.disconnect()
 
     def map_db_profiles(self, pks=None):
         """List the profile on the db"""
-        db = ProjectDb(projects_folder=self.projects_folder, project_name=self.current_project)
+        db = self.project_db()
         ret = db.plot.map_profiles(pks=pks)
-        db.disconnect()
         return ret
 
     def save_map_db_profiles(self):
         """List the profile on the db"""
-        db = ProjectDb(projects_folder=self.projects_folder, project_name=self.current_project)
+        db = self.project_db()
         ret = db.plot.map_profiles(save_fig=True, output_folder=self.outputs_folder)
-        db.disconnect()
         return ret
 
     def aggregate_plot(self, dates):
         """Create an aggregate plot"""
-        db = ProjectDb(projects_folder=self.projects_folder, project_name=self.current_project)
+        db = self.project_db()
         success = db.plot.aggregate_plot(dates=dates, output_folder=self.outputs_folder, save_fig=False)
-        db.disconnect()
         return success
 
     def save_aggregate_plot(self, dates):
         """Create an aggregate plot"""
-        db = ProjectDb(projects_folder=self.projects_folder, project_name=self.current_project)
+        db = self.project_db()
         success = db.plot.aggregate_plot(dates=dates, output_folder=self.outputs_folder, save_fig=True)
-        db.disconnect()
         return success
 
     def plot_daily_db_profiles(self):
         """Plot the profile on the db by day"""
-        db = ProjectDb(projects_folder=self.projects_folder, project_name=self.current_project)
+        db = self.project_db()
         success = db.plot.daily_plots(project_name=self.current_project,
                                       output_folder=self.outputs_folder, save_fig=False)
-        db.disconnect()
         return success
 
     def save_daily_db_profiles(self):
         """Save figure with the profile on the db by day"""
-        db = ProjectDb(projects_folder=self.projects_folder, project_name=self.current_project)
+        db = self.project_db()
         success = db.plot.daily_plots(project_name=self.current_project,
                                       output_folder=self.outputs_folder, save_fig=True)
-        db.disconnect()
         return success
 
     # exporting
@@ -1205,12 +1201,11 @@ class SoundSpeedLibrary:
     def export_db_profiles_metadata(self, ogr_format=GdalAux.ogr_formats['ESRI Shapefile'],
                                     filter_fields=None):
         """Export the db profile metadata"""
-        db = ProjectDb(projects_folder=self.projects_folder, project_name=self.current_project)
+        db = self.project_db()
         lst = db.export.export_profiles_metadata(project_name=self.current_project,
                                                  output_folder=self.outputs_folder,
                                                  ogr_format=ogr_format,
                                                  filter_fields=filter_fields)
-        db.disconnect()
         return lst
 
     # --- filter
@@ -1427,7 +1422,12 @@ class SoundSpeedLibrary:
 
         return True
 
-    def prepare_sis(self, apply_thin=True, apply_12k=True, thin_tolerance=0.01):
+    def prepare_sis(self, apply_thin=True, apply_12k=True, thin_tolerance=0.01, thin_levels=None):
+        """Prepare the sis samples from the processed ones
+
+        When several tolerances are attempted, pass the outcome of cur.thin_levels() as thin_levels
+        to avoid to re-run the thinning algorithm at each attempt.
+        """
         if not self.has_ssp():
             logger.warning("no profile!")
             return False
@@ -1435,7 +1435,7 @@ class SoundSpeedLibrary:
         self.cur.clone_proc_to_sis()
 
         if apply_thin:
-            if not self.cur.thin(tolerance=thin_tolerance):
+            if not self.cur.thin(tolerance=thin_tolerance, levels=thin_levels):
                 logger.warning("thinning issue")
                 return False
         else:
@@ -1444,11 +1444,12 @@ class SoundSpeedLibrary:
         # filter the data for depth
         si = self.cur.sis_thinned
         valid = self.cur.sis.flag[si][:]
+        depths = self.cur.sis.depth[si]
         last_depth = -1.0
         # logger.debug('valid size: %s' % valid.size)
-        for i in range(self.cur.sis.flag[si].size):
+        for i in range(valid.size):
 
-            depth = self.cur.sis.depth[si][i]
+            depth = depths[i]
             if abs(depth - last_depth) < 0.02:  # ignore sample with small separation
                 valid[i] = Dicts.flags['sis']
                 # logger.debug('small change: %s %s %s' % (i, last_depth, depth))
@@ -1599,6 +1600,12 @@ class SoundSpeedLibrary:
     def download_gomofs(self, datestamp=None):
         return self.atlases.gomofs.download_db(datestamp=datestamp)
 
+    def compile_woa09(self):
+        return self.atlases.woa09.compile_grids()
+
+    def compile_woa13(self):
+        return self.atlases.woa13.compile_grids()
+
     # --- listeners
 
     def use_sis4(self):
@@ -407,15 +407,17 @@ class Editor(AbstractWidget):
         self.main_win.switch_to_editor_tab()
 
         tolerances = [0.01, 0.1, 0.5]
-        for tolerance in tolerances:
+        thin_levels = self.lib.cur.thin_levels()
+        tolerance = self.lib.cur.thin_tolerance(tolerances=tolerances, max_samples=1000, levels=thin_levels)
+        for tolerance in tolerances[tolerances.index(tolerance):]:
 
-            if not self.lib.prepare_sis(thin_tolerance=tolerance):
+            if not self.lib.prepare_sis(thin_tolerance=tolerance, thin_levels=thin_levels):
                 msg = "Issue in preview the thinning"
                 # noinspection PyCallByClass
                 QtWidgets.QMessageBox.warning(self, "Thinning preview", msg, QtWidgets.QMessageBox.Ok)
                 return
 
-            # checking for number of samples
+            # checking for number of samples (the sis preparation may add the samples at 0 and 12000 m)
             si = self.lib.cur.sis_thinned
             thin_profile_length = self.lib.cur.sis.flag[si].size
             logger.debug("thin profile size: %d (with tolerance: %.3f)" % (thin_profile_length, tolerance))
@@ -0,0 +1,77 @@
+import unittest
+import os
+from datetime import date, datetime
+
+import numpy as np
+
+from hyo2.soundspeed.atlas.woa09 import Woa09
+from hyo2.soundspeed.profile.profile import Profile
+from hyo2.soundspeed.profile.profilelist import ProfileList
+
+
+class TestSoundSpeedAtlasCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cur_dir = os.path.abspath(os.path.dirname(__file__))
+        self.atlas = Woa09(data_folder=self.cur_dir, prj=None)
+
+        ssp = Profile()
+        ssp.meta.latitude = 43.1
+        ssp.meta.longitude = -70.2
+        ssp.meta.utc_time = datetime(2020, 7, 3)
+        ssp.meta.original_path = "WOA09_20200703"
+        ssp.init_data(3)
+        ssp.data.depth = np.array([0.0, 10.0, 20.0])
+        ssp.data.speed = np.array([1500.0, 1495.0, 1490.0])
+        self.profiles = ProfileList()
+        self.profiles.append_profile(ssp)
+
+    def tearDown(self):
+        pass
+
+    def test_lookup(self):
+        key = self.atlas.cache_key(lat_idx=133, lon_idx=290, time_slot=(6, 2))
+        found, profiles = self.atlas.cache_lookup(key, lat=43.1, lon=-70.2, datestamp=date(2020, 7, 3))
+        self.assertFalse(found)
+        self.assertIs(self.atlas.cache_store(key, self.profiles), self.profiles)
+
+        # the cached result is not affected by changes to the returned profiles
+        self.profiles.cur.data.speed[:] = 0.0
+        found, profiles = self.atlas.cache_lookup(key, lat=42.9, lon=289.7, datestamp=date(2020, 7, 10))
+        self.assertTrue(found)
+        self.assertEqual(profiles.cur.data.speed[0], 1500.0)
+        self.assertEqual(profiles.cur.meta.latitude, 42.9)
+        self.assertAlmostEqual(profiles.cur.meta.longitude, -70.3)
+        self.assertEqual(profiles.cur.meta.utc_time, datetime(2020, 7, 10))
+        self.assertEqual(profiles.cur.meta.original_path, "WOA09_20200710")
+        self.assertEqual((self.atlas.cache_hits, self.atlas.cache_misses), (1, 1))
+
+        # positions without data are cached as well
+        land_key = self.atlas.cache_key(lat_idx=130, lon_idx=280, time_slot=(6, 2))
+        self.atlas.cache_store(land_key, None)
+        self.assertEqual(self.atlas.cache_lookup(land_key, lat=40.0, lon=-80.0, datestamp=date(2020, 7, 3)),
+                         (True, None))
+
+        self.atlas.clear_data()
+        found, _ = self.atlas.cache_lookup(key, lat=42.9, lon=-70.3, datestamp=date(2020, 7, 10))
+        self.assertFalse(found)
+
+    def test_eviction(self):
+        self.atlas.cache_max_size = 2
+        keys = [self.atlas.cache_key(lat_idx=i, lon_idx=0, time_slot=(0, 0)) for i in range(3)]
+        for key in keys:
+            self.atlas.cache_store(key, self.profiles)
+        found, _ = self.atlas.cache_lookup(keys[0], lat=0.0, lon=0.0, datestamp=date(2020, 1, 1))
+        self.assertFalse(found)
+        found, _ = self.atlas.cache_lookup(keys[2], lat=0.0, lon=0.0, datestamp=date(2020, 1, 1))
+        self.assertTrue(found)
+
+        self.atlas.cache_max_age = -1.0
+        found, _ = self.atlas.cache_lookup(keys[2], lat=0.0, lon=0.0, datestamp=date(2020, 1, 1))
+        self.assertFalse(found)
+
+
+def suite():
+    s = unittest.TestSuite()
+    s.addTests(unittest.TestLoader().loadTestsFromTestCase(TestSoundSpeedAtlasCache))
+    return s
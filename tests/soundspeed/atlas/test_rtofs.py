@@ -1,7 +1,9 @@
 import unittest
 import os
 import shutil
+import tempfile
 import logging
+from datetime import date
 
 from hyo2.soundspeedmanager import AppInfo
 from hyo2.soundspeed.atlas.rtofs import Rtofs
@@ -42,6 +44,25 @@ class TestSoundSpeedAtlasRtofs(unittest.TestCase):
 
         prj.close()
 
+    def test_query_many_with_failed_date(self):
+        data_folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, data_folder)
+        rtofs = Rtofs(data_folder=data_folder, prj=None)
+        queried = list()
+
+        def query(lat, lon, datestamp=None, server_mode=False):
+            queried.append(datestamp)
+            if datestamp == date(2020, 1, 2):
+                raise RuntimeError('troubles in db download')
+            return lat
+
+        # the queries are sorted by date, and only the ones of the failed date return None
+        rtofs.query = query
+        dates = [date(2020, 1, 3), date(2020, 1, 2), date(2020, 1, 1), date(2020, 1, 2)]
+        results = rtofs.query_many(lats=[1.0, 2.0, 3.0, 4.0], lons=[0.0] * 4, datestamps=dates)
+        self.assertEqual(results, [1.0, None, 3.0, None])
+        self.assertEqual(queried, [date(2020, 1, 1), date(2020, 1, 2), date(2020, 1, 3)])
+
 
 def suite():
     s = unittest.TestSuite()
@@ -0,0 +1,37 @@
+import unittest
+
+import numpy as np
+
+from hyo2.soundspeed.atlas.abstract import AbstractAtlas
+
+
+class TestSoundSpeedAtlasWindows(unittest.TestCase):
+
+    def setUp(self):
+        # a (levels, lats, lons) grid where each value encodes its indices
+        levels, lats, lons = np.meshgrid(np.arange(3), np.arange(10), np.arange(20), indexing='ij')
+        self.grid = (levels * 10000 + lats * 100 + lons)[np.newaxis].astype(np.float32)
+
+    def tearDown(self):
+        pass
+
+    def test_window_indices(self):
+        lat_indices, lon_indices = AbstractAtlas.window_indices(lat_idx=0, lon_idx=19, radius=2, nr_lats=10, nr_lons=20)
+        np.testing.assert_array_equal(lat_indices, [0, 1, 2])
+        np.testing.assert_array_equal(lon_indices, [17, 18, 19, 0, 1])
+
+    def test_sub_window(self):
+        windows = [AbstractAtlas.window_indices(lat_idx=lat_idx, lon_idx=lon_idx, radius=2, nr_lats=10, nr_lons=20)
+                   for lat_idx, lon_idx in [(1, 19), (4, 2), (9, 10)]]
+        union = AbstractAtlas.union_window(windows)
+        np.testing.assert_array_equal(union[0], np.arange(10))
+        block = AbstractAtlas.read_window(self.grid, 0, union[0], union[1])
+        for window in windows:
+            np.testing.assert_array_equal(AbstractAtlas.sub_window(block, union=union, window=window),
+                                          AbstractAtlas.read_window(self.grid, 0, window[0], window[1]))
+
+
+def suite():
+    s = unittest.TestSuite()
+    s.addTests(unittest.TestLoader().loadTestsFromTestCase(TestSoundSpeedAtlasWindows))
+    return s
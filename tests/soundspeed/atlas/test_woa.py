@@ -0,0 +1,307 @@
+import unittest
+import os
+import shutil
+import tempfile
+from datetime import date
+
+import numpy as np
+from netCDF4 import Dataset
+
+from hyo2.soundspeed.atlas.woa09 import Woa09
+from hyo2.soundspeed.atlas.woa13 import Woa13
+
+fill_value = 9.96921E36
+
+
+def synthetic_field(rng, shape, valid_range, invalid_values):
+    """Random values with some invalid values, and masked values (more frequent at depth)"""
+    values = rng.uniform(valid_range[0], valid_range[1], shape)
+    for invalid in invalid_values:
+        values[rng.rand(*shape) < 0.03] = invalid
+    depth_ratio = np.arange(shape[1])[np.newaxis, :, np.newaxis, np.newaxis] / shape[1]
+    values[rng.rand(*shape) < 0.1 + 0.5 * depth_ratio] = fill_value
+    return values
+
+
+def write_synthetic_woa(rng, path, lat, lon, depth, time, temperature):
+    """Write a WOA-like netCDF file with the temperature (or salinity) mean and standard deviation"""
+    if temperature:
+        fields = {'t_an': ((-1.8, 30.0), [60.0]), 't_sd': ((0.1, 5.0), [70.0, -3.0])}
+    else:
+        fields = {'s_an': ((30.0, 38.0), [600.0, -1.0]), 's_sd': ((0.05, 2.0), [600.0, -1.0])}
+
+    ds = Dataset(path, 'w')
+    for name, values in [('time', time), ('depth', depth), ('lat', lat), ('lon', lon)]:
+        ds.createDimension(name, values.size)
+        ds.createVariable(name, 'f4', (name,))[:] = values
+    for name, (valid_range, invalid_values) in fields.items():
+        var = ds.createVariable(name, 'f4', ('time', 'depth', 'lat', 'lon'), fill_value=fill_value)
+        var.set_auto_mask(False)
+        var[:] = synthetic_field(rng, (time.size, depth.size, lat.size, lon.size), valid_range, invalid_values)
+    ds.close()
+
+
+def write_synthetic_woa09(rng, folder, land):
+    """Global 1-degree grid (as expected by Woa09), with a few time steps and depth levels"""
+    lat = np.arange(-89.5, 90.0, 1.0)
+    lon = np.arange(0.5, 360.0, 1.0)
+    for name, nr_times, nr_levels in [('annual', 1, 5), ('monthly', 4, 3), ('seasonal', 2, 5)]:
+        time = (np.arange(nr_times) + 0.5) * 365.0 / nr_times
+        depth = np.arange(nr_levels) * 50.0
+        write_synthetic_woa(rng, os.path.join(folder, 'temperature_%s_1deg.nc' % name), lat, lon, depth, time, True)
+        if name != 'annual':
+            write_synthetic_woa(rng, os.path.join(folder, 'salinity_%s_1deg.nc' % name), lat, lon, depth, time,
+                                False)
+    np.savetxt(os.path.join(folder, 'landsea.msk'), land.reshape(-1, 10), fmt='%d')
+
+
+def write_synthetic_woa13(rng, folder, land):
+    """Global 2-degree grid, with 3 monthly and 5 seasonal depth levels"""
+    lat = np.arange(-89.0, 90.0, 2.0)
+    lon = np.arange(-179.0, 180.0, 2.0)
+    os.makedirs(os.path.join(folder, 'temp'))
+    os.makedirs(os.path.join(folder, 'sal'))
+    for i in range(17):
+        depth = np.arange(3 if 1 <= i <= 12 else 5) * 50.0
+        write_synthetic_woa(rng, os.path.join(folder, 'temp', 'woa13_decav_t%02d_04v2.nc' % i), lat, lon, depth,
+                            np.array([0.0]), True)
+        if i > 0:
+            write_synthetic_woa(rng, os.path.join(folder, 'sal', 'woa13_decav_s%02d_04v2.nc' % i), lat, lon, depth,
+                                np.array([0.0]), False)
+
+    # the land/sea mask file starts from the antimeridian
+    land = np.hstack(np.hsplit(land, 2)[::-1])
+    with open(os.path.join(folder, 'landsea_04.msk'), 'w') as fod:
+        fod.write("WOA13 land/sea mask\nLatitude,Longitude,Land/Sea\n")
+        for flag in land.ravel():
+            fod.write("0.0,0.0,%d\n" % flag)
+
+
+def synthetic_land(rng, nr_lats, nr_lons):
+    """Random land nodes, and a land block around the node (40, 40)"""
+    land = (rng.rand(nr_lats, nr_lons) < 0.3).astype(int)
+    land[36:45, 36:45] = 1
+    return land
+
+
+def loop_query(atlas, lat, lon, node_profiles, depth):
+    """Reference per-node search of the closest valid values, returning the profiles as (depth, temp, sal) tuples
+
+    The nodes beyond the poles are skipped, and the longitudes are wrapped around the grid.
+    """
+    lat_base_idx, lon_base_idx = atlas.grid_coords(lat, lon)
+
+    t, s, t_min, s_min, t_max, s_max = [np.zeros(atlas.num_levels) for _ in range(6)]
+    dist_arr, dist_t_sd, dist_s_sd = [np.full(atlas.num_levels, 99999999.0) for _ in range(3)]
+    at_sea = False
+    for lat_idx in range(lat_base_idx - atlas.search_radius, lat_base_idx + atlas.search_radius + 1):
+        if (lat_idx < 0) or (lat_idx >= atlas.lat.size):
+            continue
+        for lon_idx in range(lon_base_idx - atlas.search_radius, lon_base_idx + atlas.search_radius + 1):
+            lon_idx %= atlas.lon.size
+            if atlas.landsea[lat_idx][lon_idx] == 1:
+                continue
+            at_sea = True
+
+            dist = atlas.g.distance(lon, lat, atlas.lon[lon_idx], atlas.lat[lat_idx])
+            t_profile, s_profile, t_sd_profile, s_sd_profile = node_profiles(lat_idx, lon_idx)
+            for i in range(t_profile.size):
+                if (dist < dist_arr[i]) and (t_profile[i] < 50.0) and (s_profile[i] < 500.0) and \
+                        (s_profile[i] >= 0):
+                    t[i] = t_profile[i]
+                    s[i] = s_profile[i]
+                    dist_arr[i] = dist
+                if (dist < dist_t_sd[i]) and (t_sd_profile[i] < 50.0) and (t_sd_profile[i] > -2):
+                    t_min[i] = max(t_profile[i] - t_sd_profile[i], -2.0)
+                    t_max[i] = t_profile[i] + t_sd_profile[i]
+                    dist_t_sd[i] = dist
+                if (dist < dist_s_sd[i]) and (s_sd_profile[i] < 500.0) and (s_sd_profile[i] >= 0):
+                    s_min[i] = max(s_profile[i] - s_sd_profile[i], 0.0)
+                    s_max[i] = s_profile[i] + s_sd_profile[i]
+                    dist_s_sd[i] = dist
+
+    if not at_sea:
+        return None
+
+    valid = dist_arr != 99999999
+    num_values = np.count_nonzero(valid)
+    profiles = [(depth[:num_values], t[valid], s[valid])]
+    missing_sd = np.flatnonzero((dist_t_sd == 99999999) | (dist_s_sd == 99999999))
+    if missing_sd.size > 0:
+        num_values = missing_sd[0]
+    if num_values > 0:
+        profiles.append((depth[:num_values], t_min[valid][:num_values], s_min[valid][:num_values]))
+        profiles.append((depth[:num_values], t_max[valid][:num_values], s_max[valid][:num_values]))
+    return profiles
+
+
+def woa09_node_profiles(atlas, datestamp):
+    jd = int(datestamp.strftime("%j"))
+    atlas.calc_month_idx(jday=jd)
+    atlas.calc_season_idx(jday=jd)
+    month_idx, season_idx = atlas.month_idx, atlas.season_idx
+
+    def node_profiles(lat_idx, lon_idx):
+        profiles = list()
+        for monthly, seasonal, name in [(atlas.t_monthly, atlas.t_seasonal, 't_an'),
+                                        (atlas.s_monthly, atlas.s_seasonal, 's_an'),
+                                        (atlas.t_monthly, atlas.t_seasonal, 't_sd'),
+                                        (atlas.s_monthly, atlas.s_seasonal, 's_sd')]:
+            profile = seasonal.variables[name][season_idx, :, lat_idx, lon_idx]
+            monthly_profile = monthly.variables[name][month_idx, :, lat_idx, lon_idx]
+            profile[0:monthly_profile.size] = monthly_profile
+            profiles.append(np.ma.filled(profile, np.nan))  # the masked values are never valid
+        return profiles
+
+    return node_profiles, atlas.depth
+
+
+def woa13_node_profiles(atlas, datestamp):
+    atlas.calc_indices(month=datestamp.month)
+    month_idx, season_idx = atlas.month_idx, atlas.season_idx
+
+    def node_profiles(lat_idx, lon_idx):
+        profiles = list()
+        for datasets, name in [(atlas.t, 't_an'), (atlas.s, 's_an'), (atlas.t, 't_sd'), (atlas.s, 's_sd')]:
+            profile = datasets[season_idx].variables[name][0, :, lat_idx, lon_idx]
+            monthly_profile = datasets[month_idx].variables[name][0, :, lat_idx, lon_idx]
+            profile[0:monthly_profile.size] = monthly_profile
+            profiles.append(np.ma.filled(profile, np.nan))  # the masked values are never valid
+        return profiles
+
+    return node_profiles, atlas.t[season_idx].variables['depth'][:]
+
+
+class TestSoundSpeedAtlasWoa(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        rng = np.random.RandomState(0)
+        cls.tmp_dir = tempfile.mkdtemp()
+        cls.woa09_folder = os.path.join(cls.tmp_dir, 'woa09')
+        os.makedirs(cls.woa09_folder)
+        write_synthetic_woa09(rng, cls.woa09_folder, land=synthetic_land(rng, 180, 360))
+        cls.woa13_folder = os.path.join(cls.tmp_dir, 'woa13')
+        write_synthetic_woa13(rng, cls.woa13_folder, land=synthetic_land(rng, 90, 180))
+
+        cls.dates = [date(2020, 1, 15), date(2020, 8, 1)]
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp_dir)
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    @classmethod
+    def make_atlas(cls, atlas_class, data_folder):
+        atlas = atlas_class(data_folder=data_folder, prj=None)
+        atlas.cache_max_size = 0  # to always search the grids
+        return atlas
+
+    @classmethod
+    def positions(cls, atlas):
+        """Random positions, close to the poles and the grid seam, on land, and across the tiles of batch queries"""
+        rng = np.random.RandomState(1)
+        positions = list(zip(rng.uniform(-80.0, 80.0, 8), rng.uniform(-180.0, 180.0, 8)))
+        lon_step = atlas.lon[1] - atlas.lon[0]
+        positions += [(89.9, 10.0), (-89.9, -100.0), (atlas.lat[40], atlas.lon[40]), (atlas.lat[43], atlas.lon[39]),
+                      (10.0, atlas.lon[0] - 0.4 * lon_step), (-20.0, atlas.lon[-1] + 0.4 * lon_step)]
+        positions += [(atlas.lat[i] + 0.1 * lon_step, atlas.lon[j] - 0.1 * lon_step)
+                      for i in [7, 8, 15, 16] for j in [7, 8]]
+        return positions
+
+    def assert_profiles(self, profiles, expected, sd_atol=0.0):
+        """Compare the queried profiles with the expected (depth, temp, sal) tuples, with tolerance on min and max"""
+        if expected is None:
+            self.assertIsNone(profiles)
+            return
+
+        self.assertEqual(len(profiles.l), len(expected))
+        for i, (ssp, (depth, temp, sal)) in enumerate(zip(profiles.l, expected)):
+            np.testing.assert_array_equal(ssp.data.depth, depth)
+            np.testing.assert_allclose(ssp.data.temp, temp, rtol=0.0, atol=sd_atol if i > 0 else 0.0)
+            np.testing.assert_allclose(ssp.data.sal, sal, rtol=0.0, atol=sd_atol if i > 0 else 0.0)
+
+    def check_query(self, atlas, node_profiles):
+        """Compare the atlas query with the reference per-node search"""
+        for datestamp in self.dates:
+            for lat, lon in self.positions(atlas):
+                profiles = atlas.query(lat=lat, lon=lon, datestamp=datestamp)
+                grid_lon = lon % 360.0 if isinstance(atlas, Woa09) else lon
+                expected = loop_query(atlas, lat, grid_lon, *node_profiles(atlas, datestamp))
+                self.assert_profiles(profiles, expected)
+                if expected is not None:
+                    self.assertAlmostEqual(profiles.cur.meta.longitude, (lon + 180.0) % 360.0 - 180.0)
+
+    def check_query_many(self, atlas_class, data_folder):
+        """Compare the batch queries with the single ones (on separate atlases)"""
+        atlas = self.make_atlas(atlas_class, data_folder)
+        atlas.load_grids()
+        positions = self.positions(atlas) * len(self.dates)
+        datestamps = [datestamp for datestamp in self.dates for _ in range(len(positions) // len(self.dates))]
+        results = atlas.query_many(lats=[lat for lat, _ in positions], lons=[lon for _, lon in positions],
+                                   datestamps=datestamps)
+
+        atlas = self.make_atlas(atlas_class, data_folder)
+        for (lat, lon), datestamp, profiles in zip(positions, datestamps, results):
+            expected = atlas.query(lat=lat, lon=lon, datestamp=datestamp)
+            if expected is None:
+                self.assertIsNone(profiles)
+                continue
+            self.assert_profiles(profiles, [(ssp.data.depth, ssp.data.temp, ssp.data.sal) for ssp in expected.l])
+
+    def check_compiled(self, atlas_class, data_folder):
+        """Compare the queries on the compiled grids with the ones on the netCDF files"""
+        compiled_folder = os.path.join(self.tmp_dir, 'compiled_%s' % os.path.basename(data_folder))
+        shutil.copytree(data_folder, compiled_folder)
+        self.assertTrue(self.make_atlas(atlas_class, compiled_folder).compile_grids())
+
+        atlas = self.make_atlas(atlas_class, data_folder)
+        compiled = self.make_atlas(atlas_class, compiled_folder)
+        self.assertTrue(compiled.load_grids())
+        self.assertTrue(compiled.has_compiled_grids())
+        for datestamp in self.dates:
+            for lat, lon in self.positions(compiled):
+                expected = atlas.query(lat=lat, lon=lon, datestamp=datestamp)
+                profiles = compiled.query(lat=lat, lon=lon, datestamp=datestamp)
+                if expected is None:
+                    self.assertIsNone(profiles)
+                    continue
+
+                # the means are stored as float32 (as in the netCDF files), the standard deviations as float16
+                self.assert_profiles(profiles, [(ssp.data.depth, ssp.data.temp, ssp.data.sal) for ssp in expected.l],
+                                     sd_atol=0.005)
+        compiled.clear_data()
+        shutil.rmtree(compiled_folder)
+
+    def test_query_woa09(self):
+        atlas = self.make_atlas(Woa09, self.woa09_folder)
+        self.assertTrue(atlas.load_grids())
+        self.check_query(atlas, woa09_node_profiles)
+
+    def test_query_woa13(self):
+        atlas = self.make_atlas(Woa13, self.woa13_folder)
+        self.assertTrue(atlas.load_grids())
+        self.check_query(atlas, woa13_node_profiles)
+
+    def test_query_many_woa09(self):
+        self.check_query_many(Woa09, self.woa09_folder)
+
+    def test_query_many_woa13(self):
+        self.check_query_many(Woa13, self.woa13_folder)
+
+    def test_compiled_woa09(self):
+        self.check_compiled(Woa09, self.woa09_folder)
+
+    def test_compiled_woa13(self):
+        self.check_compiled(Woa13, self.woa13_folder)
+
+
+def suite():
+    s = unittest.TestSuite()
+    s.addTests(unittest.TestLoader().loadTestsFromTestCase(TestSoundSpeedAtlasWoa))
+    return s
@@ -0,0 +1,31 @@
+import unittest
+import numpy as np
+
+from hyo2.soundspeed.db.blob import pack_samples, unpack_samples
+
+
+class TestSoundSpeedDbBlob(unittest.TestCase):
+
+    def test_pack_unpack(self):
+        depth = np.arange(0.0, 100.0, 0.5)
+        columns = [depth * 1.01, depth, 1500.0 + 0.01 * depth, np.full(depth.size, np.nan),
+                   np.zeros(depth.size), np.full(depth.size, 35.0), np.ones(depth.size), np.arange(depth.size) % 3]
+
+        unpacked = unpack_samples(pack_samples(columns))
+        self.assertEqual(len(unpacked), len(columns))
+        for values, expected in zip(unpacked, columns):
+            np.testing.assert_array_equal(values, expected)
+        self.assertEqual(unpacked[7].dtype, np.dtype('<i4'))
+
+    def test_empty(self):
+        unpacked = unpack_samples(pack_samples([np.zeros(0)] * 8))
+        self.assertEqual(len(unpacked[1]), 0)
+
+    def test_invalid(self):
+        self.assertRaises(RuntimeError, unpack_samples, b'XXXX\x08\x00')
+
+
+def suite():
+    s = unittest.TestSuite()
+    s.addTests(unittest.TestLoader().loadTestsFromTestCase(TestSoundSpeedDbBlob))
+    return s
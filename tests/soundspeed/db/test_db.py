@@ -6,6 +6,7 @@ import numpy as np
 
 from hyo2.soundspeedmanager import AppInfo
 from hyo2.soundspeed.soundspeed import SoundSpeedLibrary
+from hyo2.soundspeed.db.db import ProjectDb
 from hyo2.soundspeed.profile.profilelist import ProfileList
 
 
@@ -39,8 +40,11 @@ class TestSoundSpeedDb(unittest.TestCase):
                 add_cast(20 + i, -75)
 
     def tearDown(self):
-        if os.path.exists(self.db_path):
-            os.remove(self.db_path)
+        if hasattr(self, 'lib'):
+            self.lib.db_pool.close()
+        for path in [self.db_path, self.db_path + '-wal', self.db_path + '-shm']:
+            if os.path.exists(path):
+                os.remove(path)
 
     # @unittest.skipUnless(sys.platform.startswith("win"), "only works with GDAL < 2.0 on Windows")
     def test_save_load_cast(self):
@@ -59,6 +63,156 @@ class TestSoundSpeedDb(unittest.TestCase):
             pk = i % self.max_pk + 1
             test_pk(pk)
 
+    def test_add_casts_many(self):
+        profile_lists = list()
+        for i in range(self.max_pk):
+            ssp = self.lib.db_retrieve_profile(i + 1)
+            ssp.cur.meta.latitude = 40 + i
+            profile_lists.append(ssp)
+
+        db = ProjectDb(projects_folder=self.lib.projects_folder, project_name=self.lib.current_project)
+        self.assertTrue(db.add_casts_many(profile_lists))
+        db.disconnect()
+
+        self.assertEqual(len(self.lib.db_list_profiles()), 2 * self.max_pk)
+        ssp = self.lib.db_retrieve_profile(2 * self.max_pk)
+        self.assertTrue((ssp.cur.proc.depth == self.depth).all())
+
+    def test_update_from_version_3(self):
+        db = ProjectDb(projects_folder=self.lib.projects_folder, project_name=self.lib.current_project)
+        with db.conn:
+            db.conn.execute("DROP INDEX proc_pk_flag_source_idx")
+            db.conn.execute("DROP TABLE ssp_summary")
+            db.conn.execute("UPDATE library SET version=3")
+        db.disconnect()
+
+        db = ProjectDb(projects_folder=self.lib.projects_folder, project_name=self.lib.current_project)
+        self.assertEqual(db.get_db_version(), db.cur_version)
+        indexes = [row['name'] for row in db.conn.execute("SELECT name FROM sqlite_master WHERE type='index'")]
+        self.assertIn("proc_pk_flag_source_idx", indexes)
+        self.assertEqual(db.conn.execute("SELECT COUNT(*) FROM ssp_summary").fetchone()[0], self.max_pk)
+        db.disconnect()
+
+    def test_list_profiles(self):
+        profiles = self.lib.db_list_profiles()
+        self.assertEqual(len(profiles), self.max_pk)
+        for profile in profiles:
+            self.assertEqual(profile[20:24], ('1415.00', '0.00', '%0.2f' % self.depth[-1], '%0.2f' % self.depth[-1]))
+
+    def test_import_data_from_db(self):
+        in_db_path = os.path.join(self.lib.projects_folder, 'unittest_in.db')
+        if os.path.exists(in_db_path):
+            os.remove(in_db_path)
+
+        # the input db has a copy of the first two casts, and two new ones
+        profile_lists = [self.lib.db_retrieve_profile(pk) for pk in [1, 2, 3, 4]]
+        for ssp in profile_lists[2:]:
+            ssp.cur.meta.latitude += 0.5
+        in_db = ProjectDb(projects_folder=self.lib.projects_folder, project_name='unittest_in')
+        self.assertTrue(in_db.add_casts_many(profile_lists))
+        in_db.migrate_to_blob_storage()
+        in_db.disconnect()
+
+        pk_issues, pk_done = self.lib.db_import_data_from_db(in_db_path)
+        os.remove(in_db_path)
+        self.assertEqual(pk_issues, [1, 2])
+        self.assertEqual(pk_done, [3, 4])
+
+        self.assertEqual(len(self.lib.db_list_profiles()), self.max_pk + 2)
+        ssp = self.lib.db_retrieve_profile(self.max_pk + 2)
+        self.assertAlmostEqual(ssp.cur.meta.latitude, 23.5)
+        self.assertTrue((ssp.cur.proc.depth == self.depth).all())
+
+    def test_import_data_from_db_into_blobs(self):
+        in_db_path = os.path.join(self.lib.projects_folder, 'unittest_in.db')
+        if os.path.exists(in_db_path):
+            os.remove(in_db_path)
+
+        # the input db stores the samples as rows, the current one as blobs
+        profile_lists = [self.lib.db_retrieve_profile(pk) for pk in [1, 2, 3, 4]]
+        for ssp in profile_lists[2:]:
+            ssp.cur.meta.latitude += 0.5
+        in_db = ProjectDb(projects_folder=self.lib.projects_folder, project_name='unittest_in')
+        self.assertTrue(in_db.add_casts_many(profile_lists))
+        in_db.disconnect()
+        self.assertTrue(self.lib.db_migrate_to_blob_storage())
+
+        pk_issues, pk_done = self.lib.db_import_data_from_db(in_db_path)
+        os.remove(in_db_path)
+        self.assertEqual(pk_issues, [1, 2])
+        self.assertEqual(pk_done, [3, 4])
+
+        db = ProjectDb(projects_folder=self.lib.projects_folder, project_name=self.lib.current_project)
+        for table in ["data", "proc", "sis"]:
+            self.assertEqual(db.conn.execute("SELECT COUNT(*) FROM %s" % table).fetchone()[0], 0)
+        self.assertEqual(db.conn.execute("SELECT COUNT(DISTINCT ssp_pk) FROM ssp_samples").fetchone()[0],
+                         self.max_pk + 2)
+        db.disconnect()
+
+        ssp = self.lib.db_retrieve_profile(self.max_pk + 2)
+        self.assertAlmostEqual(ssp.cur.meta.latitude, 23.5)
+        self.assertTrue((ssp.cur.data.depth == self.depth).all())
+        self.assertTrue((ssp.cur.proc.depth == self.depth).all())
+
+    def test_migrate_to_blob_storage(self):
+        profiles = self.lib.db_list_profiles()
+        self.assertTrue(self.lib.db_migrate_to_blob_storage())
+        self.assertEqual(repr(self.lib.db_list_profiles()), repr(profiles))
+
+        db = ProjectDb(projects_folder=self.lib.projects_folder, project_name=self.lib.current_project)
+        self.assertTrue(db.blob_storage)
+        self.assertEqual(db.conn.execute("SELECT COUNT(*) FROM proc").fetchone()[0], 0)
+        db.disconnect()
+
+        for pk in range(1, self.max_pk + 1):
+            ssp = self.lib.db_retrieve_profile(pk)
+            self.assertTrue((ssp.cur.data.depth == self.depth).all())
+            self.assertTrue((ssp.cur.proc.depth == self.depth).all())
+
+    def test_query_casts(self):
+        # the casts are at latitudes 20 to 24, and longitude -75
+        casts = self.lib.db_query_casts(center=(-75.0, 21.9), limit=2)
+        self.assertEqual([cast[0] for cast in casts], [3, 2])
+        self.assertAlmostEqual(casts[0][3], 11119.5, places=1)
+
+        casts = self.lib.db_query_casts(center=(-75.0, 20.0), radius_m=200000.0)
+        self.assertEqual([cast[0] for cast in casts], [1, 2])
+
+        casts = self.lib.db_query_casts(center=(-75.0, 22.4))
+        self.assertEqual([cast[0] for cast in casts], [3, 4, 2, 5, 1])
+
+        casts = self.lib.db_query_casts(bbox=(-76.0, 21.5, -74.0, 30.0))
+        self.assertEqual([cast[0] for cast in casts], [3, 4, 5])
+
+        casts = self.lib.db_query_casts(time_range=(datetime.now(), None))
+        self.assertEqual(len(casts), 0)
+
+        self.lib.delete_db_profile(3)
+        casts = self.lib.db_query_casts(center=(-75.0, 21.9), limit=2)
+        self.assertEqual([cast[0] for cast in casts], [2, 4])
+
+    def test_iter_profiles(self):
+        db = self.lib.project_db()
+        pks = [3, 1, 5]
+        profiles = list(db.iter_profiles(pks=pks, fields=['depth', 'speed'], batch_size=2))
+        self.assertEqual([profile[0] for profile in profiles], pks)
+        for _, samples in profiles:
+            self.assertTrue((samples['proc'].depth == self.depth).all())
+            self.assertTrue((samples['proc'].speed == 1415).all())
+            self.assertIsNone(samples['proc'].temp)
+
+        self.assertEqual(len(list(db.iter_profiles(tables=('data', 'proc', 'sis'), flags=None))), self.max_pk)
+
+    def test_climatology(self):
+        # each cast has samples at 0, 1, .., 24 m
+        aggregate = self.lib.db_climatology(edges=[0.0, 10.0, 20.0, 30.0])
+        np.testing.assert_array_equal(aggregate.count, [10 * self.max_pk, 10 * self.max_pk, 5 * self.max_pk])
+        np.testing.assert_array_equal(aggregate.mean, [1415.0] * 3)
+        np.testing.assert_array_equal(aggregate.std, [0.0] * 3)
+
+        aggregate = self.lib.db_climatology(bbox=(-76.0, 21.5, -74.0, 30.0))
+        self.assertEqual(aggregate.count[0], 10 * 3)
+
 
 def suite():
     s = unittest.TestSuite()
@@ -0,0 +1,107 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from datetime import datetime
+
+import numpy as np
+
+from hyo2.soundspeed.db.pool import ProjectDbPool
+from hyo2.soundspeed.profile.profilelist import ProfileList
+
+
+def make_cast(lat):
+    ssp = ProfileList()
+    ssp.append()
+    ssp.cur.meta.latitude = lat
+    ssp.cur.meta.longitude = -75.0
+    ssp.cur.meta.utc_time = datetime(2020, 1, 1)
+    ssp.cur.init_data(10)
+    ssp.cur.data.depth[:] = np.arange(10.0)
+    ssp.cur.data.speed[:] = 1500.0
+    ssp.cur.clone_data_to_proc()
+    ssp.cur.init_sis()
+    return ssp
+
+
+class TestSoundSpeedDbPool(unittest.TestCase):
+
+    def setUp(self):
+        self.projects_folder = tempfile.mkdtemp()
+        self.pool = ProjectDbPool()
+
+    def tearDown(self):
+        self.pool.close()
+        shutil.rmtree(self.projects_folder)
+
+    def test_project_db(self):
+        db = self.pool.project_db(projects_folder=self.projects_folder, project_name='unittest')
+        self.assertIs(self.pool.project_db(projects_folder=self.projects_folder, project_name='unittest'), db)
+        self.assertEqual(db.conn.execute("PRAGMA journal_mode").fetchone()[0], 'wal')
+        self.assertEqual(db.get_db_version(), db.cur_version)
+
+        other = list()
+        thread = threading.Thread(target=lambda: other.append(
+            self.pool.project_db(projects_folder=self.projects_folder, project_name='unittest')))
+        thread.start()
+        thread.join()
+        self.assertIsNot(other[0], db)
+        self.assertFalse(other[0].check_schema)
+
+        self.pool.close_project(projects_folder=self.projects_folder, project_name='unittest')
+        self.assertIsNone(db.conn)
+        self.assertIsNone(other[0].conn)
+
+    def test_exited_thread(self):
+        other = list()
+        thread = threading.Thread(target=lambda: other.append(
+            self.pool.project_db(projects_folder=self.projects_folder, project_name='unittest')))
+        thread.start()
+        thread.join()
+        self.assertIsNotNone(other[0].conn)
+
+        # the db of the exited thread is closed at the next request
+        db = self.pool.project_db(projects_folder=self.projects_folder, project_name='unittest')
+        self.assertIsNone(other[0].conn)
+        self.assertIsNotNone(db.conn)
+        self.assertEqual(len(self.pool._dbs), 1)
+
+    def test_migrated_by_other_thread(self):
+        db = self.pool.project_db(projects_folder=self.projects_folder, project_name='unittest')
+        self.assertTrue(db.add_casts(make_cast(lat=20.0)))
+        self.assertFalse(db.blob_storage)
+
+        # the db of this thread detects the storage layout changed by another thread
+        other = list()
+
+        def migrate():
+            other_db = self.pool.project_db(projects_folder=self.projects_folder, project_name='unittest')
+            other.append(other_db.migrate_to_blob_storage())
+
+        thread = threading.Thread(target=migrate)
+        thread.start()
+        thread.join()
+        self.assertTrue(other[0])
+
+        self.assertTrue(db.add_casts(make_cast(lat=21.0)))
+        self.assertTrue(db.blob_storage)
+        self.assertEqual(db.conn.execute("SELECT COUNT(*) FROM proc").fetchone()[0], 0)
+        self.assertEqual(db.conn.execute("SELECT COUNT(*) FROM ssp_rtree").fetchone()[0], 2)
+        for pk in [1, 2]:
+            np.testing.assert_array_equal(db.profile_by_pk(pk).cur.proc.depth, np.arange(10.0))
+
+    def test_removed_project(self):
+        db = self.pool.project_db(projects_folder=self.projects_folder, project_name='unittest')
+        db.disconnect()
+        os.remove(db.db_path)
+
+        db = self.pool.project_db(projects_folder=self.projects_folder, project_name='unittest')
+        self.assertTrue(db.check_schema)
+        self.assertEqual(len(db.list_profiles()), 0)
+
+
+def suite():
+    s = unittest.TestSuite()
+    s.addTests(unittest.TestLoader().loadTestsFromTestCase(TestSoundSpeedDbPool))
+    return s
@@ -0,0 +1,69 @@
+import unittest
+import numpy as np
+
+from hyo2.soundspeed.profile.aggregate import ProfileAggregate
+
+
+class TestSoundSpeedAggregate(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(42)
+        self.profiles = list()
+        for _ in range(20):
+            depths = np.sort(rng.uniform(-5.0, 900.0, 300))
+            speeds = 1480.0 + depths * 0.05 + rng.normal(0.0, 2.0, depths.size)
+            self.profiles.append((depths, speeds))
+        self.edges = ProfileAggregate.linear_edges(max_depth=780.0, step=10.0)
+
+    def tearDown(self):
+        pass
+
+    def test_against_loop(self):
+        aggregate = ProfileAggregate(edges=self.edges)
+        bins = [list() for _ in range(len(self.edges) - 1)]
+        for depths, speeds in self.profiles:
+            aggregate.add_samples(depths, speeds)
+            for d, s in zip(depths, speeds):
+                for j in range(len(bins)):
+                    if self.edges[j] <= d < self.edges[j + 1]:
+                        bins[j].append(s)
+                        break
+
+        depths, mean, std = aggregate.stats(min_count=3)
+        used = [i for i, values in enumerate(bins) if len(values) >= 3]
+        np.testing.assert_array_equal(aggregate.count, [len(values) for values in bins])
+        np.testing.assert_allclose(depths, [self.edges[i] + 5.0 for i in used])
+        np.testing.assert_allclose(mean, [np.mean(bins[i]) for i in used])
+        np.testing.assert_allclose(std, [np.std(bins[i]) for i in used], rtol=1e-9)
+
+    def test_merge(self):
+        whole = ProfileAggregate(edges=self.edges)
+        first = ProfileAggregate(edges=self.edges)
+        second = ProfileAggregate(edges=self.edges)
+        for i, (depths, speeds) in enumerate(self.profiles):
+            whole.add_samples(depths, speeds)
+            (first if i % 3 else second).add_samples(depths, speeds)
+        first.merge(second)
+
+        np.testing.assert_array_equal(first.count, whole.count)
+        np.testing.assert_allclose(first.mean, whole.mean)
+        np.testing.assert_allclose(first.std, whole.std, rtol=1e-9)
+
+        with self.assertRaises(RuntimeError):
+            first.merge(ProfileAggregate(edges=ProfileAggregate.log_edges()))
+
+    def test_log_edges(self):
+        edges = ProfileAggregate.log_edges(max_depth=11000.0, nr_bins=40)
+        self.assertEqual(edges[0], 0.0)
+        self.assertAlmostEqual(edges[-1], 11000.0)
+        self.assertTrue((np.diff(np.diff(edges[1:])) > 0).all())
+
+        aggregate = ProfileAggregate(edges=edges)
+        aggregate.add_samples([0.0, 3000.0, 10999.0, 11000.0], [1500.0, 1490.0, 1550.0, 1560.0])
+        self.assertEqual(aggregate.count.sum(), 3)
+
+
+def suite():
+    s = unittest.TestSuite()
+    s.addTests(unittest.TestLoader().loadTestsFromTestCase(TestSoundSpeedAggregate))
+    return s
@@ -76,6 +76,26 @@ class TestSoundSpeedOceanography(unittest.TestCase):
 
         self.assertAlmostEqual(calc_s, trusted_fof_s, places=1)
 
+    def test_sal_array(self):
+        d = np.array([0.0, 10.0, 500.0, 2000.0, 6000.0])
+        t = np.array([28.0, 25.0, 8.0, 3.0, 1.5])
+        s = np.array([0.0, 35.5, 34.9, 34.7, 45.0])
+
+        calc_vs = Oc.speed(d=d, t=t, s=s, lat=45.0)
+        for i in range(d.size):
+            self.assertAlmostEqual(calc_vs[i], Oc.speed(d=d[i], t=t[i], s=s[i], lat=45.0), places=10)
+
+        calc_s = Oc.sal(d=d, speed=calc_vs, t=t, lat=45.0)
+        self.assertEqual(calc_s.shape, d.shape)
+        for i in range(d.size):
+            ref_s = Oc.sal_bisection(d=d[i], speed=calc_vs[i], t=t[i], lat=45.0)
+            self.assertAlmostEqual(calc_s[i], ref_s, places=2)
+            self.assertAlmostEqual(calc_s[i], s[i], places=2)
+
+        # out of range and invalid sound speeds
+        calc_s = Oc.sal(d=100.0, speed=np.array([1300.0, 1800.0, np.nan]), t=10.0)
+        np.testing.assert_array_equal(calc_s, [0.0, 50.0, np.nan])
+
     def test_atg(self):
         # check values from Fofonoff and Millard(1983)
         atg_ck = 3.255976e-4
@@ -102,6 +122,18 @@ class TestSoundSpeedOceanography(unittest.TestCase):
 
         self.assertAlmostEqual(t0_calc, t0_ck, places=1)
 
+    def test_in_situ_temp_array(self):
+        s = np.array([35.0, 34.9, 34.7, 40.0])
+        t = np.array([20.0, 8.0, 2.0, 36.89073])
+        p = np.array([10.0, 500.0, 4000.0, 10000.0])
+
+        t0_calc = Oc.in_situ_temp(s=s, t=t, p=p, pr=0.0)
+        self.assertEqual(t0_calc.shape, t.shape)
+        np.testing.assert_allclose(Oc.pot_temp(s=s, t=t0_calc, p=p, pr=0.0), t, atol=1e-4)
+        for i in range(t.size):
+            t0_ref = Oc.in_situ_temp_stepping(s=s[i], t=t[i], p=p[i], pr=0.0)
+            self.assertAlmostEqual(t0_calc[i], t0_ref, places=2)
+
     def test_cr2s(self):
         cr_ck = 1.1
         t_ck = 40.0
@@ -125,6 +157,22 @@ class TestSoundSpeedOceanography(unittest.TestCase):
 
         self.assertAlmostEqual(c_calc, c_ck, places=1)
 
+    def test_s2c_array(self):
+        s = np.array([0.0, 35.0, 34.9, 40.0, np.nan])
+        t = np.array([28.0, 20.0, 8.0, 40.0, 10.0])
+        p = np.array([0.0, 10.0, 500.0, 10000.0, 100.0])
+
+        calc_c = Oc.s2c(s=s, p=p, t=t)
+        self.assertEqual(calc_c.shape, s.shape)
+        for i in range(s.size - 1):
+            self.assertAlmostEqual(calc_c[i], Oc.s2c_stepping(s=s[i], p=p[i], t=t[i]), places=10)
+        self.assertTrue(np.isnan(calc_c[-1]))
+
+        # out of the conductivity range, as s2c_stepping
+        with np.errstate(divide='ignore'):
+            self.assertEqual(Oc.s2c(s=90.0, p=10.0, t=30.0), Oc.s2c_stepping(s=90.0, p=10.0, t=30.0))
+        self.assertEqual(Oc.s2c(s=90.0, p=10.0, t=30.0), np.inf)
+
     def test_dyn_height_1000(self):
         # absolute salinity
         sa = np.array([34.7118, 34.8915, 35.0256, 34.8472, 34.7366, 34.7324])
@@ -141,6 +189,17 @@ class TestSoundSpeedOceanography(unittest.TestCase):
         for i, val in enumerate(gold_ref):
             self.assertAlmostEqual(calc_out[i], val, places=0)
 
+    def test_attenuation(self):
+        t = np.array([2.0, 10.0, 20.0, 25.0])
+        s = np.array([34.7, 35.0, 36.0, 30.0])
+        d = np.array([4000.0, 500.0, 10.0, 1.0])
+
+        calc_out = Oc.attenuation(f=40, t=t, s=s, d=d, ph=8.1)
+        self.assertEqual(calc_out.shape, t.shape)
+        for i in range(t.size):
+            self.assertAlmostEqual(calc_out[i], Oc.attenuation(f=40, t=t[i], s=s[i], d=d[i], ph=8.1), places=12)
+        self.assertAlmostEqual(Oc.attenuation(f=12, t=10.0, s=35.0, d=0.0, ph=8.0), 1.0, places=0)
+
 
 def suite():
     s = unittest.TestSuite()
@@ -0,0 +1,158 @@
+import unittest
+import numpy as np
+
+from hyo2.soundspeed.profile.dicts import Dicts
+from hyo2.soundspeed.profile.profile import Profile
+
+
+def loop_statistical_filter(speed, depth):
+    """Reference per-sample implementation of the statistical filter"""
+    n = len(speed)
+    sigma = np.zeros(n)
+    speed_mean = np.zeros(n)
+    neighbors = [(i, [i - 2, i - 1, i + 1, i + 2], 1.0) for i in range(2, n - 2)]
+    neighbors += [(0, [1, 2, 3], 1.3), (1, [0, 2, 3], 1.3),
+                  (n - 2, [n - 4, n - 3, n - 1], 1.3), (n - 1, [n - 4, n - 3, n - 2], 1.3)]
+    for i, ks, c_end in neighbors:
+        speed_sum = 0
+        speed_sum_sq = 0
+        for k in ks:
+            speed_sum += speed[k]
+            speed_sum_sq += speed[k] * speed[k]
+        nr = len(ks)
+        variance = ((nr * speed_sum_sq) - speed_sum * speed_sum) / (nr * (nr - 1))
+        speed_mean[i] = speed_sum / nr
+        sigma[i] = max(np.sqrt(max(variance, 0)), 0.2) * c_end
+
+    filtered = np.zeros(n, dtype=bool)
+    factor = 1.3
+    for i in range(n):
+        if depth[i] > 33.0:
+            factor = 1.0
+        filtered[i] = np.absolute(speed[i] - speed_mean[i]) > factor * 2 * sigma[i]
+    return filtered
+
+
+def loop_cosine_sums(zs, values):
+    """Reference per-sample implementation of the cosine-averaging sums"""
+    window_width = np.maximum(np.absolute(zs * 0.0025), 1.7)
+    bins = zs.min() + np.arange(int(10 + (zs.max() - zs.min()))) - 4.0
+    sums = np.zeros(bins.size)
+    weights = np.zeros(bins.size)
+    for i, z in enumerate(zs):
+        c = int((z - zs.min()) + .5) + 4
+        z_diff = z - bins[c - 4:c + 5]
+        bin_weights = 1.0 + np.cos(2.69 * z_diff / window_width[i])
+        bin_weights *= np.absolute(z_diff) < window_width[i]
+        sums[c - 4:c + 5] += values[i] * bin_weights
+        weights[c - 4:c + 5] += bin_weights
+    bins, sums, weights = bins[4:-5], sums[4:-5], weights[4:-5]
+    enough = weights > 0.1
+    return bins[enough], sums[enough] / weights[enough]
+
+
+class TestSoundSpeedProfile(unittest.TestCase):
+
+    def setUp(self):
+        self.depth = np.arange(0.0, 500.0, 0.5)
+        self.speed = 1500.0 + 0.01 * self.depth
+        self.speed[400] += 1.0  # a single spike
+
+        self.ssp = Profile()
+        self.ssp.init_proc(self.depth.size)
+        self.ssp.proc.depth[:] = self.depth
+        self.ssp.proc.speed[:] = self.speed
+        self.ssp.proc.flag[:] = Dicts.flags['valid']
+        self.ssp.proc.flag[10] = Dicts.flags['user']
+
+    def tearDown(self):
+        pass
+
+    def test_proc_view(self):
+        valid = self.ssp.proc_view('valid')
+        self.assertEqual(valid.num_samples, self.depth.size - 1)
+        np.testing.assert_array_equal(valid.depth, np.delete(self.depth, 10))
+
+        self.ssp.proc.flag[20] = Dicts.flags['user']
+        self.assertEqual(self.ssp.proc_view('valid').num_samples, self.depth.size - 2)
+        self.assertRaises(RuntimeError, self.ssp.proc_view, 'unknown')
+
+    def test_douglas_peucker_1d(self):
+        kept = Profile.douglas_peucker_1d(depth=self.depth, speed=self.speed, tolerance=0.1)
+        np.testing.assert_array_equal(np.flatnonzero(kept), [0, 399, 400, 401, self.depth.size - 1])
+
+        kept = Profile.douglas_peucker_1d(depth=self.depth, speed=self.speed, tolerance=2.0)
+        np.testing.assert_array_equal(np.flatnonzero(kept), [0, self.depth.size - 1])
+
+    def test_douglas_peucker_1d_levels(self):
+        levels = Profile.douglas_peucker_1d_levels(depth=self.depth, speed=self.speed)
+        for tolerance in [0.0, 0.001, 0.1, 0.5, 2.0]:
+            kept = Profile.douglas_peucker_1d(depth=self.depth, speed=self.speed, tolerance=tolerance)
+            np.testing.assert_array_equal(levels > tolerance, kept)
+            self.assertEqual(Profile.thin_sizes(levels, tolerance)[0], np.count_nonzero(kept))
+
+    def test_thin(self):
+        self.ssp.clone_proc_to_sis()
+        self.assertTrue(self.ssp.thin(tolerance=0.1))
+        self.assertEqual(np.count_nonzero(self.ssp.sis_thinned), 5)
+        self.assertEqual(self.ssp.sis.flag[10], Dicts.flags['user'])
+        self.assertEqual(np.count_nonzero(self.ssp.sis_valid), self.depth.size - 6)
+
+        thinned = self.ssp.sis.flag.copy()
+        levels = self.ssp.thin_levels()
+        self.ssp.clone_proc_to_sis()
+        self.assertTrue(self.ssp.thin(tolerance=0.1, levels=levels))
+        np.testing.assert_array_equal(self.ssp.sis.flag, thinned)
+
+    def test_thin_tolerance(self):
+        # 232 samples are kept with zero tolerance, 5 up to 0.5, and the 2 end points above that
+        levels = self.ssp.thin_levels()
+        self.assertEqual(self.ssp.thin_tolerance(tolerances=[0.0, 0.1, 2.0], max_samples=10, levels=levels), 0.1)
+        self.assertEqual(self.ssp.thin_tolerance(tolerances=[0.0, 0.1, 2.0], max_samples=5), 2.0)
+        self.assertEqual(self.ssp.thin_tolerance(tolerances=[0.0, 0.1], max_samples=2), 0.1)
+        self.assertEqual(self.ssp.thin_tolerance(tolerances=[0.0, 0.1], max_samples=1000), 0.0)
+
+    def test_statistical_filter(self):
+        rng = np.random.RandomState(0)
+        self.ssp.proc.speed[:] += rng.normal(0.0, 0.3, self.depth.size)
+        valid = self.ssp.proc_valid
+        expected = loop_statistical_filter(self.ssp.proc.speed[valid], self.ssp.proc.depth[valid])
+
+        self.ssp.statistical_filter()
+        np.testing.assert_array_equal(self.ssp.proc.flag[valid] == Dicts.flags['filtered'], expected)
+        self.assertTrue(self.ssp.proc.flag[400] == Dicts.flags['filtered'])
+
+    def test_cosine_smooth(self):
+        self.ssp.proc.depth[:] += 0.25  # not an integer number of bins
+        valid = self.ssp.proc_valid
+        bins, speeds = loop_cosine_sums(self.ssp.proc.depth[valid], self.ssp.proc.speed[valid])
+
+        self.ssp.cosine_smooth()
+        self.assertEqual(self.ssp.proc.num_samples, self.depth.size + bins.size)
+        smoothed = self.ssp.proc.source == Dicts.sources['smoothing']
+        np.testing.assert_array_equal(self.ssp.proc.depth[smoothed], bins)
+        np.testing.assert_array_equal(self.ssp.proc.speed[smoothed], speeds)
+        np.testing.assert_array_equal(self.ssp.proc_valid, smoothed)
+        self.assertTrue((np.diff(self.ssp.proc.depth[self.ssp.proc_valid]) > 0).all())
+
+    def test_reduce_up_down(self):
+        depth = np.array([0.5, 1.0, 0.8, 2.0, 3.0, 2.5, 1.5, 1.6, 0.5])
+
+        ssp = Profile()
+        ssp.init_data(depth.size)
+        ssp.data.depth[:] = depth
+        ssp.data.flag[:] = Dicts.flags['valid']
+        self.assertEqual(ssp.reduce_up_down(Dicts.ssp_directions['down']), 4)
+        np.testing.assert_array_equal(ssp.data.depth[ssp.data_valid], [0.5, 1.0, 2.0, 3.0])
+
+        ssp.data.depth[:] = depth
+        ssp.data.flag[:] = Dicts.flags['valid']
+        self.assertEqual(ssp.reduce_up_down(Dicts.ssp_directions['up']), 4)
+        np.testing.assert_array_equal(ssp.data.depth, depth[::-1])
+        np.testing.assert_array_equal(ssp.data.depth[ssp.data_valid], [0.5, 1.5, 2.5])
+
+
+def suite():
+    s = unittest.TestSuite()
+    s.addTests(unittest.TestLoader().loadTestsFromTestCase(TestSoundSpeedProfile))
+    return s
@@ -0,0 +1,82 @@
+import unittest
+from datetime import datetime
+import numpy as np
+
+from hyo2.soundspeed.profile.dicts import Dicts
+from hyo2.soundspeed.profile.profile import Profile
+from hyo2.soundspeed.profile.ray_tracing.diff_tracedprofiles import DiffTracedProfiles
+from hyo2.soundspeed.profile.ray_tracing.ray_tracing import RayTracing
+from hyo2.soundspeed.profile.ray_tracing.tracedprofile import TracedProfile
+
+
+class TestSoundSpeedRayTracing(unittest.TestCase):
+
+    def setUp(self):
+        self.depths = np.linspace(0.5, 1000.0, 500)
+        self.speeds = 1500.0 + 0.02 * self.depths
+        self.speeds[100:120] = self.speeds[100]  # constant gradient layers
+        self.angles = np.arange(0, 71, 10)
+
+    def tearDown(self):
+        pass
+
+    def test_layer_parameters_many(self):
+        params = RayTracing.get_svp_layer_parameters_many(np.deg2rad(self.angles), self.depths, self.speeds)
+
+        for i, angle in enumerate(self.angles):
+            slow = RayTracing.get_svp_layer_parameters_slow(np.deg2rad(angle), self.depths, self.speeds)
+            np.testing.assert_allclose(params[0], slow[0])
+            for j in range(1, 5):
+                np.testing.assert_allclose(params[j][i], slow[j], rtol=1e-9, atol=1e-9)
+
+    def test_ray_trace_many(self):
+        travel_times = np.arange(0.002, 1.0, 0.002)
+        params = RayTracing.get_svp_layer_parameters_many(np.deg2rad(self.angles), self.depths, self.speeds)
+        rays = RayTracing.ray_trace_many(travel_times, self.depths, self.speeds, params)
+        self.assertEqual(rays.shape, (len(self.angles), len(travel_times), 3))
+
+        for i, angle in enumerate(self.angles):
+            slow_params = RayTracing.get_svp_layer_parameters_slow(np.deg2rad(angle), self.depths, self.speeds)
+            slow = RayTracing.ray_trace(travel_times, self.depths, self.speeds, slow_params)
+            np.testing.assert_array_equal(rays[i, :, 0], travel_times)
+            np.testing.assert_allclose(rays[i, :, 1:], slow, atol=1e-6)
+
+    def make_ssp(self, speeds):
+        ssp = Profile()
+        ssp.init_proc(self.depths.size)
+        ssp.proc.depth[:] = self.depths
+        ssp.proc.speed[:] = speeds
+        ssp.proc.flag[:] = Dicts.flags['valid']
+        ssp.meta.utc_time = datetime.utcnow()
+        return ssp
+
+    def test_traced_profile(self):
+        tp = TracedProfile(ssp=self.make_ssp(speeds=1500.0), half_swath=70, depth_resolution=0.5)
+        self.assertEqual(tp.rays.shape, (71, 3, 2001))
+        self.assertAlmostEqual(tp.harmonic_means[0], 1500.0, places=6)
+
+        # straight rays with constant speed
+        valid = tp.rays[0][0] != -1
+        np.testing.assert_allclose(tp.rays[0][0][valid], (tp.rays[0][2][valid] - self.depths[0]) / 1500.0)
+        valid = tp.rays[45][1] != -1
+        np.testing.assert_allclose(tp.rays[45][1][valid], tp.rays[45][2][valid] - self.depths[0], atol=1e-6)
+
+    def test_diff_traced_profiles(self):
+        tp1 = TracedProfile(ssp=self.make_ssp(speeds=1500.0), half_swath=70)
+        tp2 = TracedProfile(ssp=self.make_ssp(speeds=self.speeds), half_swath=70)
+
+        diff = DiffTracedProfiles(old_tp=tp1, new_tp=tp2)
+        diff.calc_diff()
+        self.assertEqual(diff.new_rays.shape[:2], (71, 3))
+        self.assertEqual(diff.new_rays.shape, diff.old_rays.shape)
+
+        # both rays start from the common origin and stop at the common travel time
+        np.testing.assert_array_equal(diff.new_rays[:, :, 0], 0.0)
+        np.testing.assert_array_equal(diff.old_rays[:, :, 0], 0.0)
+        np.testing.assert_allclose(diff.new_ends[:, 0], diff.old_ends[:, 0], rtol=1e-3)
+
+
+def suite():
+    s = unittest.TestSuite()
+    s.addTests(unittest.TestLoader().loadTestsFromTestCase(TestSoundSpeedRayTracing))
+    return s
@@ -0,0 +1,87 @@
+import unittest
+import numpy as np
+
+from hyo2.soundspeed.profile.samples import Samples
+
+
+class TestSoundSpeedSamples(unittest.TestCase):
+
+    def setUp(self):
+        self.samples = Samples()
+        self.samples.num_samples = 4
+        self.samples.init_depth()
+        self.samples.init_speed()
+        self.samples.depth[:] = [1.0, 2.0, 3.0, 4.0]
+        self.samples.speed[:] = 1500.0
+
+    def tearDown(self):
+        pass
+
+    def test_views(self):
+        self.assertIsNone(self.samples.temp)
+        depth = self.samples.depth
+        self.samples.depth = [4.0, 3.0, 2.0, 1.0]
+        np.testing.assert_array_equal(depth, [4.0, 3.0, 2.0, 1.0])
+
+        self.samples.depth = np.arange(6.0)
+        self.assertEqual(self.samples.num_samples, 6)
+        np.testing.assert_array_equal(self.samples.speed, [1500.0] * 4 + [0.0] * 2)
+
+    def test_insert(self):
+        self.samples.insert(1, depth=1.5, speed=1490.0)
+        np.testing.assert_array_equal(self.samples.depth, [1.0, 1.5, 2.0, 3.0, 4.0])
+        np.testing.assert_array_equal(self.samples.speed, [1500.0, 1490.0, 1500.0, 1500.0, 1500.0])
+
+        self.samples.insert([0, 2, 5], depth=[0.5, 1.7, 4.5])
+        np.testing.assert_array_equal(self.samples.depth, [0.5, 1.0, 1.5, 1.7, 2.0, 3.0, 4.0, 4.5])
+        self.assertEqual(self.samples.speed[3], 0.0)
+
+    def test_append(self):
+        capacity = self.samples.capacity
+        self.samples.append(depth=5.0)
+        self.samples.append(depth=[6.0, 7.0], speed=1510.0)
+        np.testing.assert_array_equal(self.samples.depth, [1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0])
+        np.testing.assert_array_equal(self.samples.speed[-3:], [0.0, 1510.0, 1510.0])
+        self.assertEqual(self.samples.capacity, capacity)
+
+        self.samples.append(depth=np.arange(20.0))
+        self.assertEqual(self.samples.num_samples, 27)
+        self.assertEqual(self.samples.capacity, 2 * capacity)
+
+    def test_resize(self):
+        self.samples.resize(2)
+        self.samples.resize(3)
+        np.testing.assert_array_equal(self.samples.depth, [1.0, 2.0, 0.0])
+
+    def test_mask(self):
+        self.samples.init_flag()
+        mask = self.samples.mask(0)
+        self.assertIs(self.samples.mask(0), mask)
+        self.assertFalse(mask.flags.writeable)
+
+        self.samples.flag[1] = 1
+        np.testing.assert_array_equal(self.samples.mask(0), [True, False, True, True])
+        self.assertTrue(mask.all())
+
+        self.samples.append(depth=5.0, flag=1)
+        np.testing.assert_array_equal(self.samples.mask(1), [False, True, False, False, True])
+
+        # only the writes to the samples buffer invalidate the masks
+        mask = self.samples.mask(0)
+        flag = self.samples.flag
+        for derived in [flag.copy(), flag[[0, 2]], flag[mask], flag == 0]:
+            self.assertIsNone(derived.owner)
+            derived[0] = 1
+        self.assertIs(self.samples.mask(0), mask)
+        flag[1:3][1] = 1
+        np.testing.assert_array_equal(self.samples.mask(0), [True, False, False, True, False])
+
+        selected = self.samples.select(self.samples.mask(0))
+        np.testing.assert_array_equal(selected.depth, [1.0, 4.0])
+        self.assertIsNone(selected.temp)
+
+
+def suite():
+    s = unittest.TestSuite()
+    s.addTests(unittest.TestLoader().loadTestsFromTestCase(TestSoundSpeedSamples))
+    return s